@@ -0,0 +1 @@
+"""基准测试脚本（本地服务，无需外网和 API 密钥）"""
@@ -0,0 +1,207 @@
+"""
+端到端压测：在本地替身服务上测量各阶段在不同并发下的延迟和吞吐（无需外网和 API 密钥）
+
+阶段：
+    parse        parse_video（跳过解析缓存）
+    download     download_video
+    upload       upload_video_to_gemini（每次上传内容不同的文件，不命中复用）
+    copywriting  上传 → 文案解析与特点分析 → 流式生成脚本
+
+用法：
+    python -m benchmarks.bench_pipeline --concurrency 1 2 4 8 --ops 8
+    python -m benchmarks.bench_pipeline --stages copywriting --rate-limit-rate 0.1 --unavailable-rate 0.05
+    python -m benchmarks.bench_pipeline --output baseline.json
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from google import genai
+from google.genai import types
+
+from core import DouyinDownloader, pipeline, telemetry
+from core.rate_limiter import RateLimiter
+from benchmarks.local_servers import FakeGeminiServer, FakeParseApiServer, RangeFileServer
+
+STAGES = ('parse', 'download', 'upload', 'copywriting')
+
+
+def make_downloader(work_dir, parse_server, gemini_server, max_concurrency):
+    """创建指向本地替身的下载器，下载目录、缓存和登记表都放在临时目录，不影响项目数据"""
+    downloader = DouyinDownloader(
+        downloads_dir=os.path.join(work_dir, "downloads"),
+        cache_dir=os.path.join(work_dir, "cache")
+    )
+    downloader.api_url = parse_server.url
+    # 不让进程级限速器成为瓶颈，测的是流水线本身
+    downloader.rate_limiter = RateLimiter(requests_per_minute=60000, tokens_per_minute=0, burst=max_concurrency * 2)
+    downloader.gemini_api_key = "benchmark"
+    downloader.gemini_client = genai.Client(
+        api_key="benchmark",
+        http_options=types.HttpOptions(base_url=gemini_server.base_url)
+    )
+    return downloader
+
+
+def make_video(work_dir, payload, tag):
+    """写出一个内容唯一的视频文件（末尾追加标记），避免上传复用和响应缓存命中"""
+    path = os.path.join(work_dir, f"bench_{tag}.mp4")
+    with open(path, 'wb') as f:
+        f.write(payload)
+        f.write(tag.encode('utf-8'))
+    return path
+
+
+def run_stage(stage, downloader, work_dir, payload, tag):
+    """执行一次阶段操作，失败时抛出异常"""
+    if stage == 'parse':
+        result = downloader.parse_video(f"https://v.douyin.com/{tag}/", use_cache=False)
+        if not result['success']:
+            raise RuntimeError(result['error'])
+        return
+
+    if stage == 'download':
+        parsed = downloader.parse_video(f"https://v.douyin.com/{tag}/")
+        if not parsed['success']:
+            raise RuntimeError(parsed['error'])
+        result = downloader.download_video(parsed['video_url'], parsed['title'], video_id=f"bench:{tag}")
+        if not result['success']:
+            raise RuntimeError(result['error'])
+        return
+
+    video_path = make_video(work_dir, payload, tag)
+    try:
+        upload_result = downloader.upload_video_to_gemini(video_path)
+        if not upload_result['success']:
+            raise RuntimeError(upload_result['error'])
+        if stage == 'upload':
+            return
+        results = pipeline.analyze_video(downloader, upload_result['file_uri'])
+        script = "".join(pipeline.generate_script_stream(
+            downloader, upload_result['file_uri'], results['transcript'], results['analysis'],
+            pipeline.DEFAULT_ACCOUNT_POSITIONING
+        ))
+        if not script:
+            raise RuntimeError("脚本为空")
+    finally:
+        os.remove(video_path)
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def run_level(stage, downloader, work_dir, payload, concurrency, ops, run_id):
+    """以指定并发执行 ops 次操作，返回延迟分布与吞吐"""
+    latencies = []
+    errors = []
+
+    def one(index):
+        start_time = time.perf_counter()
+        try:
+            run_stage(stage, downloader, work_dir, payload, f"{run_id}_{stage}_{concurrency}_{index}")
+            latencies.append(time.perf_counter() - start_time)
+        except Exception as e:
+            errors.append(str(e))
+
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix=f"bench-{stage}") as executor:
+        list(executor.map(one, range(ops)))
+    wall = time.perf_counter() - wall_start
+    return {
+        'stage': stage,
+        'concurrency': concurrency,
+        'ops': ops,
+        'ok': len(latencies),
+        'errors': len(errors),
+        'first_error': errors[0] if errors else None,
+        'p50': statistics.median(latencies) if latencies else 0.0,
+        'p95': percentile(latencies, 95),
+        'max': max(latencies) if latencies else 0.0,
+        'wall_seconds': wall,
+        'throughput': len(latencies) / wall if wall else 0.0
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地替身服务上的端到端压测")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES), help="要测试的阶段")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8], help="并发级别")
+    parser.add_argument("--ops", type=int, default=8, help="每个并发级别执行的操作数")
+    parser.add_argument("--video-mb", type=float, default=4, help="测试视频大小（MB）")
+    parser.add_argument("--cdn-rate-mb", type=float, default=0, help="CDN 单连接限速（MB/秒，0 为不限速）")
+    parser.add_argument("--latency", type=float, default=0.05, help="每个请求注入的延迟（秒）")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="返回 500 的概率")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="返回 429 的概率")
+    parser.add_argument("--unavailable-rate", type=float, default=0.0, help="返回 503 的概率")
+    parser.add_argument("--retry-after", type=int, default=1, help="429 / 503 建议的等待秒数")
+    parser.add_argument("--processing-seconds", type=float, default=0.5, help="Gemini 文件处理耗时")
+    parser.add_argument("--first-token-latency", type=float, default=0.3, help="模型首个片段的延迟")
+    parser.add_argument("--seed", type=int, default=1, help="故障注入随机种子")
+    parser.add_argument("--output", help="把结果写入 JSON 文件，便于与基线比较")
+    args = parser.parse_args()
+
+    faults = {
+        'latency': args.latency,
+        'failure_rate': args.failure_rate,
+        'rate_limit_rate': args.rate_limit_rate,
+        'unavailable_rate': args.unavailable_rate,
+        'retry_after': args.retry_after,
+        'seed': args.seed
+    }
+    payload = os.urandom(int(args.video_mb * 1024 * 1024))
+    cdn = RangeFileServer(payload, bytes_per_second=int(args.cdn_rate_mb * 1024 * 1024), **faults).start()
+    parse_api = FakeParseApiServer(cdn.base_url, **faults).start()
+    gemini = FakeGeminiServer(
+        processing_seconds=args.processing_seconds,
+        first_token_latency=args.first_token_latency,
+        **faults
+    ).start()
+    work_dir = tempfile.mkdtemp(prefix="bench-pipeline-")
+    run_id = str(int(time.time()))
+    results = []
+    # 运行轨迹同样写到临时目录
+    previous_trace_dir = telemetry.set_trace_dir(os.path.join(work_dir, "traces"))
+    try:
+        downloader = make_downloader(work_dir, parse_api, gemini, max(args.concurrency))
+        print(f"📦 视频 {args.video_mb:.1f} MB，注入延迟 {args.latency * 1000:.0f}ms，"
+              f"500/429/503 概率 {args.failure_rate:.0%}/{args.rate_limit_rate:.0%}/{args.unavailable_rate:.0%}")
+        print(f"{'阶段':<12} {'并发':>4} {'成功':>5} {'失败':>5} {'p50(秒)':>9} {'p95(秒)':>9} {'最大(秒)':>9} {'吞吐(个/秒)':>11}")
+        for stage in args.stages:
+            for concurrency in args.concurrency:
+                result = run_level(stage, downloader, work_dir, payload, concurrency, args.ops, run_id)
+                results.append(result)
+                print(f"{stage:<12} {concurrency:>4} {result['ok']:>5} {result['errors']:>5} "
+                      f"{result['p50']:>9.3f} {result['p95']:>9.3f} {result['max']:>9.3f} {result['throughput']:>11.2f}")
+                if result['first_error']:
+                    print(f"   ⚠️ {result['first_error']}")
+
+        stats = downloader.connection_stats()
+        print(f"🔁 HTTP 请求 {stats['requests']} 次，新建连接 {stats['new_connections']} 次")
+        for name, server in (('CDN', cdn), ('解析接口', parse_api), ('Gemini', gemini)):
+            if server.faults_injected:
+                print(f"💥 {name} 注入故障: {server.faults_injected}")
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump({'args': vars(args), 'results': results}, f, ensure_ascii=False, indent=2)
+            print(f"💾 结果已写入 {args.output}")
+    finally:
+        for server in (cdn, parse_api, gemini):
+            server.stop()
+        telemetry.set_trace_dir(previous_trace_dir)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
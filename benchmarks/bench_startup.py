@@ -0,0 +1,114 @@
+"""
+冷启动耗时：在新的解释器中导入目标模块，用 -X importtime 统计每个模块的导入耗时
+
+每次运行都是独立子进程（与 launch.py 的 watchfiles 重启一样没有任何缓存的模块），
+结果取多次运行的中位数。main 的耗时包含构建界面（create_interface），但不包含 launch。
+
+用法：
+    python -m benchmarks.bench_startup
+    python -m benchmarks.bench_startup --targets core core.cli --runs 5 --top 30
+    python -m benchmarks.bench_startup --output startup.json
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# import time:     self [us] | cumulative | imported package
+_IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+_PROBE = (
+    "import sys, time\n"
+    "start = time.perf_counter()\n"
+    "import {target}\n"
+    "sys.stdout.write(repr(time.perf_counter() - start))\n"
+)
+
+
+def parse_importtime(stderr):
+    """解析 -X importtime 的输出，返回 {模块: (自身微秒, 累计微秒, 嵌套层级)}"""
+    modules = {}
+    for line in stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            modules[name] = (int(self_us), int(cumulative_us), len(indent) // 2)
+    return modules
+
+
+def measure(target, python=sys.executable):
+    """在子进程中导入一次 target，返回 (总耗时秒数, 模块耗时)"""
+    result = subprocess.run(
+        [python, "-X", "importtime", "-c", _PROBE.format(target=target)],
+        cwd=ROOT_DIR, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        tail = result.stderr.strip().splitlines()[-1:] or ["未知错误"]
+        raise RuntimeError(f"导入 {target} 失败: {tail[0]}")
+    return float(result.stdout.strip()), parse_importtime(result.stderr)
+
+
+def summarize(runs):
+    """多次运行取中位数：总耗时、每个模块的自身/累计耗时、按顶层包汇总的自身耗时"""
+    totals = [total for total, _ in runs]
+    names = set().union(*(modules.keys() for _, modules in runs))
+    modules = {}
+    for name in names:
+        samples = [modules_[name] for _, modules_ in runs if name in modules_]
+        modules[name] = {
+            'self_ms': statistics.median(sample[0] for sample in samples) / 1000,
+            'cumulative_ms': statistics.median(sample[1] for sample in samples) / 1000,
+            'depth': samples[0][2]
+        }
+    packages = {}
+    for name, stats in modules.items():
+        package = name.split('.', 1)[0]
+        packages[package] = packages.get(package, 0.0) + stats['self_ms']
+    return {
+        'total_seconds': statistics.median(totals),
+        'min_seconds': min(totals),
+        'modules': modules,
+        'packages': dict(sorted(packages.items(), key=lambda item: item[1], reverse=True))
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="冷启动导入耗时（-X importtime）")
+    parser.add_argument("--targets", nargs="+", default=["core", "core.cli", "ui", "main"],
+                        help="要导入的模块（main 会构建界面）")
+    parser.add_argument("--runs", type=int, default=3, help="每个模块的运行次数（取中位数）")
+    parser.add_argument("--top", type=int, default=15, help="显示累计耗时最高的模块数")
+    parser.add_argument("--output", help="把结果写入 JSON 文件，便于与基线比较")
+    args = parser.parse_args()
+
+    report = {}
+    for target in args.targets:
+        try:
+            runs = [measure(target) for _ in range(args.runs)]
+        except RuntimeError as e:
+            print(f"❌ {e}")
+            continue
+        summary = summarize(runs)
+        report[target] = summary
+        print(f"\n🚀 import {target}: {summary['total_seconds'] * 1000:.0f}ms"
+              f"（中位数，最快 {summary['min_seconds'] * 1000:.0f}ms，共 {args.runs} 次）")
+        print(f"   {'累计(ms)':>9} {'自身(ms)':>9}  模块")
+        slowest = sorted(summary['modules'].items(), key=lambda item: item[1]['cumulative_ms'], reverse=True)
+        for name, stats in slowest[:args.top]:
+            print(f"   {stats['cumulative_ms']:>9.1f} {stats['self_ms']:>9.1f}  {'  ' * stats['depth']}{name}")
+        heaviest = list(summary['packages'].items())[:8]
+        print("   按顶层包: " + " / ".join(f"{package} {ms:.0f}ms" for package, ms in heaviest))
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'args': vars(args), 'results': report}, f, ensure_ascii=False, indent=2)
+        print(f"💾 结果已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,425 @@
+"""基准测试用的本地 HTTP 服务（不依赖外网）：解析接口、视频 CDN、Gemini 文件/模型接口的替身
+
+所有服务都支持注入延迟、失败率以及 429 / 503 响应，用来复现限流和服务过载时的表现。
+"""
+import http.server
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from urllib.parse import parse_qs, urlparse
+
+
+class _FaultInjectingHandler(http.server.BaseHTTPRequestHandler):
+    """按服务端配置注入延迟和错误响应的请求处理基类"""
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _inject_fault(self):
+        """先按配置延迟，再按概率返回 429 / 503 / 500；已返回错误时为 True"""
+        server = self.server
+        # 丢弃请求体，保持 keep-alive 连接可复用
+        length = int(self.headers.get('Content-Length') or 0)
+        self._body = self.rfile.read(length) if length else b''
+        if server.latency:
+            time.sleep(server.latency)
+        status = server.pick_fault()
+        if status is None:
+            return False
+        with server.stats_lock:
+            server.faults_injected[status] = server.faults_injected.get(status, 0) + 1
+        self._send_fault(status)
+        return True
+
+    def _send_fault(self, status):
+        server = self.server
+        headers = {'Retry-After': str(server.retry_after)} if status in (429, 503) else {}
+        self._send_json(status, {'code': status, 'msg': f'injected {status}'}, headers)
+
+
+class _FaultInjectingServer(http.server.ThreadingHTTPServer):
+    """
+    带故障注入的本地服务基类
+
+    Args:
+        latency: 每个请求的固定延迟（秒）
+        failure_rate: 返回 500 的概率
+        rate_limit_rate: 返回 429（带 Retry-After）的概率
+        unavailable_rate: 返回 503 的概率
+        retry_after: 429 / 503 响应建议的等待秒数
+        seed: 随机种子，保证多次运行注入的故障序列一致
+    """
+    daemon_threads = True
+
+    def __init__(self, handler_class, host='127.0.0.1', port=0, latency=0.0, failure_rate=0.0,
+                 rate_limit_rate=0.0, unavailable_rate=0.0, retry_after=1, seed=None):
+        super().__init__((host, port), handler_class)
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.unavailable_rate = unavailable_rate
+        self.retry_after = retry_after
+        self.stats_lock = threading.Lock()
+        self.requests_served = 0
+        self.faults_injected = {}
+        self._random = random.Random(seed)
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+    def pick_fault(self):
+        """按配置的概率挑选要注入的错误状态码，不注入时返回 None"""
+        with self.stats_lock:
+            roll = self._random.random()
+        for status, rate in ((429, self.rate_limit_rate), (503, self.unavailable_rate), (500, self.failure_rate)):
+            if roll < rate:
+                return status
+            roll -= rate
+        return None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class _RangeFileHandler(_FaultInjectingHandler):
+    """支持 Range 的视频文件服务，可限制每个连接的带宽来模拟被限速的 CDN"""
+
+    def do_HEAD(self):
+        self._serve(send_body=False)
+
+    def do_GET(self):
+        self._serve(send_body=True)
+
+    def _serve(self, send_body):
+        if self._inject_fault():
+            return
+        server = self.server
+        data = server.payload
+        total = len(data)
+        start, end = 0, total - 1
+
+        range_header = self.headers.get('Range')
+        use_range = server.support_range and range_header
+        if use_range:
+            match = re.match(r'bytes=(\d+)-(\d*)$', range_header.strip())
+            if not match or int(match.group(1)) >= total:
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{total}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            start = int(match.group(1))
+            if match.group(2):
+                end = min(int(match.group(2)), total - 1)
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{total}')
+        else:
+            self.send_response(200)
+
+        if server.support_range:
+            self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('ETag', server.etag)
+        self.send_header('Content-Type', 'video/mp4')
+        self.send_header('Content-Length', str(end - start + 1))
+        self.end_headers()
+        if not send_body:
+            return
+
+        with server.stats_lock:
+            server.requests_served += 1
+        # 按固定节拍发送数据，限制单连接速率
+        chunk_size = 64 * 1024
+        interval = chunk_size / server.bytes_per_second if server.bytes_per_second else 0
+        position = start
+        try:
+            while position <= end:
+                chunk = data[position:min(position + chunk_size, end + 1)]
+                self.wfile.write(chunk)
+                position += len(chunk)
+                if interval:
+                    time.sleep(interval)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+class RangeFileServer(_FaultInjectingServer):
+    """
+    本地视频 CDN 替身（任意路径都返回同一份内容）
+
+    Args:
+        payload: 文件内容
+        bytes_per_second: 每个连接的限速（0 表示不限速）
+        support_range: 是否支持 Range 请求
+        faults: 传给 _FaultInjectingServer 的延迟 / 故障注入参数
+    """
+
+    def __init__(self, payload, bytes_per_second=0, support_range=True, host='127.0.0.1', port=0, **faults):
+        super().__init__(_RangeFileHandler, host, port, **faults)
+        self.payload = payload
+        self.bytes_per_second = bytes_per_second
+        self.support_range = support_range
+        self.etag = '"bench-%d"' % len(payload)
+
+    @property
+    def url(self):
+        return f"{self.base_url}/video.mp4"
+
+
+class _ParseApiHandler(_FaultInjectingHandler):
+    """模拟解析接口：GET /api/douyin?url=... 返回与线上接口相同结构的 JSON"""
+
+    def do_GET(self):
+        if self._inject_fault():
+            return
+        server = self.server
+        with server.stats_lock:
+            server.requests_served += 1
+        share_url = parse_qs(urlparse(self.path).query).get('url', [''])[0]
+        # 同一链接始终解析出同一个视频 ID 和播放地址
+        video_id = str(int(uuid.uuid5(uuid.NAMESPACE_URL, share_url).hex[:12], 16))
+        self._send_json(200, {
+            'code': 200,
+            'msg': '解析成功',
+            'data': {
+                'title': f'基准测试视频 {video_id[-6:]}',
+                'author': '本地替身',
+                'aweme_id': video_id,
+                'url': f"{server.video_base_url}/{video_id}.mp4",
+                'cover': '',
+                'duration': 15
+            }
+        })
+
+
+class FakeParseApiServer(_FaultInjectingServer):
+    """
+    解析接口替身，返回的播放地址指向 video_base_url（通常是 RangeFileServer）
+
+    使用时把 DouyinDownloader.api_url 指向 .url
+    """
+
+    def __init__(self, video_base_url, host='127.0.0.1', port=0, **faults):
+        super().__init__(_ParseApiHandler, host, port, **faults)
+        self.video_base_url = video_base_url.rstrip('/')
+
+    @property
+    def url(self):
+        return f"{self.base_url}/api/douyin"
+
+
+def _rfc3339(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat().replace('+00:00', 'Z')
+
+
+class _FakeGeminiHandler(_FaultInjectingHandler):
+    """实现 google-genai SDK 用到的 Files（可续传上传 / 查询 / 删除）和 generateContent / 流式接口"""
+
+    def _send_fault(self, status):
+        server = self.server
+        reason = {429: 'RESOURCE_EXHAUSTED', 503: 'UNAVAILABLE', 500: 'INTERNAL'}[status]
+        error = {'code': status, 'message': f'injected {status}', 'status': reason}
+        headers = {}
+        if status == 429:
+            error['details'] = [{
+                '@type': 'type.googleapis.com/google.rpc.RetryInfo',
+                'retryDelay': f'{server.retry_after}s'
+            }]
+        if status in (429, 503):
+            headers['Retry-After'] = str(server.retry_after)
+        self._send_json(status, {'error': error}, headers)
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        # 上传分片不注入故障
+        if path.startswith('/upload-session/'):
+            self._body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+            return self._upload_chunk(path.rsplit('/', 1)[-1])
+        match = re.match(r'^/v1beta/models/([^:]+):(generateContent|streamGenerateContent)$', path)
+        if self._inject_file_fault() if match is None else self._inject_fault():
+            return
+        with self.server.stats_lock:
+            self.server.requests_served += 1
+        if match:
+            return self._generate(stream=match.group(2) == 'streamGenerateContent')
+        if path.endswith('/files') and path.startswith('/upload/'):
+            return self._start_upload()
+        self._send_json(404, {'error': {'code': 404, 'message': f'unknown path {path}', 'status': 'NOT_FOUND'}})
+
+    def _inject_file_fault(self):
+        """文件接口默认只注入延迟，inject_file_faults 为真时也注入错误"""
+        if self.server.inject_file_faults:
+            return self._inject_fault()
+        length = int(self.headers.get('Content-Length') or 0)
+        self._body = self.rfile.read(length) if length else b''
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        return False
+
+    def do_GET(self):
+        if self._inject_file_fault():
+            return
+        path = urlparse(self.path).path
+        match = re.match(r'^/v1beta/(files/[^/]+)$', path)
+        file_info = self.server.file_info(match.group(1)) if match else None
+        if file_info is None:
+            return self._send_json(404, {'error': {'code': 404, 'message': 'File not found', 'status': 'NOT_FOUND'}})
+        self._send_json(200, file_info)
+
+    def do_DELETE(self):
+        if self._inject_file_fault():
+            return
+        name = urlparse(self.path).path[len('/v1beta/'):]
+        with self.server.stats_lock:
+            self.server.files.pop(name, None)
+        self._send_json(200, {})
+
+    def _start_upload(self):
+        server = self.server
+        request = json.loads(self._body or b'{}').get('file', {})
+        session_id = uuid.uuid4().hex
+        with server.stats_lock:
+            server.upload_sessions[session_id] = {
+                'size': int(self.headers.get('X-Goog-Upload-Header-Content-Length') or 0),
+                'mime_type': self.headers.get('X-Goog-Upload-Header-Content-Type') or 'video/mp4',
+                'display_name': request.get('displayName'),
+                'received': 0
+            }
+        self.send_response(200)
+        self.send_header('X-Goog-Upload-URL', f"{server.base_url}/upload-session/{session_id}")
+        self.send_header('X-Goog-Upload-Status', 'active')
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def _upload_chunk(self, session_id):
+        server = self.server
+        command = self.headers.get('X-Goog-Upload-Command', '')
+        with server.stats_lock:
+            session = server.upload_sessions.get(session_id)
+            if session is None:
+                return self._send_json(404, {'error': {'code': 404, 'message': 'upload session not found'}})
+            session['received'] += len(self._body)
+            server.bytes_uploaded += len(self._body)
+            if 'finalize' not in command:
+                finished = None
+            else:
+                server.upload_sessions.pop(session_id, None)
+                name = f"files/{uuid.uuid4().hex[:12]}"
+                now = time.time()
+                server.files[name] = {
+                    'name': name,
+                    'displayName': session['display_name'],
+                    'mimeType': session['mime_type'],
+                    'sizeBytes': str(session['received']),
+                    'created': now
+                }
+                finished = name
+        if finished is None:
+            self.send_response(200)
+            self.send_header('X-Goog-Upload-Status', 'active')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self._send_json(200, {'file': server.file_info(finished)}, {'X-Goog-Upload-Status': 'final'})
+
+    def _generate(self, stream):
+        server = self.server
+        request = json.loads(self._body or b'{}')
+        generation_config = request.get('generationConfig') or {}
+        if generation_config.get('responseMimeType') == 'application/json':
+            text = json.dumps({'transcript': server.response_text, 'analysis': server.response_text}, ensure_ascii=False)
+        else:
+            text = server.response_text
+        usage = {'promptTokenCount': server.prompt_tokens, 'candidatesTokenCount': len(text),
+                 'totalTokenCount': server.prompt_tokens + len(text)}
+        time.sleep(server.first_token_latency)
+        if not stream:
+            return self._send_json(200, {
+                'candidates': [{'content': {'role': 'model', 'parts': [{'text': text}]}, 'finishReason': 'STOP'}],
+                'usageMetadata': usage
+            })
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+        pieces = [text[i:i + server.stream_chunk_chars] for i in range(0, len(text), server.stream_chunk_chars)]
+        for index, piece in enumerate(pieces):
+            chunk = {'candidates': [{'content': {'role': 'model', 'parts': [{'text': piece}]}}]}
+            if index == len(pieces) - 1:
+                chunk['candidates'][0]['finishReason'] = 'STOP'
+                chunk['usageMetadata'] = usage
+            self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\r\n\r\n".encode('utf-8'))
+            self.wfile.flush()
+            if index < len(pieces) - 1:
+                time.sleep(server.stream_chunk_interval)
+
+
+class FakeGeminiServer(_FaultInjectingServer):
+    """
+    Gemini API 替身，配合 genai.Client(http_options=types.HttpOptions(base_url=server.base_url)) 使用
+
+    Args:
+        processing_seconds: 上传后文件保持 PROCESSING 状态的时长
+        first_token_latency: 模型调用返回首个片段前的延迟
+        response_text: 模型返回的文本
+        stream_chunk_chars / stream_chunk_interval: 流式输出每个片段的字符数和间隔
+        prompt_tokens: usageMetadata 中报告的输入 token 数
+        inject_file_faults: 文件接口是否也注入错误（默认只对模型调用注入，SDK 的上传没有重试）
+        faults: 传给 _FaultInjectingServer 的延迟 / 故障注入参数
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, processing_seconds=0.5, first_token_latency=0.3,
+                 response_text="（本地替身生成的示例文案）" * 20, stream_chunk_chars=40,
+                 stream_chunk_interval=0.02, prompt_tokens=1000, inject_file_faults=False, **faults):
+        super().__init__(_FakeGeminiHandler, host, port, **faults)
+        self.processing_seconds = processing_seconds
+        self.first_token_latency = first_token_latency
+        self.response_text = response_text
+        self.stream_chunk_chars = max(1, stream_chunk_chars)
+        self.stream_chunk_interval = stream_chunk_interval
+        self.prompt_tokens = prompt_tokens
+        self.inject_file_faults = inject_file_faults
+        self.files = {}
+        self.upload_sessions = {}
+        self.bytes_uploaded = 0
+
+    def file_info(self, name):
+        """返回文件的 JSON 表示，PROCESSING 持续 processing_seconds 后变为 ACTIVE"""
+        with self.stats_lock:
+            entry = self.files.get(name)
+            if entry is None:
+                return None
+            entry = dict(entry)
+        created = entry.pop('created')
+        state = 'ACTIVE' if time.time() - created >= self.processing_seconds else 'PROCESSING'
+        return dict(
+            entry,
+            uri=f"{self.base_url}/v1beta/{name}",
+            state=state,
+            createTime=_rfc3339(created),
+            expirationTime=_rfc3339(created + 48 * 3600)
+        )
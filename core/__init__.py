@@ -1,6 +1,8 @@
 """核心业务逻辑模块"""
 from .douyin_core import DouyinDownloader
 from .config_manager import config_manager
+from .jobs import JobManager
+from .service import PipelineService
 
-__all__ = ['DouyinDownloader', 'config_manager']
+__all__ = ['DouyinDownloader', 'config_manager', 'JobManager', 'PipelineService']
 
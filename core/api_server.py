@@ -0,0 +1,104 @@
+"""轻量 JSON HTTP 接口（标准库 http.server），把 PipelineService 暴露给定时任务和其他服务
+
+POST /api/download   {"text": "...", "retry_failed": false}           -> {"items": [...]}
+POST /api/analyze    {"video_path": "..."}                            -> {"file_uri", "transcript", "analysis", ...}
+POST /api/generate   {"video_path" | "file_uri", "account_positioning", "wait": false, ...}
+                                                                      -> {"job_id"}，wait 为 true 时返回作业结果
+GET  /api/jobs                                                        -> {"jobs": [...]}
+GET  /api/jobs/<job_id>                                               -> 作业快照
+GET  /metrics                                                         -> Prometheus 文本格式的阶段指标
+"""
+import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from . import telemetry
+
+# 只向外暴露这些作业字段（不含内部版本号）
+JOB_FIELDS = ('id', 'status', 'stage', 'video_path', 'file_uri', 'transcript', 'analysis', 'script', 'error',
+              'log', 'created_at', 'updated_at')
+
+
+def job_to_json(job):
+    return {field: job.get(field) for field in JOB_FIELDS}
+
+
+def _make_handler(service):
+    class PipelineRequestHandler(BaseHTTPRequestHandler):
+        server_version = "VideoRemixAPI/1.0"
+
+        def _send_json(self, status, payload):
+            body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _read_json(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            if not length:
+                return {}
+            payload = json.loads(self.rfile.read(length).decode('utf-8'))
+            if not isinstance(payload, dict):
+                raise ValueError("请求体必须是 JSON 对象")
+            return payload
+
+        def do_GET(self):
+            path = self.path.split('?', 1)[0].rstrip('/')
+            if path == "/metrics":
+                body = telemetry.metrics.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            elif path == "/api/jobs":
+                self._send_json(200, {'jobs': [job_to_json(job) for job in service.recent_jobs()]})
+            elif path.startswith("/api/jobs/"):
+                job = service.job(path[len("/api/jobs/"):])
+                if job is None:
+                    self._send_json(404, {'error': '作业不存在'})
+                else:
+                    self._send_json(200, job_to_json(job))
+            else:
+                self._send_json(404, {'error': f'未知接口: {path}'})
+
+        def do_POST(self):
+            path = self.path.split('?', 1)[0].rstrip('/')
+            try:
+                payload = self._read_json()
+                if path == "/api/download":
+                    items = service.download(payload.get('text', ''), payload.get('max_workers'),
+                                             retry_failed=bool(payload.get('retry_failed')))
+                    self._send_json(200, {'items': items})
+                elif path == "/api/analyze":
+                    self._send_json(200, service.analyze(payload['video_path']))
+                elif path == "/api/generate":
+                    job_id = service.generate(
+                        video_path=payload.get('video_path'),
+                        account_positioning=payload.get('account_positioning'),
+                        file_uri=payload.get('file_uri'),
+                        transcript=payload.get('transcript'),
+                        analysis=payload.get('analysis'),
+                        force_regenerate=bool(payload.get('force_regenerate'))
+                    )
+                    if payload.get('wait'):
+                        self._send_json(200, job_to_json(service.wait(job_id)))
+                    else:
+                        self._send_json(202, {'job_id': job_id})
+                else:
+                    self._send_json(404, {'error': f'未知接口: {path}'})
+            except (KeyError, ValueError) as e:
+                self._send_json(400, {'error': f'请求参数错误: {str(e)}'})
+            except Exception as e:
+                self._send_json(500, {'error': str(e)})
+
+        def log_message(self, format, *args):
+            print(f"🌐 [API] {self.address_string()} {format % args}")
+
+    return PipelineRequestHandler
+
+
+def create_server(service, host="127.0.0.1", port=8765):
+    """创建 HTTP 服务（调用方负责 serve_forever / shutdown）"""
+    return ThreadingHTTPServer((host, port), _make_handler(service))
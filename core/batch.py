@@ -0,0 +1,109 @@
+"""文件夹批量生成：为目录（或通配符）下的每个视频生成二创文案，结果保存到 data 目录
+
+用法：python -m core.batch downloads/ --workers 3
+"""
+import argparse
+import glob
+import os
+import time
+
+from . import pipeline
+
+VIDEO_EXTENSIONS = ('.mp4', '.mov', '.m4v', '.webm', '.mkv', '.avi')
+
+
+def find_videos(source):
+    """目录时列出其中的视频文件，否则按通配符匹配（支持 **）"""
+    if os.path.isdir(source):
+        paths = [os.path.join(source, name) for name in os.listdir(source)]
+    else:
+        paths = glob.glob(source, recursive=True)
+    return sorted(
+        path for path in paths
+        if os.path.isfile(path) and path.lower().endswith(VIDEO_EXTENSIONS)
+    )
+
+
+def batch_generate(job_manager, source, account_positioning, skip_existing=True, data_dir=pipeline.DATA_DIR):
+    """
+    批量生成文案：所有视频一次性提交到作业队列，并发数由 job_manager 的线程池限制
+
+    Args:
+        job_manager: JobManager
+        source: 目录或通配符
+        account_positioning: 账号定位
+        skip_existing: data 目录已有该视频的文案时跳过
+
+    Yields:
+        每个视频的结果 dict：video_path、status（done / failed / skipped）、filepath、error、elapsed
+    """
+    submitted = []
+    for video_path in find_videos(source):
+        existing = pipeline.find_saved_copywriting(video_path, data_dir) if skip_existing else None
+        if existing:
+            yield {'video_path': video_path, 'status': 'skipped', 'filepath': existing, 'elapsed': 0.0}
+            continue
+        submitted.append((video_path, job_manager.submit(video_path, account_positioning)))
+
+    # 作业在后台并发执行，这里按提交顺序等待结果
+    for video_path, job_id in submitted:
+        job = None
+        for job in job_manager.subscribe(job_id):
+            pass
+        result = {
+            'video_path': video_path,
+            'status': job['status'] if job else 'failed',
+            'filepath': None,
+            'error': job.get('error') if job else '作业不存在',
+            'elapsed': (job['updated_at'] - job['created_at']) if job else 0.0
+        }
+        if result['status'] == 'done':
+            try:
+                result['filepath'] = pipeline.save_copywriting(video_path, job['script'], data_dir)
+            except Exception as e:
+                result.update(status='failed', error=f"保存失败: {str(e)}")
+        yield result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="为目录中的每个视频批量生成二创文案")
+    parser.add_argument("source", help="视频目录或通配符，例如 downloads/ 或 'downloads/*.mp4'")
+    parser.add_argument("--workers", type=int, default=None, help="同时处理的视频数（默认取配置 job_workers）")
+    parser.add_argument("--positioning-file", help="账号定位文本文件（默认使用内置账号定位）")
+    parser.add_argument("--force", action="store_true", help="已有文案的视频也重新生成")
+    args = parser.parse_args(argv)
+
+    from .douyin_core import DouyinDownloader
+    from .gemini_clients import configured_api_keys
+    from .jobs import JobManager
+
+    if not configured_api_keys():
+        parser.error("请先在配置页面输入Gemini API密钥")
+    account_positioning = pipeline.DEFAULT_ACCOUNT_POSITIONING
+    if args.positioning_file:
+        with open(args.positioning_file, 'r', encoding='utf-8') as f:
+            account_positioning = f.read()
+
+    job_manager = JobManager(DouyinDownloader(), max_workers=args.workers)
+    start_time = time.time()
+    counts = {'done': 0, 'failed': 0, 'skipped': 0}
+    for result in batch_generate(job_manager, args.source, account_positioning, skip_existing=not args.force):
+        counts[result['status']] = counts.get(result['status'], 0) + 1
+        name = os.path.basename(result['video_path'])
+        if result['status'] == 'done':
+            print(f"✅ {name} → {result['filepath']} ({result['elapsed']:.1f}秒)")
+        elif result['status'] == 'skipped':
+            print(f"⏭️ {name} 已有文案: {result['filepath']}")
+        else:
+            print(f"❌ {name}: {result['error']}")
+
+    elapsed = time.time() - start_time
+    processed = counts['done'] + counts['failed']
+    print(f"🏁 批量生成完成：成功 {counts['done']}，失败 {counts['failed']}，跳过 {counts['skipped']}")
+    print(f"📊 总耗时 {elapsed:.1f}秒，并发 {job_manager.max_workers}，"
+          f"吞吐 {processed / elapsed * 60 if elapsed else 0:.1f} 个/分钟")
+    return 0 if counts['failed'] == 0 else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,103 @@
+"""命令行入口：不启动界面直接运行流水线
+
+python -m core.cli download "<分享文本或链接>"
+python -m core.cli analyze downloads/xxx.mp4
+python -m core.cli generate downloads/xxx.mp4 [--positioning-file 定位.txt] [--save]
+python -m core.cli batch downloads/ --workers 3
+python -m core.cli serve --port 8765
+"""
+import argparse
+import json
+import sys
+
+
+def _print_json(payload):
+    print(json.dumps(payload, ensure_ascii=False, indent=2))
+
+
+def _read_positioning(path):
+    if not path:
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m core.cli", description="视频下载与二创文案流水线")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    download_parser = subparsers.add_parser("download", help="解析并下载文本中的所有抖音链接")
+    download_parser.add_argument("text", help="抖音链接或包含链接的分享文本")
+    download_parser.add_argument("--workers", type=int, default=None, help="并发数（默认取配置 batch_max_workers）")
+    download_parser.add_argument("--retry-failed", action="store_true", help="忽略解析缓存中的失败结果，重新解析")
+
+    analyze_parser = subparsers.add_parser("analyze", help="上传视频并解析文案、分析特点")
+    analyze_parser.add_argument("video_path")
+
+    generate_parser = subparsers.add_parser("generate", help="为视频生成二创文案")
+    generate_parser.add_argument("video_path")
+    generate_parser.add_argument("--positioning-file", help="账号定位文本文件（默认使用内置账号定位）")
+    generate_parser.add_argument("--save", action="store_true", help="生成后保存到 data 目录")
+
+    subparsers.add_parser("batch", help="为目录中的每个视频批量生成文案（参数同 python -m core.batch）", add_help=False)
+
+    serve_parser = subparsers.add_parser("serve", help="启动 JSON HTTP 接口")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8765)
+
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] == "batch":
+        from .batch import main as batch_main
+        return batch_main(argv[1:])
+    args = parser.parse_args(argv)
+
+    from .service import PipelineService
+    from . import pipeline
+
+    service = PipelineService()
+    try:
+        if args.command == "download":
+            items = service.download(args.text, args.workers, retry_failed=args.retry_failed)
+            _print_json(items)
+            return 0 if all(item['success'] for item in items) else 1
+
+        if args.command == "analyze":
+            _print_json(service.analyze(args.video_path))
+            return 0
+
+        if args.command == "generate":
+            job_id = service.generate(args.video_path, _read_positioning(args.positioning_file))
+            printed = 0
+            job = None
+            for job in service.subscribe(job_id):
+                for entry in job['log'][printed:]:
+                    print(entry['message'], file=sys.stderr)
+                printed = len(job['log'])
+            if not job or job['status'] != 'done':
+                return 1
+            print(job['script'])
+            if args.save:
+                filepath = pipeline.save_copywriting(args.video_path, job['script'])
+                print(f"💾 已保存: {filepath}", file=sys.stderr)
+            return 0
+
+        if args.command == "serve":
+            from .api_server import create_server
+            service.start()
+            server = create_server(service, args.host, args.port)
+            print(f"🌐 HTTP 接口已启动: http://{args.host}:{args.port}/api")
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                server.server_close()
+            return 0
+    except (ValueError, RuntimeError, OSError) as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,51 +1,183 @@
+import atexit
 import json
 import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows：只有进程内的锁
+    fcntl = None
+
+# 待写入的删除标记
+_REMOVED = object()
 
 class ConfigManager:
-    def __init__(self, config_file=None):
+    """
+    config.json 的读写（线程安全，多进程共享同一个配置文件）
+
+    - 写入：set / remove 立即修改内存中的配置，短暂延迟后合并写盘；写盘前重新读取文件并叠加本进程的修改，
+      通过临时文件 + os.replace 原子替换，不会留下写了一半的文件
+    - 读取：get 只读内存；距上次检查超过 reload_interval 秒时 stat 一次文件，修改时间或大小变化才重新加载
+
+    Args:
+        config_file: 配置文件路径，默认项目根目录下的 config.json
+        write_delay: 合并写盘的延迟（秒），为 0 时每次修改同步写盘
+        reload_interval: 检查文件是否被其他进程修改的最短间隔（秒）
+    """
+
+    def __init__(self, config_file=None, write_delay=0.2, reload_interval=1.0):
         if config_file is None:
             # 默认配置文件路径：项目根目录
             base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
             config_file = os.path.join(base_dir, "config.json")
         self.config_file = config_file
+        self.write_delay = write_delay
+        self.reload_interval = reload_interval
+        self._lock = threading.RLock()
+        # 尚未写盘的修改：key -> 新值（或 _REMOVED）
+        self._pending = {}
+        self._timer = None
+        self._signature = None
+        self._checked_at = 0.0
         self.config = self.load_config()
-    
+        atexit.register(self.flush)
+
+    def _file_signature(self):
+        try:
+            stat = os.stat(self.config_file)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _read_file(self):
+        """读取配置文件，返回 (配置, 文件签名)"""
+        signature = self._file_signature()
+        if signature is None:
+            return {}, None
+        try:
+            with open(self.config_file, 'r', encoding='utf-8') as f:
+                return json.load(f), signature
+        except Exception as e:
+            print(f"配置文件加载失败: {e}")
+            return {}, signature
+
+    def _apply_pending(self, config):
+        for key, value in self._pending.items():
+            if value is _REMOVED:
+                config.pop(key, None)
+            else:
+                config[key] = value
+        return config
+
     def load_config(self):
-        """加载配置文件"""
-        if os.path.exists(self.config_file):
+        """加载配置文件（叠加本进程尚未写盘的修改）"""
+        with self._lock:
+            config, self._signature = self._read_file()
+            self._checked_at = time.monotonic()
+            return self._apply_pending(config)
+
+    def _maybe_reload(self):
+        """文件被其他进程修改时重新加载（按 reload_interval 节流）"""
+        now = time.monotonic()
+        if now - self._checked_at < self.reload_interval:
+            return
+        with self._lock:
+            self._checked_at = now
+            if self._file_signature() != self._signature:
+                self.config = self.load_config()
+
+    @contextmanager
+    def _file_lock(self):
+        """跨进程的写锁（config.json.lock 上的 flock），保证“读取-合并-替换”不被其他进程打断"""
+        if fcntl is None:
+            yield
+            return
+        with open(self.config_file + ".lock", 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
             try:
-                with open(self.config_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except Exception as e:
-                print(f"配置文件加载失败: {e}")
-                return {}
-        return {}
-    
-    def save_config(self):
-        """保存配置文件"""
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _write_atomic(self, config):
+        """写入临时文件后 os.replace 替换，读取方不会看到写了一半的文件"""
+        directory = os.path.dirname(os.path.abspath(self.config_file))
+        fd, tmp_path = tempfile.mkstemp(prefix=".config.", suffix=".tmp", dir=directory)
         try:
-            with open(self.config_file, 'w', encoding='utf-8') as f:
-                json.dump(self.config, f, ensure_ascii=False, indent=2)
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(config, f, ensure_ascii=False, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.config_file)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def save_config(self):
+        """立即保存配置文件：重新读取磁盘上的配置，叠加本进程的修改后原子替换"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            try:
+                with self._file_lock():
+                    if self._pending:
+                        config = self._apply_pending(self._read_file()[0])
+                    else:
+                        # 没有待写入的修改时以内存中的配置为准
+                        config = dict(self.config)
+                    self._write_atomic(config)
+                    self._signature = self._file_signature()
+            except Exception as e:
+                print(f"配置文件保存失败: {e}")
+                return False
+            self._pending.clear()
+            self.config = config
+            self._checked_at = time.monotonic()
             return True
-        except Exception as e:
-            print(f"配置文件保存失败: {e}")
-            return False
-    
+
+    def flush(self):
+        """把尚未写盘的修改立即写入（进程退出时自动调用）"""
+        with self._lock:
+            if self._pending:
+                return self.save_config()
+            return True
+
+    def _schedule_save(self):
+        if self.write_delay <= 0:
+            return self.save_config()
+        if self._timer is None:
+            self._timer = threading.Timer(self.write_delay, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+        return True
+
     def get(self, key, default=None):
         """获取配置值"""
+        self._maybe_reload()
         return self.config.get(key, default)
-    
+
     def set(self, key, value):
-        """设置配置值"""
-        self.config[key] = value
-        return self.save_config()
-    
+        """设置配置值（延迟合并写盘）"""
+        with self._lock:
+            self._pending[key] = value
+            self.config = dict(self.config, **{key: value})
+            return self._schedule_save()
+
     def remove(self, key):
         """删除配置项"""
-        if key in self.config:
-            del self.config[key]
-            return self.save_config()
-        return True
+        with self._lock:
+            if key not in self.config:
+                return True
+            self._pending[key] = _REMOVED
+            self.config = {k: v for k, v in self.config.items() if k != key}
+            return self._schedule_save()
 
 # 全局配置管理器实例
 config_manager = ConfigManager()
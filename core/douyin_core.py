@@ -1,31 +1,205 @@
 import requests
 import re
 import os
+import json
 import time
-from google import genai
-from google.genai import types
+import contextvars
 import hashlib
-import shutil
-import tempfile
+import io
+import mimetypes
+import threading
+from contextlib import contextmanager
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from .config_manager import config_manager
+from .http_session import PooledSession
+from .download_store import DownloadStore
+from .downloads_index import DownloadsIndex
+from .parse_cache import ParseCache
+from .gemini_uploads import UploadRegistry, api_key_fingerprint
+from .gemini_clients import gemini_clients
+from .file_waiter import wait_for_file_active, wait_for_file_active_async
+from .rate_limiter import retry_after_from_error, backoff_delay
+from .response_cache import ResponseCache, CachedResponse
+from . import telemetry
+
+# 解析接口的错误信息中表示链接本身不可用（重试也不会成功）的关键词
+PERMANENT_PARSE_ERRORS = ('不存在', '已删除', '被删除', '已下架', '私密', '仅自己可见', '链接无效', '无效链接',
+                          'not found', 'deleted', 'private', 'invalid url')
+# 表示接口临时不可用的关键词，优先于上面的判断
+TRANSIENT_PARSE_ERRORS = ('频繁', '繁忙', '稍后', '限流', '超时', 'busy', 'limit', 'timeout', 'try again')
+
+# 当前调用上下文使用的 Gemini 密钥（每个作业 / 请求各自设置，并发调用互不影响）
+_current_api_key = contextvars.ContextVar("gemini_api_key", default=None)
+
+def _file_sha256(path, limit=None):
+    """计算文件（或前 limit 字节）的 sha256，返回哈希对象以便继续追加"""
+    sha256 = hashlib.sha256()
+    remaining = limit
+    with open(path, 'rb') as f:
+        while remaining is None or remaining > 0:
+            chunk = f.read(1024 * 1024 if remaining is None else min(1024 * 1024, remaining))
+            if not chunk:
+                break
+            sha256.update(chunk)
+            if remaining is not None:
+                remaining -= len(chunk)
+    return sha256
+
+def _pwrite_all(fd, data, offset, lock=None):
+    """按绝对偏移写入（定位写），多个线程可以并发写同一个文件的不同区域"""
+    view = memoryview(data)
+    if hasattr(os, 'pwrite'):
+        while view:
+            written = os.pwrite(fd, view, offset)
+            view = view[written:]
+            offset += written
+        return
+    # Windows 没有 pwrite，退化为加锁的 seek + write
+    with lock:
+        os.lseek(fd, offset, os.SEEK_SET)
+        while view:
+            written = os.write(fd, view)
+            view = view[written:]
+
+class _CountingReader(io.BufferedReader):
+    """记录实际从文件中读出的字节数（验证上传直接读取原文件）"""
+    
+    def __init__(self, raw):
+        super().__init__(raw)
+        self.bytes_read = 0
+    
+    def read(self, size=-1):
+        data = super().read(size)
+        self.bytes_read += len(data)
+        return data
+    
+    def read1(self, size=-1):
+        data = super().read1(size)
+        self.bytes_read += len(data)
+        return data
+    
+    def readinto(self, buffer):
+        count = super().readinto(buffer)
+        self.bytes_read += count or 0
+        return count
 
 class DouyinDownloader:
-    def __init__(self, gemini_api_key=None):
+    def __init__(self, gemini_api_key=None, downloads_dir=None, cache_dir=None):
         self.api_url = "https://api.suxun.site/api/douyin"
-        # 下载目录路径：项目根目录的downloads文件夹
         base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        self.downloads_dir = os.path.join(base_dir, "downloads")
-        self.gemini_api_key = gemini_api_key
-        self.gemini_client = None
+        # 下载目录路径：默认为项目根目录的downloads文件夹
+        if downloads_dir is None:
+            downloads_dir = os.path.join(base_dir, "downloads")
+        self.downloads_dir = downloads_dir
+        # 解析缓存、上传登记表和响应缓存所在目录：默认为项目根目录的cache文件夹
+        if cache_dir is None:
+            cache_dir = os.path.join(base_dir, "cache")
+        # 未通过 use_gemini_api_key 指定密钥时使用的默认密钥
+        self._default_api_key = gemini_api_key
+        # 显式指定的客户端 / 限速器（压测指向本地替身时使用），为空时按密钥从客户端池获取
+        self._gemini_client_override = None
+        self._rate_limiter_override = None
         
-        # 确保下载目录存在
-        if not os.path.exists(self.downloads_dir):
-            os.makedirs(self.downloads_dir)
+        # 共享连接池：解析和下载复用同一组 keep-alive 连接，避免每次请求重新握手
+        self.session = PooledSession(
+            pool_connections=config_manager.get("http_pool_connections", 10),
+            pool_maxsize=config_manager.get("http_pool_maxsize", 8),
+            max_retries=config_manager.get("http_max_retries", 3),
+            backoff_factor=config_manager.get("http_backoff_factor", 0.5)
+        )
+        # 超时时间：(连接超时, 读取超时)
+        connect_timeout = config_manager.get("http_connect_timeout", 5)
+        self.parse_timeout = (connect_timeout, config_manager.get("parse_read_timeout", 30))
+        self.download_timeout = (connect_timeout, config_manager.get("download_read_timeout", 60))
         
-        # 初始化Gemini客户端
-        if self.gemini_api_key:
-            self.gemini_client = genai.Client(api_key=self.gemini_api_key)
-    
+        # 下载目录在第一次写入时创建（_download_video / DownloadStore / DownloadsIndex）
+        
+        # 下载去重索引（视频 ID / 内容摘要 -> 本地文件）
+        self.store = DownloadStore(self.downloads_dir)
+        # 正在下载的 .part 文件：part_key -> (锁, 等待者数量)
+        self._part_locks = {}
+        self._part_locks_guard = threading.Lock()
+        # 下载目录的内存索引（最新 / 分页查询），后台扫描并监听外部改动
+        self.downloads_index = DownloadsIndex(
+            self.downloads_dir, self.store, watch=config_manager.get("downloads_watch", True)
+        ).start()
+        
+        # 解析结果缓存：默认 2 小时（短于 CDN 播放地址有效期），永久性失败缓存 1 天，其他接口错误缓存 1 分钟
+        self.parse_cache = ParseCache(
+            os.path.join(cache_dir, "parse_cache.sqlite3"),
+            ttl=config_manager.get("parse_cache_ttl", 2 * 3600),
+            negative_ttl=config_manager.get("parse_cache_negative_ttl", 24 * 3600),
+            transient_ttl=config_manager.get("parse_cache_transient_ttl", 60)
+        )
+        
+        # Gemini 上传登记表：同一内容只上传一次
+        self.upload_registry = UploadRegistry(os.path.join(cache_dir, "gemini_uploads.sqlite3"))
+        self._last_upload_sweep = 0
+        # 上传统计：bytes_streamed 为从原文件句柄实际读出的字节数（流式上传时应等于文件大小，不经过临时拷贝）
+        self.upload_stats = {'uploads': 0, 'streamed_uploads': 0, 'bytes_uploaded': 0, 'bytes_streamed': 0}
+        self._upload_stats_lock = threading.Lock()
+        # 最近的文件处理耗时记录
+        self.processing_history = deque(maxlen=200)
+        
+        # 模型响应缓存：相同 (模型, 文件内容, 提示词) 直接返回，不消耗配额
+        self.response_cache = ResponseCache(
+            os.path.join(cache_dir, "gemini_responses.sqlite3"),
+            max_bytes=config_manager.get("gemini_response_cache_max_bytes", 50 * 1024 * 1024)
+        )
+
+
+    @property
+    def gemini_api_key(self):
+        """当前上下文使用的密钥"""
+        return _current_api_key.get() or self._default_api_key
+
+    @gemini_api_key.setter
+    def gemini_api_key(self, api_key):
+        self._default_api_key = api_key
+
+    @property
+    def gemini_client(self):
+        """当前密钥对应的客户端（来自进程内共享的客户端池），未配置密钥时为 None"""
+        if self._gemini_client_override is not None:
+            return self._gemini_client_override
+        api_key = self.gemini_api_key
+        return gemini_clients.client(api_key) if api_key else None
+
+    @gemini_client.setter
+    def gemini_client(self, client):
+        self._gemini_client_override = client
+
+    @property
+    def rate_limiter(self):
+        """当前密钥的限速器（RPM + TPM），同一密钥的所有调用共享"""
+        if self._rate_limiter_override is not None:
+            return self._rate_limiter_override
+        return gemini_clients.rate_limiter(self.gemini_api_key or "")
+
+    @rate_limiter.setter
+    def rate_limiter(self, limiter):
+        self._rate_limiter_override = limiter
+
+    @contextmanager
+    def use_gemini_api_key(self, api_key=None, file_uri=None):
+        """
+        在 with 块内（以及由 telemetry.run_in_context 提交的子任务中）使用一个 Gemini 密钥，产出该密钥
+
+        密钥只作用于当前上下文，不修改共享的下载器，并发的作业和会话可以各自使用不同的密钥。
+        不指定 api_key 时：已有 file_uri 则使用上传该文件的密钥（文件只对该密钥可见），
+        否则在配置的密钥中选择剩余配额最多的一个；都没有时使用创建下载器时传入的密钥（可能为 None）。
+        """
+        if api_key is None and file_uri:
+            account = self.upload_registry.account_for_uri(file_uri)
+            api_key = gemini_clients.key_for_account(account) if account else None
+        with gemini_clients.lease(api_key) as api_key:
+            token = _current_api_key.set(api_key or self._default_api_key)
+            try:
+                yield self.gemini_api_key
+            finally:
+                _current_api_key.reset(token)
+
     def extract_douyin_url(self, text):
         """从文本中提取抖音链接"""
         # 匹配抖音链接的正则表达式
@@ -35,11 +209,60 @@ class DouyinDownloader:
             return match.group(0)
         return None
     
-    def parse_video(self, url):
-        """解析抖音视频获取下载链接"""
+    def extract_douyin_urls(self, text):
+        """从文本中提取所有抖音链接（按出现顺序去重）"""
+        douyin_pattern = r'https://v\.douyin\.com/[A-Za-z0-9_/]+'
+        urls = []
+        seen = set()
+        for match in re.finditer(douyin_pattern, text or ''):
+            # 统一结尾斜杠，避免同一链接因格式差异被重复处理
+            url = match.group(0).rstrip('/') + '/'
+            if url in seen:
+                continue
+            seen.add(url)
+            urls.append(url)
+        return urls
+    
+    def parse_video(self, url, use_cache=True, retry_failed=False):
+        """
+        解析抖音视频获取下载链接（优先读取解析缓存，命中时 cached 为 True）
+        
+        Args:
+            use_cache: 是否读取解析缓存
+            retry_failed: 手动重试：忽略缓存中的失败结果，重新请求解析接口
+        """
+        with telemetry.span("parse", cached=False) as span:
+            if use_cache:
+                cached = self.parse_cache.get(url, include_failures=not retry_failed)
+                if cached is not None:
+                    span.set(cached=True)
+                    return cached
+            
+            result = self._request_parse_api(url)
+            if not result['success']:
+                span.fail(result['error'])
+            # 网络错误没有 raw_response，属于临时性失败，不写入缓存
+            if 'raw_response' in result:
+                self.parse_cache.put(url, result, permanent=self._is_permanent_parse_failure(result))
+            return result
+    
+    def _is_permanent_parse_failure(self, result):
+        """接口返回的错误是否表示链接本身不可用（视频不存在、已删除等），只有这类失败才长期缓存"""
+        if result.get('success'):
+            return False
+        data = result.get('raw_response') or {}
+        if data.get('code') in config_manager.get("parse_permanent_error_codes", []):
+            return True
+        message = str(result.get('error') or '').lower()
+        if any(term in message for term in TRANSIENT_PARSE_ERRORS):
+            return False
+        return any(term in message for term in PERMANENT_PARSE_ERRORS)
+    
+    def _request_parse_api(self, url):
+        """调用解析接口"""
         try:
             # 调用解析API
-            response = requests.get(self.api_url, params={'url': url}, timeout=30)
+            response = self.session.get(self.api_url, params={'url': url}, timeout=self.parse_timeout)
             response.raise_for_status()
             
             data = response.json()
@@ -53,6 +276,7 @@ class DouyinDownloader:
                     'video_url': video_info.get('url', ''),
                     'cover_url': video_info.get('cover', ''),
                     'duration': video_info.get('duration', 0),
+                    'video_id': self._extract_video_id(video_info) or self._resolve_aweme_id(url),
                     'raw_response': data
                 }
             else:
@@ -72,144 +296,707 @@ class DouyinDownloader:
                 'error': f'解析失败: {str(e)}'
             }
     
-    def download_video(self, video_url, title):
-        """下载视频文件"""
+    def _extract_video_id(self, video_info):
+        """从解析接口返回的数据中提取稳定的视频 ID"""
+        for key in ('aweme_id', 'awemeId', 'video_id', 'vid', 'id'):
+            value = video_info.get(key)
+            if value:
+                return f"aweme:{value}" if key.startswith('aweme') else f"{key}:{value}"
+        # 抖音播放地址中通常带有 video_id 参数
+        match = re.search(r'[?&]video_id=([A-Za-z0-9]+)', video_info.get('url', '') or '')
+        if match:
+            return f"video_id:{match.group(1)}"
+        return None
+    
+    def _resolve_aweme_id(self, url):
+        """解析短链接的跳转地址，从中提取 aweme id（只读取跳转头，不下载页面）"""
+        try:
+            response = self.session.head(url, allow_redirects=False, timeout=self.parse_timeout)
+            location = response.headers.get('Location', '')
+            match = re.search(r'/(?:video|note)/(\d+)', location)
+            if match:
+                return f"aweme:{match.group(1)}"
+        except requests.exceptions.RequestException:
+            pass
+        return None
+    
+    def _clean_title(self, title):
+        """清理文件名，移除话题标签和特殊符号"""
+        # 移除话题标签（#开头的内容）
+        clean_title = re.sub(r'#\w+', '', title or '')
+        # 移除其他特殊符号，只保留中英文、数字和空格
+        clean_title = re.sub(r'[^\u4e00-\u9fff\w\s]', '', clean_title)
+        # 移除多余空格
+        clean_title = re.sub(r'\s+', ' ', clean_title).strip()
+        # 限制文件名长度
+        if len(clean_title) > 30:
+            clean_title = clean_title[:30]
+        return clean_title
+    
+    def _load_part_meta(self, meta_path):
+        """读取 .part 文件对应的进度记录"""
+        if not os.path.exists(meta_path):
+            return {}
         try:
-            # 清理文件名，移除话题标签和特殊符号
-            # 移除话题标签（#开头的内容）
-            clean_title = re.sub(r'#\w+', '', title)
-            # 移除其他特殊符号，只保留中英文、数字和空格
-            clean_title = re.sub(r'[^\u4e00-\u9fff\w\s]', '', clean_title)
-            # 移除多余空格
-            clean_title = re.sub(r'\s+', ' ', clean_title).strip()
-            # 限制文件名长度
-            if len(clean_title) > 30:
-                clean_title = clean_title[:30]
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception:
+            return {}
+    
+    def _save_part_meta(self, meta_path, meta):
+        """记录下载进度（写临时文件后原子替换）"""
+        tmp_path = meta_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp_path, meta_path)
+    
+    def _remove_part_files(self, part_path, meta_path):
+        """删除 .part 文件和进度记录"""
+        for path in (part_path, meta_path):
+            try:
+                if os.path.exists(path):
+                    os.remove(path)
+            except OSError:
+                pass
+    
+    def _download_single_stream(self, video_url, part_path, meta_path):
+        """
+        单连接下载到 .part 文件，已有部分内容时使用 Range 续传
+        
+        Returns:
+            (下载完成后 .part 文件的字节数, 内容 sha256)
+        Raises:
+            OSError: 网络中断或长度校验失败（可重试）
+        """
+        meta = self._load_part_meta(meta_path)
+        if meta.get('mode') == 'segmented':
+            # 分段模式留下的文件是预分配的，不能按文件大小续传
+            self._remove_part_files(part_path, meta_path)
+            meta = {}
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        
+        # identity 编码保证 Range 偏移与磁盘上的字节一一对应
+        headers = {'Accept-Encoding': 'identity'}
+        if offset > 0:
+            headers['Range'] = f'bytes={offset}-'
+            # If-Range：服务器上文件已变化时会返回完整内容而不是错位的片段
+            validator = meta.get('etag') or meta.get('last_modified')
+            if validator:
+                headers['If-Range'] = validator
+        
+        with self.session.get(video_url, stream=True, timeout=self.download_timeout, headers=headers) as response:
+            if response.status_code == 416:
+                # 请求范围超出文件末尾：要么已下载完整，要么本地文件已失效
+                total_size = meta.get('total_size')
+                if total_size and offset == total_size:
+                    return offset, _file_sha256(part_path).hexdigest()
+                self._remove_part_files(part_path, meta_path)
+                raise IOError('续传范围无效，已清除本地临时文件')
+            response.raise_for_status()
             
-            # 生成时间戳（年月日时分秒）
-            timestamp = time.strftime("%Y%m%d_%H%M%S")
-            filename = f"{clean_title}_{timestamp}.mp4"
-            filepath = os.path.join(self.downloads_dir, filename)
+            if offset > 0 and response.status_code == 206:
+                # 续传：总长度取自 Content-Range（bytes start-end/total）
+                mode = 'ab'
+                content_range = response.headers.get('Content-Range', '')
+                total_part = content_range.rsplit('/', 1)[-1] if '/' in content_range else ''
+                total_size = int(total_part) if total_part.isdigit() else meta.get('total_size')
+                # 续传时先补算已落盘部分的摘要，后续数据边下载边计算
+                sha256 = _file_sha256(part_path, limit=offset)
+            else:
+                # 服务器不支持续传或文件已变化，从头开始
+                mode = 'wb'
+                offset = 0
+                content_length = response.headers.get('Content-Length')
+                total_size = int(content_length) if content_length and content_length.isdigit() else None
+                sha256 = hashlib.sha256()
             
-            # 下载视频
-            response = requests.get(video_url, stream=True, timeout=60)
-            response.raise_for_status()
+            meta = {
+                'url': video_url,
+                'total_size': total_size,
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+                'downloaded': offset,
+                'updated_at': time.time()
+            }
+            self._save_part_meta(meta_path, meta)
+            
+            downloaded = offset
+            try:
+                with open(part_path, mode) as f:
+                    for chunk in response.iter_content(chunk_size=8192):
+                        if chunk:
+                            f.write(chunk)
+                            sha256.update(chunk)
+                            downloaded += len(chunk)
+            finally:
+                # 无论成功或中断都记录进度，便于下次续传
+                meta['downloaded'] = downloaded
+                meta['updated_at'] = time.time()
+                self._save_part_meta(meta_path, meta)
+        
+        size = os.path.getsize(part_path)
+        if total_size is not None and size != total_size:
+            raise IOError(f'下载不完整: {size}/{total_size} 字节')
+        return size, sha256.hexdigest()
+    
+    def _probe_range_support(self, video_url):
+        """
+        探测服务器是否支持 Range 请求
+        
+        Returns:
+            (总字节数, 校验信息)；不支持 Range 时总字节数为 None
+        """
+        headers = {'Accept-Encoding': 'identity', 'Range': 'bytes=0-0'}
+        with self.session.get(video_url, stream=True, timeout=self.download_timeout, headers=headers) as response:
+            if response.status_code != 206:
+                return None, {}
+            content_range = response.headers.get('Content-Range', '')
+            total_part = content_range.rsplit('/', 1)[-1] if '/' in content_range else ''
+            if not total_part.isdigit():
+                return None, {}
+            return int(total_part), {
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified')
+            }
+    
+    def _download_segmented(self, video_url, part_path, meta_path, segments):
+        """
+        多连接分段下载：把文件切成 N 个字节区间并行拉取，定位写入预分配的 .part 文件
+        
+        Returns:
+            (下载完成的字节数, 内容 sha256)；服务器不支持 Range 或文件太小时返回 None（由调用方退回单连接下载）
+        Raises:
+            OSError: 网络中断或分段校验失败（可重试，已完成的进度会保留）
+        """
+        meta = self._load_part_meta(meta_path)
+        # 签名 CDN 地址每次解析都会变化，有 ETag/Last-Modified 时交给 If-Range 判断内容是否一致
+        same_source = meta.get('url') == video_url or meta.get('etag') or meta.get('last_modified')
+        if meta.get('mode') == 'segmented' and same_source and os.path.exists(part_path):
+            # 续传：沿用上次的分段划分和进度
+            total_size = meta['total_size']
+        elif meta and os.path.exists(part_path):
+            # 已有单连接下载的进度，继续单连接续传
+            return None
+        else:
+            total_size, validators = self._probe_range_support(video_url)
+            min_segment_size = config_manager.get("download_min_segment_size", 1024 * 1024)
+            if not total_size or total_size < min_segment_size * 2:
+                return None
             
-            with open(filepath, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    if chunk:
-                        f.write(chunk)
+            segments = max(1, min(segments, total_size // min_segment_size))
+            segment_size = -(-total_size // segments)
+            ranges = []
+            for start in range(0, total_size, segment_size):
+                ranges.append([start, min(start + segment_size, total_size) - 1, 0])
             
-            return {
-                'success': True,
-                'filepath': filepath,
-                'filename': filename
+            # 预分配完整大小，各分段直接写到自己的偏移上
+            with open(part_path, 'wb') as f:
+                f.truncate(total_size)
+            meta = {
+                'url': video_url,
+                'mode': 'segmented',
+                'total_size': total_size,
+                'etag': validators.get('etag'),
+                'last_modified': validators.get('last_modified'),
+                'segments': ranges,
+                'updated_at': time.time()
             }
+            self._save_part_meta(meta_path, meta)
+        
+        ranges = meta['segments']
+        validator = meta.get('etag') or meta.get('last_modified')
+        progress_lock = threading.Lock()
+        write_lock = threading.Lock()
+        changed = threading.Event()
+        fd = os.open(part_path, os.O_RDWR | getattr(os, 'O_BINARY', 0))
+        
+        def fetch_segment(segment):
+            start, end, done = segment
+            position = start + done
+            if position > end:
+                return
+            headers = {'Accept-Encoding': 'identity', 'Range': f'bytes={position}-{end}'}
+            if validator:
+                headers['If-Range'] = validator
+            with self.session.get(video_url, stream=True, timeout=self.download_timeout, headers=headers) as response:
+                response.raise_for_status()
+                if response.status_code != 206:
+                    # If-Range 不匹配时服务器返回整个文件：远端内容已变化，需要从头下载
+                    changed.set()
+                    raise IOError('服务器文件已变化，分段数据作废')
+                for chunk in response.iter_content(chunk_size=65536):
+                    if not chunk:
+                        continue
+                    chunk = chunk[:end + 1 - position]
+                    _pwrite_all(fd, chunk, position, write_lock)
+                    position += len(chunk)
+                    with progress_lock:
+                        segment[2] = position - start
+                    if position > end:
+                        break
+            if position <= end:
+                raise IOError(f'分段 {start}-{end} 不完整: {position - start}/{end - start + 1} 字节')
+        
+        try:
+            pending = [segment for segment in ranges if segment[0] + segment[2] <= segment[1]]
+            if pending:
+                with ThreadPoolExecutor(max_workers=len(pending), thread_name_prefix="douyin-segment") as executor:
+                    futures = [executor.submit(fetch_segment, segment) for segment in pending]
+                    for future in futures:
+                        future.result()
+        finally:
+            os.close(fd)
+            if changed.is_set():
+                self._remove_part_files(part_path, meta_path)
+            else:
+                meta['updated_at'] = time.time()
+                self._save_part_meta(meta_path, meta)
+        
+        size = os.path.getsize(part_path)
+        if size != total_size:
+            raise IOError(f'下载不完整: {size}/{total_size} 字节')
+        # 分段乱序写入，完成后再统一计算摘要
+        return size, _file_sha256(part_path).hexdigest()
+    
+    def _stored_result(self, entry):
+        """把下载索引中的条目转换为 download_video 的返回格式"""
+        return {
+            'success': True,
+            'filepath': entry['filepath'],
+            'filename': entry['filename'],
+            'filesize': entry['size'],
+            'cached': True
+        }
+    
+    def download_video(self, video_url, title, segments=None, video_id=None, author=None, source_url=None):
+        """下载视频文件（先写入 .part 文件，中断后按 Range 续传，校验长度后再改名）
+        
+        Args:
+            video_url: 视频地址
+            title: 视频标题（用于生成文件名）
+            segments: 分段并行下载的连接数，默认读取配置 download_segments（1 表示单连接）
+            video_id: 稳定的视频 ID（来自 parse_video），已下载过时直接返回本地文件
+            author: 作者（记录到下载索引）
+            source_url: 原始分享链接（记录到下载索引）
+        
+        Returns:
+            dict，命中下载索引时 cached 为 True
+        """
+        with telemetry.span("download", segments=segments) as span:
+            result = self._download_video(video_url, title, segments, video_id, author, source_url)
+            if result['success']:
+                span.set(cached=result['cached'], bytes=0 if result['cached'] else result['filesize'])
+            else:
+                span.fail(result['error'])
+            return result
+    
+    def _move_to_unique_name(self, part_path, base):
+        """
+        把下载完成的 .part 文件改名为 "<base>_<时间戳>.mp4"，同名文件已存在时依次加 _1、_2 后缀，返回文件名
+        
+        先以 O_EXCL 创建隐藏的占位文件 ".<文件名>.reserved" 占用名字，确认最终文件不存在后原子改名，再删除占位文件。
+        同一秒完成的两个下载（例如标题只有话题标签、清理后相同）不会互相覆盖；
+        占位文件不以 .mp4 结尾，进程中途退出时也不会出现空的视频文件。
+        """
+        # 生成时间戳（年月日时分秒）
+        stem = f"{base}_{time.strftime('%Y%m%d_%H%M%S')}"
+        for attempt in range(1000):
+            filename = f"{stem}.mp4" if attempt == 0 else f"{stem}_{attempt}.mp4"
+            filepath = os.path.join(self.downloads_dir, filename)
+            reserved_path = os.path.join(self.downloads_dir, f".{filename}.reserved")
+            try:
+                fd = os.open(reserved_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                continue
+            os.close(fd)
+            try:
+                if os.path.exists(filepath):
+                    continue
+                # 长度校验通过后原子改名，最终目录中不会出现半截的 .mp4
+                os.replace(part_path, filepath)
+                return filename
+            finally:
+                os.remove(reserved_path)
+        raise IOError(f'无法生成不重复的文件名: {stem}.mp4')
+    
+    @contextmanager
+    def _part_lock(self, part_key):
+        """同一个 .part 文件同时只允许一个线程下载（不同链接可能解析出同一个视频）"""
+        with self._part_locks_guard:
+            lock, users = self._part_locks.get(part_key, (None, 0))
+            lock = lock or threading.Lock()
+            self._part_locks[part_key] = (lock, users + 1)
+        try:
+            with lock:
+                yield
+        finally:
+            with self._part_locks_guard:
+                lock, users = self._part_locks[part_key]
+                if users == 1:
+                    del self._part_locks[part_key]
+                else:
+                    self._part_locks[part_key] = (lock, users - 1)
+    
+    def _download_video(self, video_url, title, segments, video_id, author, source_url):
+        """download_video 的实现（不含埋点）"""
+        try:
+            # 同一个视频已经下载过：直接返回本地文件，不访问网络
+            entry = self.store.lookup(video_id)
+            if entry:
+                self.store.link_url(source_url, video_id)
+                return self._stored_result(entry)
+            
+            # .part 文件名只由视频 ID（没有时用链接）决定，与时间戳无关，重试时能找到上次的进度
+            part_key = video_id or video_url
+            with self._part_lock(part_key):
+                # 等待期间其他线程可能已经下载完同一个视频
+                entry = self.store.lookup(video_id)
+                if entry:
+                    self.store.link_url(source_url, video_id)
+                    return self._stored_result(entry)
+                return self._download_to_store(video_url, title, segments, video_id, author, source_url, part_key)
         except Exception as e:
             return {
                 'success': False,
                 'error': f'下载失败: {str(e)}'
             }
     
-    def upload_video_to_gemini(self, video_path):
-        """上传视频到Gemini（增强：对含非 ASCII 的路径做临时拷贝并上传）"""
-        # 内部帮助函数：生成 ASCII-safe 的临时拷贝（如不需要则返回原 path, False）
-        def _make_ascii_safe_copy(src_path):
-            if not src_path:
-                return src_path, False
-            try:
-                basename = os.path.basename(src_path)
-            except Exception:
-                basename = "video"
-            # 如果文件名全部是 ASCII，则直接返回原路径（不拷贝）
-            if all(ord(ch) < 128 for ch in basename):
-                return src_path, False
-            # 生成唯一短 id，构造安全文件名
-            sha1 = hashlib.sha1()
-            sha1.update(src_path.encode('utf-8', errors='ignore'))
-            digest = sha1.hexdigest()[:12]
-            _, ext = os.path.splitext(basename)
-            if not ext:
-                ext = '.mp4'
-            safe_name = f"video_{digest}{ext}"
-            tmp_dir = tempfile.gettempdir()
-            dst_path = os.path.join(tmp_dir, safe_name)
+    def _download_to_store(self, video_url, title, segments, video_id, author, source_url, part_key):
+        """下载到 .part 文件，校验后改名为最终文件并登记到下载索引"""
+        clean_title = self._clean_title(title)
+        os.makedirs(self.downloads_dir, exist_ok=True)
+        
+        part_digest = hashlib.sha1(part_key.encode('utf-8')).hexdigest()[:12]
+        part_path = os.path.join(self.downloads_dir, f"{clean_title}_{part_digest}.mp4.part")
+        meta_path = part_path + '.json'
+        
+        if segments is None:
+            segments = config_manager.get("download_segments", 1)
+        
+        max_attempts = config_manager.get("download_max_attempts", 3)
+        for attempt in range(max_attempts):
             try:
-                # 若目标已存在且大小一致，直接复用
-                if os.path.exists(dst_path) and os.path.getsize(dst_path) == os.path.getsize(src_path):
-                    return dst_path, True
-            except Exception:
-                pass
-            # 拷贝并保留元数据
-            shutil.copy2(src_path, dst_path)
-            return dst_path, True
-
+                # 分段模式在服务器不支持 Range 时返回 None，退回单连接下载
+                downloaded = None
+                if segments > 1:
+                    downloaded = self._download_segmented(video_url, part_path, meta_path, segments)
+                if downloaded is None:
+                    downloaded = self._download_single_stream(video_url, part_path, meta_path)
+                break
+            except OSError as e:
+                if attempt == max_attempts - 1:
+                    raise
+                delay = 2 ** attempt
+                done = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+                print(f"⚠️ 下载中断（尝试 {attempt + 1}/{max_attempts}，已下载 {done} 字节），{delay}秒后续传: {e}")
+                time.sleep(delay)
+        size, digest = downloaded
+        
+        # 没有视频 ID 时按内容去重：同样的内容已存在则丢弃本次下载
+        entry = self.store.lookup_digest(digest)
+        if entry:
+            self._remove_part_files(part_path, meta_path)
+            stored_id = self.store.record(video_id, entry['filename'], entry['size'], digest,
+                                          title=title, author=author, source_url=source_url)
+            self.store.link_url(source_url, stored_id)
+            return self._stored_result(entry)
+        
+        filename = self._move_to_unique_name(part_path, clean_title or part_digest)
+        filepath = os.path.join(self.downloads_dir, filename)
+        self._remove_part_files(part_path, meta_path)
+        
+        stored_id = self.store.record(video_id, filename, size, digest,
+                                      title=title, author=author, source_url=source_url)
+        self.store.link_url(source_url, stored_id)
+        self.downloads_index.add(filepath, size=size, title=title, author=author, source_url=source_url)
+        
+        return {
+            'success': True,
+            'filepath': filepath,
+            'filename': filename,
+            'filesize': size,
+            'cached': False
+        }
+    
+    def process_video(self, url, retry_failed=False):
+        """
+        解析并下载单个链接，返回该条目的完整处理结果（stages 为各阶段耗时，trace_id 对应 JSON 轨迹）
+        
+        retry_failed 时忽略解析缓存中的失败结果（手动重试）
+        """
+        with telemetry.trace("process_video", url=url) as run_trace:
+            item = self._process_video(url, retry_failed)
+        item['trace_id'] = run_trace.trace_id
+        item['stages'] = run_trace.stage_seconds()
+        item['elapsed'] = run_trace.duration
+        return item
+    
+    def _process_video(self, url, retry_failed):
+        """process_video 的实现"""
+        item = {'url': url, 'success': False}
+        try:
+            # 同一链接已下载过：跳过解析和下载
+            entry = self.store.lookup_url(url)
+            if entry:
+                item.update({
+                    'success': True,
+                    'cached': True,
+                    'title': entry.get('title', ''),
+                    'author': entry.get('author', ''),
+                    'filepath': entry['filepath'],
+                    'filename': entry['filename'],
+                    'filesize': entry['size'],
+                    'raw_response': {}
+                })
+                return item
+            
+            parse_result = self.parse_video(url, retry_failed=retry_failed)
+            item['raw_response'] = parse_result.get('raw_response', {})
+            if not parse_result['success']:
+                item['error'] = f"解析失败: {parse_result['error']}"
+                return item
+            
+            item['title'] = parse_result['title']
+            item['author'] = parse_result['author']
+            if not parse_result['video_url']:
+                item['error'] = '未获取到视频下载链接'
+                return item
+            
+            download_result = self.download_video(
+                parse_result['video_url'],
+                parse_result['title'],
+                video_id=parse_result.get('video_id'),
+                author=parse_result['author'],
+                source_url=url
+            )
+            if not download_result['success'] and parse_result.get('cached'):
+                # 缓存里的播放地址可能已过期：清除缓存，重新解析后再试一次
+                self.parse_cache.invalidate(url)
+                parse_result = self.parse_video(url, use_cache=False)
+                item['raw_response'] = parse_result.get('raw_response', {})
+                if parse_result['success'] and parse_result['video_url']:
+                    download_result = self.download_video(
+                        parse_result['video_url'],
+                        parse_result['title'],
+                        video_id=parse_result.get('video_id'),
+                        author=parse_result['author'],
+                        source_url=url
+                    )
+            if not download_result['success']:
+                item['error'] = download_result['error']
+                return item
+            
+            item.update({
+                'success': True,
+                'cached': download_result.get('cached', False),
+                'filepath': download_result['filepath'],
+                'filename': download_result['filename'],
+                'filesize': download_result.get('filesize', 0)
+            })
+            return item
+        except Exception as e:
+            item['error'] = f'处理失败: {str(e)}'
+            return item
+    
+    def batch_process(self, urls, max_workers=4, retry_failed=False):
+        """
+        使用有界线程池并发解析并下载多个链接
+        
+        Args:
+            urls: 链接列表（建议先经过 extract_douyin_urls 去重）
+            max_workers: 最大并发数
+            retry_failed: 忽略解析缓存中的失败结果（手动重试）
+        
+        Yields:
+            每个条目完成时产出 process_video 的结果，附带 index 字段（在 urls 中的位置）
+        """
+        if not urls:
+            return
+        max_workers = max(1, min(max_workers, len(urls)))
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="douyin-batch") as executor:
+            futures = {executor.submit(self.process_video, url, retry_failed): index for index, url in enumerate(urls)}
+            for future in as_completed(futures):
+                result = future.result()
+                result['index'] = futures[future]
+                yield result
+    
+    def connection_stats(self):
+        """返回共享连接池的复用统计"""
+        return self.session.stats.snapshot()
+    
+    def _find_reusable_upload(self, account, digest):
+        """查找可复用的已上传文件：登记未过期且远端状态仍为 ACTIVE"""
+        entry = self.upload_registry.lookup(account, digest)
+        if not entry:
+            return None
+        try:
+            file_info = self.gemini_client.files.get(name=entry['name'])
+        except Exception as e:
+            # 404 / 403：远端文件已不存在（过期或被删除）或不属于当前密钥，删除登记；
+            # 网络错误、限速、5xx 等临时错误只是本次不复用，保留登记
+            if getattr(e, 'code', None) in (403, 404):
+                self.upload_registry.forget(account, digest)
+            return None
+        if getattr(file_info, "state", None) != "ACTIVE":
+            self.upload_registry.forget(account, digest)
+            return None
+        return {
+            'success': True,
+            'file_uri': entry['file_uri'],
+            'file_name': entry['name'],
+            'reused': True
+        }
+    
+    def sweep_gemini_uploads(self):
+        """清理当前密钥下临近过期的远端文件，返回清理数量"""
+        if not self.gemini_client:
+            return 0
+        self._last_upload_sweep = time.time()
+        return self.upload_registry.sweep(self.gemini_client, api_key_fingerprint(self.gemini_api_key))
+    
+    def _maybe_sweep_gemini_uploads(self):
+        """按配置的间隔在后台线程中清理过期文件，不阻塞上传流程"""
+        interval = config_manager.get("gemini_upload_sweep_interval", 3600)
+        if time.time() - self._last_upload_sweep < interval:
+            return
+        self._last_upload_sweep = time.time()
+        # 带上当前上下文，清理的是当前密钥下的文件
+        threading.Thread(target=contextvars.copy_context().run, args=(self.sweep_gemini_uploads,),
+                         name="gemini-upload-sweeper", daemon=True).start()
+    
+    def _upload_file_zero_copy(self, video_path, digest):
+        """
+        上传文件且不产生额外拷贝
+        
+        SDK 按路径上传时会把文件名放进 X-Goog-Upload-File-Name 请求头，中文文件名会导致请求失败。
+        对这类文件改为传入已打开的文件句柄，并显式指定 MIME 类型和 ASCII 展示名，
+        SDK 直接从原文件分块读取上传，不再拷贝到临时目录。
+        
+        Returns:
+            (SDK 返回的文件对象, 从原文件句柄读出的字节数；按路径上传时为 None)
+        """
+        basename = os.path.basename(video_path)
+        size = os.path.getsize(video_path)
+        with self._upload_stats_lock:
+            self.upload_stats['uploads'] += 1
+            self.upload_stats['bytes_uploaded'] += size
+        
+        if all(ord(ch) < 128 for ch in basename):
+            return self.gemini_client.files.upload(file=video_path), None
+        
+        from google.genai import types
+        _, ext = os.path.splitext(basename)
+        mime_type = mimetypes.guess_type(basename)[0] or 'video/mp4'
+        display_name = f"video_{digest[:12]}{ext or '.mp4'}"
+        with self._upload_stats_lock:
+            self.upload_stats['streamed_uploads'] += 1
+        with _CountingReader(io.FileIO(video_path, 'rb')) as f:
+            uploaded_file = self.gemini_client.files.upload(
+                file=f,
+                config=types.UploadFileConfig(mime_type=mime_type, display_name=display_name)
+            )
+        with self._upload_stats_lock:
+            self.upload_stats['bytes_streamed'] += f.bytes_read
+        return uploaded_file, f.bytes_read
+    
+    def _record_processing_time(self, file_name, wait_result):
+        """记录每个文件从上传完成到 ACTIVE 的处理耗时"""
+        seconds = wait_result.get('processing_seconds')
+        if seconds is None:
+            return
+        self.processing_history.append({
+            'name': file_name,
+            'success': wait_result['success'],
+            'processing_seconds': seconds,
+            'polls': wait_result.get('polls', 0),
+            'finished_at': time.time()
+        })
+    
+    async def wait_for_gemini_file_async(self, file_name, max_wait=None):
+        """异步等待文件处理完成（使用 client.aio，不占用线程）"""
+        if not self.gemini_client:
+            return {'success': False, 'error': 'Gemini API密钥未配置'}
+        wait_result = await wait_for_file_active_async(
+            self.gemini_client,
+            file_name,
+            max_wait=max_wait or config_manager.get("gemini_processing_max_wait", 300),
+            first_delay=config_manager.get("gemini_poll_first_delay", 0.25),
+            max_delay=config_manager.get("gemini_poll_max_delay", 5)
+        )
+        self._record_processing_time(file_name, wait_result)
+        return wait_result
+    
+    def upload_video_to_gemini(self, video_path):
+        """上传视频到Gemini（文件名含非 ASCII 时从文件句柄流式上传，不做临时拷贝）"""
+        with telemetry.span("upload") as span:
+            result = self._upload_video_to_gemini(video_path)
+            if result['success']:
+                span.set(reused=result['reused'])
+            else:
+                span.fail(result['error'])
+            return result
+    
+    def _upload_video_to_gemini(self, video_path):
+        """upload_video_to_gemini 的实现"""
         if not self.gemini_client:
             return {
                 'success': False,
                 'error': 'Gemini API密钥未配置'
             }
 
-        safe_path = video_path
-        created_temp = False
-        result = None
-
         try:
-            # 1) 如果文件名包含非 ASCII，先创建一个 ASCII-safe 的临时拷贝并上传该拷贝
-            safe_path, created_temp = _make_ascii_safe_copy(video_path)
-
-            # 2) 上传视频文件（使用 SDK 的 upload 接口）
-            #    这里直接传路径（与原代码保持一致）。
-            uploaded_file = self.gemini_client.files.upload(file=safe_path)
+            # 0) 同样内容已上传且远端仍可用：直接复用，跳过上传和处理等待
+            account = api_key_fingerprint(self.gemini_api_key)
+            digest = self.upload_registry.file_digest(video_path)
+            self._maybe_sweep_gemini_uploads()
+            reused = self._find_reusable_upload(account, digest)
+            if reused:
+                return reused
 
-            # 3) 等待上传并轮询文件状态
-            max_wait_time = 300  # 最多等待5分钟
-            wait_interval = 2    # 每2秒检查一次
-            elapsed_time = 0
-
-            while elapsed_time < max_wait_time:
-                try:
-                    # 有些 SDK 返回的 uploaded_file 可能包含 name 属性，也可能需要用上面返回的 name
-                    file_name_for_query = getattr(uploaded_file, "name", None) or os.path.basename(safe_path)
-                    file_info = self.gemini_client.files.get(name=file_name_for_query)
+            # 1) 上传视频文件（使用 SDK 的 upload 接口）
+            with telemetry.span("upload.transfer", bytes=os.path.getsize(video_path)) as transfer_span:
+                uploaded_file, bytes_streamed = self._upload_file_zero_copy(video_path, digest)
+                transfer_span.set(bytes_streamed=bytes_streamed)
 
-                    if getattr(file_info, "state", None) == "ACTIVE":
-                        result = {
-                            'success': True,
-                            'file_uri': getattr(uploaded_file, "uri", None),
-                            'file_name': getattr(uploaded_file, "name", file_name_for_query)
-                        }
-                        break
-                    elif getattr(file_info, "state", None) == "FAILED":
-                        result = {
-                            'success': False,
-                            'error': '文件处理失败'
-                        }
-                        break
-                    # 如果仍在 PROCESSING/PENDING，继续等待
-                except Exception as e:
-                    # 兼容性判断：部分 SDK 在文件未最终化时会抛出 not found / not finalized 类似错误
-                    lower = str(e).lower()
-                    if "not found" in lower or "not finalized" in lower:
-                        # 文件还在上传/处理，继续等待
-                        pass
-                    else:
-                        result = {
-                            'success': False,
-                            'error': f'检查文件状态失败: {str(e)}'
-                        }
-                        break
-
-                time.sleep(wait_interval)
-                elapsed_time += wait_interval
-
-            if result is None:
-                # 如果循环结束还没有结果，则超时
-                result = {
+            # 2) 等待文件处理完成：首次短延迟，之后带抖动的指数退避
+            file_name = getattr(uploaded_file, "name", None) or os.path.basename(video_path)
+            with telemetry.span("upload.processing_wait") as wait_span:
+                wait_result = wait_for_file_active(
+                    self.gemini_client,
+                    file_name,
+                    max_wait=config_manager.get("gemini_processing_max_wait", 300),
+                    first_delay=config_manager.get("gemini_poll_first_delay", 0.25),
+                    max_delay=config_manager.get("gemini_poll_max_delay", 5)
+                )
+                wait_span.set(polls=wait_result.get('polls', 0))
+                if not wait_result['success']:
+                    wait_span.fail(wait_result['error'])
+            self._record_processing_time(file_name, wait_result)
+            if not wait_result['success']:
+                return {
                     'success': False,
-                    'error': '文件处理超时'
+                    'error': wait_result['error']
                 }
 
+            file_info = wait_result['file']
+            result = {
+                'success': True,
+                'file_uri': getattr(uploaded_file, "uri", None),
+                'file_name': file_name,
+                'reused': False,
+                'processing_seconds': wait_result['processing_seconds'],
+                'file_size': os.path.getsize(video_path),
+                'bytes_streamed': bytes_streamed
+            }
+            expiration = getattr(file_info, "expiration_time", None)
+            self.upload_registry.record(
+                account,
+                digest,
+                result['file_name'],
+                result['file_uri'],
+                mime_type=getattr(file_info, "mime_type", None),
+                expires_at=expiration.timestamp() if expiration else None
+            )
             return result
 
         except Exception as e:
@@ -217,20 +1004,88 @@ class DouyinDownloader:
                 'success': False,
                 'error': f'上传失败: {str(e)}'
             }
-        finally:
-            # 清理临时拷贝（如果创建过）
-            try:
-                if created_temp and safe_path and os.path.exists(safe_path):
-                    try:
-                        os.remove(safe_path)
-                    except Exception:
-                        # 无需中断主流程，如果删除失败就忽略
-                        pass
-            except Exception:
-                pass
 
 
-    def generate_content_with_retry(self, model_name, contents, max_retries=5, base_delay=2):
+    def _is_retryable_error(self, error, include_network=False):
+        """判断是否是 503 / 429 等可重试的临时错误；include_network 时连接中断也视为可重试"""
+        error_str = str(error).lower()
+        retryable_terms = ['503', 'unavailable', 'overloaded', 'rate limit', '429']
+        if include_network:
+            retryable_terms += ['timed out', 'timeout', 'connection', 'disconnected', 'incomplete', 'reset']
+        return any(term in error_str for term in retryable_terms)
+    
+    def _estimate_tokens(self, contents):
+        """粗略预估请求的 token 数：文本按字符数计，视频文件按配置的固定值计，完成后再按实际用量修正"""
+        from google.genai import types
+        file_tokens = config_manager.get("gemini_estimated_file_tokens", 15000)
+        total = 0
+        for item in contents if isinstance(contents, (list, tuple)) else [contents]:
+            parts = (item.parts or []) if isinstance(item, types.Content) else [item]
+            for part in parts:
+                if isinstance(part, str):
+                    total += len(part)
+                elif isinstance(part, types.Part):
+                    if part.file_data:
+                        total += file_tokens
+                    elif part.text:
+                        total += len(part.text)
+        return total
+    
+    def _retry_delay(self, error, attempt, base_delay):
+        """
+        计算重试等待时间
+        
+        服务端给出 Retry-After / retryDelay 时暂停共享限速器，所有调用方一起等待；
+        否则使用带抖动的指数退避，只有当前调用方等待。
+        
+        Returns:
+            (等待秒数, 是否由限速器统一等待)
+        """
+        hint = retry_after_from_error(error)
+        if hint is not None:
+            self.rate_limiter.pause(hint)
+            return hint, True
+        return backoff_delay(attempt, base_delay), False
+    
+    def _response_cache_key(self, model_name, contents, config=None):
+        """生成响应缓存键：文件按内容摘要（而非 file_uri）计入，重新上传同一视频也能命中"""
+        from google.genai import types
+        parts = []
+        
+        def add(item):
+            if isinstance(item, str):
+                parts.append('text:' + item)
+            elif isinstance(item, types.Content):
+                parts.append('role:' + (item.role or ''))
+                for part in item.parts or []:
+                    add(part)
+            elif isinstance(item, types.Part):
+                if item.file_data and item.file_data.file_uri:
+                    digest = self.upload_registry.digest_for_uri(item.file_data.file_uri)
+                    parts.append('file:' + digest if digest else 'uri:' + item.file_data.file_uri)
+                elif item.text is not None:
+                    parts.append('text:' + item.text)
+                else:
+                    parts.append('part:' + item.model_dump_json(exclude_none=True))
+            else:
+                parts.append('raw:' + repr(item))
+        
+        for item in contents if isinstance(contents, (list, tuple)) else [contents]:
+            add(item)
+        config_fingerprint = ''
+        if config is not None:
+            config_fingerprint = config.model_dump_json(exclude_none=True) if hasattr(config, 'model_dump_json') else repr(config)
+        return ResponseCache.make_key(model_name, parts, config_fingerprint)
+    
+    def _record_retry(self, span, model_name, delay):
+        """记录一次模型调用重试（次数和退避时间计入 span 与指标）"""
+        span.set(retries=span.attributes['retries'] + 1,
+                 backoff_seconds=span.attributes['backoff_seconds'] + delay)
+        telemetry.metrics.inc("video_remix_model_retries_total", 1, "模型调用重试次数", model=model_name)
+        telemetry.metrics.inc("video_remix_model_backoff_seconds_total", delay, "模型调用重试退避的总秒数", model=model_name)
+    
+    def generate_content_with_retry(self, model_name, contents, max_retries=5, base_delay=2, config=None, use_cache=True,
+                                    validate=None):
         """
         带重试机制的 Gemini API 调用
         使用指数退避策略处理 503 等临时错误
@@ -238,48 +1093,148 @@ class DouyinDownloader:
         Args:
             model_name: 模型名称
             contents: 请求内容
+            config: 可选的 GenerateContentConfig（例如 JSON 结构化输出）
             max_retries: 最大重试次数
             base_delay: 基础延迟时间（秒），每次重试会指数增长
+            use_cache: 是否读取响应缓存（强制重新生成时传 False，结果仍会写入缓存）
+            validate: 可选的校验函数 validate(text)，抛出 ValueError 表示结果不可用：
+                不可用的结果不写入缓存（直接抛出该异常），已缓存的不可用结果会被删除后重新请求
         
         Returns:
-            response 对象或抛出异常
+            response 对象（缓存命中时为 CachedResponse）或抛出异常
         """
         if not self.gemini_client:
             raise Exception('Gemini API密钥未配置')
         
-        last_exception = None
-        
-        for attempt in range(max_retries):
-            try:
-                response = self.gemini_client.models.generate_content(
-                    model=model_name,
-                    contents=contents
-                )
-                return response
-            except Exception as e:
-                last_exception = e
-                error_str = str(e).lower()
-                
-                # 检查是否是 503 或其他可重试的错误
-                is_retryable = (
-                    '503' in error_str or 
-                    'unavailable' in error_str or
-                    'overloaded' in error_str or
-                    'rate limit' in error_str or
-                    '429' in error_str
-                )
-                
-                # 如果不是可重试的错误，或者已经达到最大重试次数，直接抛出异常
-                if not is_retryable or attempt == max_retries - 1:
-                    raise
+        with telemetry.span("model.generate", model=model_name, cached=False, retries=0, backoff_seconds=0.0) as span:
+            cache_key = self._response_cache_key(model_name, contents, config)
+            if use_cache:
+                cached_text = self.response_cache.get(cache_key)
+                if cached_text is not None and self._passes(validate, cached_text):
+                    span.set(cached=True)
+                    return CachedResponse(cached_text)
+                if cached_text is not None:
+                    self.response_cache.invalidate(cache_key)
+            
+            last_exception = None
+            estimated_tokens = self._estimate_tokens(contents)
+            
+            for attempt in range(max_retries):
+                try:
+                    waited = self.rate_limiter.acquire(estimated_tokens)
+                    span.set(rate_limit_wait=span.attributes.get('rate_limit_wait', 0.0) + waited)
+                    response = self.gemini_client.models.generate_content(
+                        model=model_name,
+                        contents=contents,
+                        config=config
+                    )
+                    usage = getattr(response, "usage_metadata", None)
+                    span.set(tokens=getattr(usage, "total_token_count", None))
+                    self.rate_limiter.settle(estimated_tokens, getattr(usage, "total_token_count", None))
+                except Exception as e:
+                    last_exception = e
+                    
+                    # 如果不是可重试的错误，或者已经达到最大重试次数，直接抛出异常
+                    if not self._is_retryable_error(e) or attempt == max_retries - 1:
+                        raise
+                    
+                    # 优先遵守服务端的重试提示，否则使用带抖动的指数退避
+                    delay, shared = self._retry_delay(e, attempt, base_delay)
+                    self._record_retry(span, model_name, delay)
+                    print(f"⚠️ API调用失败（尝试 {attempt + 1}/{max_retries}），{delay:.1f}秒后重试...")
+                    if not shared:
+                        time.sleep(delay)
+                    continue
                 
-                # 计算延迟时间（指数退避：2s, 4s, 8s, 16s, 32s）
-                delay = base_delay * (2 ** attempt)
-                print(f"⚠️ API调用失败（尝试 {attempt + 1}/{max_retries}），{delay}秒后重试...")
-                time.sleep(delay)
+                if validate is not None:
+                    validate(response.text)
+                self.response_cache.put(cache_key, model_name, response.text)
+                return response
+            
+            # 如果所有重试都失败了，抛出最后一个异常
+            raise last_exception
+    
+    @staticmethod
+    def _passes(validate, text):
+        """缓存的文本是否通过校验（没有校验函数时总是通过）"""
+        if validate is None:
+            return True
+        try:
+            validate(text)
+        except ValueError:
+            return False
+        return True
+    
+    def generate_content_stream_with_retry(self, model_name, contents, max_retries=5, base_delay=2, use_cache=True):
+        """
+        流式调用 Gemini，边生成边产出文本片段
+        
+        输出中途断开时，重试请求会带上已生成的部分作为模型回复，并要求从断点继续，
+        已经产出的文本不会重复。
+        
+        Args:
+            model_name: 模型名称
+            contents: 请求内容（Part 列表）
+            max_retries: 最大重试次数
+            base_delay: 基础延迟时间（秒），每次重试会指数增长
+            use_cache: 是否读取响应缓存（命中时一次性产出完整文本）
         
-        # 如果所有重试都失败了，抛出最后一个异常
-        raise last_exception
+        Yields:
+            文本片段
+        """
+        if not self.gemini_client:
+            raise Exception('Gemini API密钥未配置')
+        
+        # 生成器内的 span 不设为当前 span，避免跨 yield 影响调用方的上下文
+        with telemetry.span("model.stream", activate=False, model=model_name, cached=False, retries=0,
+                            backoff_seconds=0.0) as span:
+            cache_key = self._response_cache_key(model_name, contents)
+            if use_cache:
+                cached_text = self.response_cache.get(cache_key)
+                if cached_text is not None:
+                    span.set(cached=True, chars=len(cached_text))
+                    yield cached_text
+                    return
+            
+            generated = ""
+            estimated_tokens = self._estimate_tokens(contents)
+            stream_start = time.perf_counter()
+            for attempt in range(max_retries):
+                request_contents = contents
+                if generated:
+                    from google.genai import types
+                    # 续写：原始请求 + 已生成部分 + 继续指令
+                    request_contents = [
+                        types.Content(role='user', parts=list(contents)),
+                        types.Content(role='model', parts=[types.Part(text=generated)]),
+                        types.Content(role='user', parts=[types.Part(text="输出在中途被中断了，请紧接着上文最后一个字继续输出剩余内容，不要重复已经输出的部分，也不要添加任何说明。")])
+                    ]
+                try:
+                    self.rate_limiter.acquire(estimated_tokens)
+                    usage = None
+                    for chunk in self.gemini_client.models.generate_content_stream(
+                        model=model_name,
+                        contents=request_contents
+                    ):
+                        usage = getattr(chunk, "usage_metadata", None) or usage
+                        text = chunk.text
+                        if text:
+                            if not generated:
+                                span.set(first_chunk_seconds=time.perf_counter() - stream_start)
+                            generated += text
+                            yield text
+                    span.set(chars=len(generated), tokens=getattr(usage, "total_token_count", None))
+                    self.rate_limiter.settle(estimated_tokens, getattr(usage, "total_token_count", None))
+                    self.response_cache.put(cache_key, model_name, generated)
+                    return
+                except Exception as e:
+                    if not self._is_retryable_error(e, include_network=True) or attempt == max_retries - 1:
+                        raise
+                    delay, shared = self._retry_delay(e, attempt, base_delay)
+                    self._record_retry(span, model_name, delay)
+                    print(f"⚠️ 流式输出中断（尝试 {attempt + 1}/{max_retries}，已生成 {len(generated)} 字），{delay:.1f}秒后续写...")
+                    if not shared:
+                        time.sleep(delay)
 
     def generate_copywriting(self, video_path, prompt="请分析这个视频的内容，并生成一个吸引人的抖音文案，要求：1. 突出视频亮点 2. 使用热门话题标签 3. 语言生动有趣 4. 适合抖音平台传播"):
         """使用Gemini生成文案"""
@@ -295,6 +1250,7 @@ class DouyinDownloader:
             if not upload_result['success']:
                 return upload_result
             
+            from google.genai import types
             # 获取模型名称（从配置读取，默认使用gemini-2.5-flash）
             model_name = config_manager.get("gemini_model_name", "gemini-2.5-flash")
             # 调用Gemini生成文案（使用重试机制）
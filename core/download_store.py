@@ -0,0 +1,178 @@
+"""下载存储索引：按视频 ID / 内容摘要去重，同一个视频只下载一次"""
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+class DownloadStore:
+    """
+    downloads 目录的旁路索引（downloads/.index.sqlite3）
+
+    - downloads: 视频 ID -> 文件信息（文件名、大小、sha256、标题等）
+    - digests:   内容 sha256 -> 文件名（没有视频 ID 时按内容去重）
+    - urls:      短链接 -> 视频 ID（重复粘贴同一链接时无需再请求解析接口）
+
+    每次登记只写入一行；界面、命令行和批量生成共用 downloads 目录时，各进程的登记互不覆盖。
+    旧版的 .index.json 在第一次打开时导入。
+    """
+
+    DB_FILENAME = ".index.sqlite3"
+    LEGACY_INDEX_FILENAME = ".index.json"
+
+    def __init__(self, downloads_dir):
+        self.downloads_dir = downloads_dir
+        self.db_path = os.path.join(downloads_dir, self.DB_FILENAME)
+        self._lock = threading.RLock()
+        # 下载目录在第一次访问索引时创建
+        self._conn = None
+
+    def _connection(self):
+        if self._conn is None:
+            os.makedirs(self.downloads_dir, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+            with conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS downloads ("
+                    "video_id TEXT PRIMARY KEY, filename TEXT NOT NULL, size INTEGER, sha256 TEXT, "
+                    "created_at REAL NOT NULL, info TEXT NOT NULL DEFAULT '{}')"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_downloads_filename ON downloads (filename)")
+                conn.execute("CREATE TABLE IF NOT EXISTS digests (sha256 TEXT PRIMARY KEY, filename TEXT NOT NULL)")
+                conn.execute("CREATE TABLE IF NOT EXISTS urls (url TEXT PRIMARY KEY, video_id TEXT NOT NULL)")
+            self._import_legacy(conn)
+            self._conn = conn
+        return self._conn
+
+    def _import_legacy(self, conn):
+        """导入旧版 .index.json（导入后改名为 .index.json.migrated）"""
+        legacy_path = os.path.join(self.downloads_dir, self.LEGACY_INDEX_FILENAME)
+        if not os.path.exists(legacy_path):
+            return
+        try:
+            with open(legacy_path, 'r', encoding='utf-8') as f:
+                legacy = json.load(f)
+            with conn:
+                for video_id, entry in (legacy.get('ids') or {}).items():
+                    entry = dict(entry)
+                    conn.execute(
+                        "INSERT OR IGNORE INTO downloads (video_id, filename, size, sha256, created_at, info) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        (video_id, entry.pop('filename'), entry.pop('size', None), entry.pop('sha256', None),
+                         entry.pop('created_at', time.time()), json.dumps(entry, ensure_ascii=False))
+                    )
+                conn.executemany("INSERT OR IGNORE INTO digests (sha256, filename) VALUES (?, ?)",
+                                 (legacy.get('digests') or {}).items())
+                conn.executemany("INSERT OR IGNORE INTO urls (url, video_id) VALUES (?, ?)",
+                                 (legacy.get('urls') or {}).items())
+            os.replace(legacy_path, legacy_path + '.migrated')
+        except Exception as e:
+            print(f"旧版下载索引导入失败: {e}")
+
+    @staticmethod
+    def _to_entry(row):
+        filename, size, digest, created_at, info = row
+        entry = json.loads(info or '{}')
+        entry.update({'filename': filename, 'size': size, 'sha256': digest, 'created_at': created_at})
+        return entry
+
+    def _entry_if_present(self, entry):
+        """文件仍存在且大小一致时返回带完整路径的条目"""
+        if not entry:
+            return None
+        filepath = os.path.join(self.downloads_dir, entry['filename'])
+        try:
+            if os.path.getsize(filepath) != entry.get('size'):
+                return None
+        except OSError:
+            return None
+        return dict(entry, filepath=filepath)
+
+    def lookup(self, video_id):
+        """按视频 ID 查找已下载的文件，文件已被删除或改动时清理索引并返回 None"""
+        if not video_id:
+            return None
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT filename, size, sha256, created_at, info FROM downloads WHERE video_id = ?", (video_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            entry = self._entry_if_present(self._to_entry(row))
+            if entry is None:
+                with conn:
+                    conn.execute("DELETE FROM downloads WHERE video_id = ?", (video_id,))
+            return entry
+
+    def lookup_url(self, url):
+        """按短链接查找已下载的文件"""
+        with self._lock:
+            row = self._connection().execute("SELECT video_id FROM urls WHERE url = ?", (url,)).fetchone()
+            return self.lookup(row[0]) if row else None
+
+    def lookup_digest(self, digest):
+        """按内容 sha256 查找已下载的文件"""
+        if not digest:
+            return None
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute("SELECT filename FROM digests WHERE sha256 = ?", (digest,)).fetchone()
+            if row is None:
+                return None
+            filename = row[0]
+            for entry_row in conn.execute(
+                "SELECT filename, size, sha256, created_at, info FROM downloads WHERE filename = ?", (filename,)
+            ).fetchall():
+                found = self._entry_if_present(self._to_entry(entry_row))
+                if found:
+                    return found
+            filepath = os.path.join(self.downloads_dir, filename)
+            if os.path.exists(filepath):
+                return {'filename': filename, 'filepath': filepath, 'size': os.path.getsize(filepath), 'sha256': digest}
+            with conn:
+                conn.execute("DELETE FROM digests WHERE sha256 = ?", (digest,))
+            return None
+
+    def lookup_filename(self, filename):
+        """按文件名查找登记的信息（不检查文件是否存在），没有时返回 None"""
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT filename, size, sha256, created_at, info FROM downloads WHERE filename = ? "
+                "ORDER BY created_at DESC LIMIT 1", (filename,)
+            ).fetchone()
+        return self._to_entry(row) if row else None
+
+    def record(self, video_id, filename, size, digest, **info):
+        """登记一个已下载的文件；没有视频 ID 时以内容摘要作为 ID"""
+        video_id = video_id or f"sha256:{digest}"
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO downloads (video_id, filename, size, sha256, created_at, info) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (video_id, filename, size, digest, time.time(), json.dumps(info, ensure_ascii=False))
+                )
+                if digest:
+                    conn.execute("INSERT OR REPLACE INTO digests (sha256, filename) VALUES (?, ?)", (digest, filename))
+            return video_id
+
+    def entries(self):
+        """所有已登记文件的信息"""
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT filename, size, sha256, created_at, info FROM downloads"
+            ).fetchall()
+        return [self._to_entry(row) for row in rows]
+
+    def link_url(self, url, video_id):
+        """记录短链接对应的视频 ID"""
+        if not url or not video_id:
+            return
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO urls (url, video_id) VALUES (?, ?)", (url, video_id))
@@ -0,0 +1,205 @@
+"""downloads 目录的内存索引：启动时扫描一次，之后由 download_video 直接更新，并用 watchfiles 跟踪外部改动"""
+import atexit
+import bisect
+import os
+import threading
+
+VIDEO_SUFFIX = ".mp4"
+
+
+class DownloadsIndex:
+    """
+    按修改时间排序的视频文件索引，最新 N 个 / 分页查询不再访问磁盘
+
+    每个条目包含 path、filename、size、mtime、title、author、source_url。
+
+    Args:
+        downloads_dir: 下载目录
+        store: DownloadStore，用于补全标题、作者、来源链接
+        watch: 是否启动文件监听线程
+    """
+
+    def __init__(self, downloads_dir, store=None, watch=True):
+        self.downloads_dir = os.path.abspath(downloads_dir)
+        self.store = store
+        self.watch_enabled = watch
+        self._lock = threading.RLock()
+        self._entries = {}
+        # (mtime, path) 升序，最新的在末尾
+        self._order = []
+        self._ready = threading.Event()
+        self._stop = threading.Event()
+        self._started = False
+        self._thread = None
+
+    def start(self):
+        """后台扫描目录并启动监听（只执行一次），不阻塞调用方"""
+        with self._lock:
+            if self._started:
+                return self
+            self._started = True
+        self._thread = threading.Thread(target=self._scan_and_watch, name="downloads-index", daemon=True)
+        self._thread.start()
+        # 解释器退出前结束监听，避免监听线程停在原生代码里时进程崩溃
+        atexit.register(self.stop)
+        return self
+
+    def stop(self, timeout=2.0):
+        """停止监听线程"""
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+
+    def wait_ready(self, timeout=None):
+        """等待首次扫描完成"""
+        self.start()
+        return self._ready.wait(timeout)
+
+    def _metadata(self):
+        """文件名 -> 下载索引中的标题 / 作者 / 来源链接"""
+        if self.store is None:
+            return {}
+        return {
+            info['filename']: {
+                'title': info.get('title'),
+                'author': info.get('author'),
+                'source_url': info.get('source_url')
+            }
+            for info in self.store.entries()
+        }
+
+    def _scan_and_watch(self):
+        try:
+            self._scan()
+        finally:
+            self._ready.set()
+        if self.watch_enabled:
+            # 监听要求目录已存在（下载器不在启动时创建目录）
+            os.makedirs(self.downloads_dir, exist_ok=True)
+            self._watch()
+
+    def _scan(self):
+        """一次 scandir 建立索引（DirEntry.stat 在 Windows 上不需要额外系统调用）"""
+        metadata = self._metadata()
+        entries = {}
+        try:
+            with os.scandir(self.downloads_dir) as iterator:
+                for dir_entry in iterator:
+                    if not dir_entry.name.endswith(VIDEO_SUFFIX) or not dir_entry.is_file():
+                        continue
+                    try:
+                        stat = dir_entry.stat()
+                    except OSError:
+                        continue
+                    if not stat.st_size:
+                        # 空文件（外部程序正在写入或残留的占位文件）不作为视频
+                        continue
+                    entries[dir_entry.path] = self._make_entry(dir_entry.path, stat.st_size, stat.st_mtime,
+                                                               metadata.get(dir_entry.name, {}))
+        except FileNotFoundError:
+            pass
+        with self._lock:
+            # 扫描期间 add() 登记的文件以登记的信息为准
+            for path, entry in self._entries.items():
+                entries[path] = entry
+            self._entries = entries
+            self._order = sorted((entry['mtime'], path) for path, entry in entries.items())
+
+    def _watch(self):
+        try:
+            from watchfiles import watch, Change
+        except ImportError:
+            print("⚠️ 未安装 watchfiles，下载索引不会跟踪外部改动")
+            return
+        try:
+            for changes in watch(self.downloads_dir, stop_event=self._stop, recursive=False,
+                                 watch_filter=lambda change, path: path.endswith(VIDEO_SUFFIX)):
+                for change, path in changes:
+                    if change == Change.deleted:
+                        self.remove(path)
+                    else:
+                        self.refresh(path)
+        except Exception as e:
+            print(f"⚠️ 下载目录监听已停止: {e}")
+
+    @staticmethod
+    def _make_entry(path, size, mtime, info):
+        return {
+            'path': path,
+            'filename': os.path.basename(path),
+            'size': size,
+            'mtime': mtime,
+            'title': info.get('title'),
+            'author': info.get('author'),
+            'source_url': info.get('source_url')
+        }
+
+    def _put(self, entry):
+        path = entry['path']
+        with self._lock:
+            old = self._entries.get(path)
+            if old is not None:
+                index = bisect.bisect_left(self._order, (old['mtime'], path))
+                if index < len(self._order) and self._order[index] == (old['mtime'], path):
+                    del self._order[index]
+            self._entries[path] = entry
+            bisect.insort(self._order, (entry['mtime'], path))
+
+    def add(self, path, size=None, title=None, author=None, source_url=None):
+        """登记新下载的文件（download_video 调用）"""
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        self._put(self._make_entry(path, stat.st_size if size is None else size, stat.st_mtime,
+                                   {'title': title, 'author': author, 'source_url': source_url}))
+
+    def refresh(self, path):
+        """文件新增或修改（来自监听）：重新读取大小和修改时间，保留已知的标题等信息"""
+        path = os.path.abspath(path)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            self.remove(path)
+            return
+        if not stat.st_size:
+            self.remove(path)
+            return
+        with self._lock:
+            info = self._entries.get(path) or {}
+        if not info and self.store is not None:
+            info = self.store.lookup_filename(os.path.basename(path)) or {}
+        self._put(self._make_entry(path, stat.st_size, stat.st_mtime, info))
+
+    def remove(self, path):
+        """文件被删除"""
+        path = os.path.abspath(path)
+        with self._lock:
+            old = self._entries.pop(path, None)
+            if old is None:
+                return
+            index = bisect.bisect_left(self._order, (old['mtime'], path))
+            if index < len(self._order) and self._order[index] == (old['mtime'], path):
+                del self._order[index]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def latest(self, n=1):
+        """最新的 n 个文件（新的在前）"""
+        return self.page(1, n)
+
+    def latest_path(self):
+        """最新文件的路径，没有时返回 None"""
+        latest = self.latest(1)
+        return latest[0]['path'] if latest else None
+
+    def page(self, page=1, page_size=20):
+        """分页查询（第 1 页为最新的 page_size 个）"""
+        self.wait_ready()
+        page = max(1, int(page))
+        with self._lock:
+            end = len(self._order) - (page - 1) * page_size
+            start = max(0, end - page_size)
+            if end <= 0:
+                return []
+            return [dict(self._entries[path]) for _, path in reversed(self._order[start:end])]
@@ -0,0 +1,98 @@
+"""等待 Gemini 文件处理完成（ACTIVE）：首次短延迟，之后带抖动的指数退避"""
+import asyncio
+import random
+import time
+
+
+def backoff_delays(first_delay=0.25, max_delay=5.0, multiplier=1.6, jitter=0.2):
+    """无限产出等待间隔：first_delay 起按 multiplier 增长，封顶 max_delay，并加入 ±jitter 比例的抖动"""
+    delay = first_delay
+    while True:
+        yield delay * random.uniform(1 - jitter, 1 + jitter)
+        delay = min(delay * multiplier, max_delay)
+
+
+def _state_name(file_info):
+    """兼容 SDK 返回枚举或字符串两种状态表示"""
+    state = getattr(file_info, "state", None)
+    return getattr(state, "name", None) or (str(state) if state is not None else None)
+
+
+def _is_pending_error(error):
+    """部分 SDK 在文件未最终化时会抛出 not found / not finalized 类错误，视为仍在处理"""
+    lower = str(error).lower()
+    return "not found" in lower or "not finalized" in lower
+
+
+def _check(file_info, name, start_time, polls):
+    """根据文件状态生成结果；仍在处理中返回 None"""
+    state = _state_name(file_info)
+    if state == "ACTIVE":
+        return {
+            'success': True,
+            'file': file_info,
+            'name': name,
+            'processing_seconds': time.monotonic() - start_time,
+            'polls': polls
+        }
+    if state == "FAILED":
+        return {
+            'success': False,
+            'error': '文件处理失败',
+            'processing_seconds': time.monotonic() - start_time,
+            'polls': polls
+        }
+    return None
+
+
+def wait_for_file_active(client, name, max_wait=300, **backoff):
+    """
+    轮询文件状态直到 ACTIVE / FAILED / 超时
+
+    Args:
+        client: genai.Client
+        name: 文件名（files/xxx）
+        max_wait: 最长等待秒数
+        backoff: 传给 backoff_delays 的参数
+
+    Returns:
+        dict：success、file（文件信息）、processing_seconds（处理耗时）、polls（查询次数）或 error
+    """
+    start_time = time.monotonic()
+    polls = 0
+    for delay in backoff_delays(**backoff):
+        polls += 1
+        try:
+            result = _check(client.files.get(name=name), name, start_time, polls)
+            if result:
+                return result
+        except Exception as e:
+            if not _is_pending_error(e):
+                return {'success': False, 'error': f'检查文件状态失败: {str(e)}', 'polls': polls}
+
+        remaining = max_wait - (time.monotonic() - start_time)
+        if remaining <= 0:
+            break
+        time.sleep(min(delay, remaining))
+    return {'success': False, 'error': '文件处理超时', 'processing_seconds': time.monotonic() - start_time, 'polls': polls}
+
+
+async def wait_for_file_active_async(client, name, max_wait=300, **backoff):
+    """wait_for_file_active 的 asyncio 版本：使用 client.aio，等待期间不占用线程"""
+    start_time = time.monotonic()
+    polls = 0
+    for delay in backoff_delays(**backoff):
+        polls += 1
+        try:
+            result = _check(await client.aio.files.get(name=name), name, start_time, polls)
+            if result:
+                return result
+        except Exception as e:
+            if not _is_pending_error(e):
+                return {'success': False, 'error': f'检查文件状态失败: {str(e)}', 'polls': polls}
+
+        remaining = max_wait - (time.monotonic() - start_time)
+        if remaining <= 0:
+            break
+        await asyncio.sleep(min(delay, remaining))
+    return {'success': False, 'error': '文件处理超时', 'processing_seconds': time.monotonic() - start_time, 'polls': polls}
@@ -0,0 +1,118 @@
+"""Gemini 客户端池：按 API 密钥复用 genai.Client，多个密钥时按剩余配额选择"""
+import threading
+from contextlib import contextmanager
+
+from .config_manager import config_manager
+from .gemini_uploads import api_key_fingerprint
+from .rate_limiter import get_rate_limiter
+
+
+def configured_api_keys():
+    """
+    配置中的全部密钥（按顺序去重）
+
+    gemini_api_keys 为列表（或逗号 / 换行分隔的字符串），gemini_api_key 为单个密钥，两者合并。
+    """
+    keys = config_manager.get("gemini_api_keys") or []
+    if isinstance(keys, str):
+        keys = keys.replace(',', '\n').splitlines()
+    keys = list(keys) + [config_manager.get("gemini_api_key", "")]
+    result = []
+    for key in keys:
+        key = (key or "").strip()
+        if key and key not in result:
+            result.append(key)
+    return result
+
+
+class GeminiClientPool:
+    """
+    每个密钥一个 genai.Client（连接池随客户端复用），创建后在所有会话和线程间共享，不再替换或关闭
+
+    每个密钥有独立的限速器（get_rate_limiter("gemini:<密钥指纹>")），配额按密钥计算。
+    """
+
+    def __init__(self):
+        self._clients = {}
+        # 每个密钥上正在执行的作业数（作业刚开始时还没有消耗配额，选择密钥时一并计入）
+        self._active = {}
+        self._lock = threading.Lock()
+
+    def client(self, api_key):
+        """密钥对应的客户端（第一次使用时创建）"""
+        client = self._clients.get(api_key)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(api_key)
+                if client is None:
+                    from google import genai
+                    client = self._clients[api_key] = genai.Client(api_key=api_key)
+        return client
+
+    @staticmethod
+    def rate_limiter(api_key):
+        """密钥对应的限速器"""
+        return get_rate_limiter(f"gemini:{api_key_fingerprint(api_key)}")
+
+    def _choose(self, keys):
+        if len(keys) <= 1:
+            return keys[0] if keys else None
+
+        def score(key):
+            stats = self.rate_limiter(key).stats()
+            return (
+                -stats['paused_for'],
+                stats['available_requests'] - stats['queue_depth'] - self._active.get(key, 0),
+                stats['available_tokens'] or 0
+            )
+
+        return max(keys, key=score)
+
+    def choose_key(self, keys=None):
+        """
+        选择剩余配额最多的密钥：优先未被服务端暂停的，其次是可用请求数减去排队数和使用中作业数最大的，再比较剩余 token
+
+        Returns:
+            密钥，没有配置任何密钥时返回 None
+        """
+        keys = configured_api_keys() if keys is None else keys
+        with self._lock:
+            return self._choose(keys)
+
+    @contextmanager
+    def lease(self, api_key=None):
+        """
+        在 with 块内把密钥计为使用中，产出该密钥
+
+        不指定密钥时选择剩余配额最多的一个；选择和计数在同一把锁内完成，同时开始的作业会分散到不同密钥
+        """
+        keys = configured_api_keys() if api_key is None else None
+        with self._lock:
+            if api_key is None:
+                api_key = self._choose(keys)
+            if api_key:
+                self._active[api_key] = self._active.get(api_key, 0) + 1
+        try:
+            yield api_key
+        finally:
+            if api_key:
+                with self._lock:
+                    self._active[api_key] -= 1
+
+    def key_for_account(self, account):
+        """根据密钥指纹找回配置中的密钥（已上传文件只能用上传时的密钥访问）"""
+        for key in configured_api_keys():
+            if api_key_fingerprint(key) == account:
+                return key
+        return None
+
+    def stats(self):
+        """每个已配置密钥的限速器状态和使用中作业数（以指纹标识，不暴露明文）"""
+        return {
+            api_key_fingerprint(key): dict(self.rate_limiter(key).stats(), active=self._active.get(key, 0))
+            for key in configured_api_keys()
+        }
+
+
+# 进程内共享的客户端池
+gemini_clients = GeminiClientPool()
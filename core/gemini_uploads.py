@@ -0,0 +1,140 @@
+"""Gemini 上传登记表：按内容摘要复用已上传的文件，并清理过期的远端文件"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+# Gemini Files API 的文件在创建 48 小时后过期
+DEFAULT_FILE_LIFETIME = 48 * 3600
+
+
+def api_key_fingerprint(api_key):
+    """API 密钥的指纹（上传的文件只对同一个项目可见，登记时按密钥隔离，但不落盘明文）"""
+    return hashlib.sha256((api_key or '').encode('utf-8')).hexdigest()[:16]
+
+
+class UploadRegistry:
+    """
+    已上传文件的登记表（SQLite）
+
+    - file_digests:   (路径, 大小, 修改时间) -> sha256，避免每次都重新读整个视频计算摘要
+    - gemini_uploads: (密钥指纹, sha256) -> 远端 name / file_uri / 过期时间
+    """
+
+    def __init__(self, db_path, expiry_margin=3600):
+        self.db_path = db_path
+        # 距离过期不足该时长的文件不再复用（留出生成文案所需的时间）
+        self.expiry_margin = expiry_margin
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS file_digests ("
+                "path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, sha256 TEXT NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS gemini_uploads ("
+                "account TEXT NOT NULL, sha256 TEXT NOT NULL, name TEXT NOT NULL, file_uri TEXT NOT NULL, "
+                "mime_type TEXT, created_at REAL NOT NULL, expires_at REAL NOT NULL, "
+                "PRIMARY KEY (account, sha256))"
+            )
+
+    def file_digest(self, path):
+        """计算文件 sha256；文件未变化（大小和修改时间一致）时直接返回缓存结果"""
+        stat = os.stat(path)
+        abs_path = os.path.abspath(path)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT sha256 FROM file_digests WHERE path = ? AND size = ? AND mtime_ns = ?",
+                (abs_path, stat.st_size, stat.st_mtime_ns)
+            ).fetchone()
+        if row:
+            return row[0]
+
+        sha256 = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                sha256.update(chunk)
+        digest = sha256.hexdigest()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO file_digests (path, size, mtime_ns, sha256) VALUES (?, ?, ?, ?)",
+                (abs_path, stat.st_size, stat.st_mtime_ns, digest)
+            )
+        return digest
+
+    def lookup(self, account, digest):
+        """查找未临近过期的上传记录"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT name, file_uri, mime_type, expires_at FROM gemini_uploads "
+                "WHERE account = ? AND sha256 = ? AND expires_at > ?",
+                (account, digest, time.time() + self.expiry_margin)
+            ).fetchone()
+        if not row:
+            return None
+        return {'name': row[0], 'file_uri': row[1], 'mime_type': row[2], 'expires_at': row[3]}
+
+    def digest_for_uri(self, file_uri):
+        """根据 file_uri 反查内容摘要"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT sha256 FROM gemini_uploads WHERE file_uri = ?", (file_uri,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def account_for_uri(self, file_uri):
+        """根据 file_uri 反查上传时使用的密钥指纹"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT account FROM gemini_uploads WHERE file_uri = ?", (file_uri,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def record(self, account, digest, name, file_uri, mime_type=None, expires_at=None):
+        """登记一次上传"""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO gemini_uploads "
+                "(account, sha256, name, file_uri, mime_type, created_at, expires_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (account, digest, name, file_uri, mime_type, now, expires_at or now + DEFAULT_FILE_LIFETIME)
+            )
+
+    def forget(self, account, digest):
+        """删除一条上传记录"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM gemini_uploads WHERE account = ? AND sha256 = ?", (account, digest))
+
+    def stale_entries(self, account):
+        """返回已过期或临近过期的上传记录"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT sha256, name FROM gemini_uploads WHERE account = ? AND expires_at <= ?",
+                (account, time.time() + self.expiry_margin)
+            ).fetchall()
+        return [{'sha256': row[0], 'name': row[1]} for row in rows]
+
+    def sweep(self, client, account):
+        """
+        清理临近过期的远端文件：删除远端文件并移除登记
+
+        Returns:
+            清理的文件数
+        """
+        removed = 0
+        for entry in self.stale_entries(account):
+            try:
+                client.files.delete(name=entry['name'])
+            except Exception as e:
+                # 远端文件已过期/已删除时同样移除登记
+                lower = str(e).lower()
+                if "not found" not in lower and "404" not in lower and "403" not in lower:
+                    print(f"⚠️ 清理 Gemini 文件失败 {entry['name']}: {e}")
+                    continue
+            self.forget(account, entry['sha256'])
+            removed += 1
+        return removed
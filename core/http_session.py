@@ -0,0 +1,103 @@
+"""共享 HTTP 连接池：keep-alive、按主机限流、可调重试，并统计连接复用情况"""
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+
+class ConnectionStats:
+    """线程安全的请求数 / 新建连接数计数器，用来证明连接确实被复用"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.new_connections = 0
+
+    def record_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def record_new_connection(self):
+        with self._lock:
+            self.new_connections += 1
+
+    def snapshot(self):
+        """返回当前统计：请求数、新建连接数、复用次数和复用率"""
+        with self._lock:
+            requests_count = self.requests
+            new_connections = self.new_connections
+        reused = max(0, requests_count - new_connections)
+        return {
+            'requests': requests_count,
+            'new_connections': new_connections,
+            'reused_connections': reused,
+            'reuse_ratio': (reused / requests_count) if requests_count else 0.0
+        }
+
+
+def _counting_pool_class(base_class, stats):
+    """生成一个在建立 TCP/TLS 连接时计数的连接池子类（含断线后的重连）"""
+    conn_base = base_class.ConnectionCls
+
+    def connect(self):
+        stats.record_new_connection()
+        return conn_base.connect(self)
+
+    conn_class = type(f"Counting{conn_base.__name__}", (conn_base,), {'connect': connect})
+    return type(f"Counting{base_class.__name__}", (base_class,), {'ConnectionCls': conn_class})
+
+
+class CountingHTTPAdapter(HTTPAdapter):
+    """在 requests 默认适配器基础上记录请求数与新建连接数"""
+
+    def __init__(self, stats, **kwargs):
+        # init_poolmanager 会在父类构造函数中被调用，必须先设置 stats
+        self.stats = stats
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _counting_pool_class(HTTPConnectionPool, self.stats),
+            'https': _counting_pool_class(HTTPSConnectionPool, self.stats),
+        }
+
+    def send(self, request, **kwargs):
+        self.stats.record_request()
+        return super().send(request, **kwargs)
+
+
+class PooledSession(requests.Session):
+    """
+    所有出站请求共用的会话
+
+    - 每个主机一个 keep-alive 连接池，pool_maxsize 即单主机最大并发连接数（超出时阻塞等待）
+    - 对连接错误和 429/5xx 自动重试（指数退避，遵守 Retry-After）
+    - urllib3 连接池本身是线程安全的，可在批量下载的多个线程间共享
+    """
+
+    def __init__(self, pool_connections=10, pool_maxsize=8, max_retries=3, backoff_factor=0.5):
+        super().__init__()
+        self.stats = ConnectionStats()
+        retry = Retry(
+            total=max_retries,
+            connect=max_retries,
+            read=max_retries,
+            status=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(['GET', 'HEAD']),
+            respect_retry_after_header=True,
+            raise_on_status=False
+        )
+        adapter = CountingHTTPAdapter(
+            self.stats,
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            max_retries=retry,
+            pool_block=True
+        )
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+        self.headers.update({'Connection': 'keep-alive'})
@@ -0,0 +1,112 @@
+"""剪映草稿目录索引：os.scandir 扫描一次并缓存，只有草稿根目录的修改时间变化时才重新扫描"""
+import os
+import sys
+import threading
+
+from .config_manager import config_manager
+
+CONFIG_KEY = "jianying_drafts_dir"
+
+
+def default_drafts_dir():
+    """当前系统下剪映专业版默认的草稿目录"""
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser(os.path.join("~", "AppData", "Local"))
+        return os.path.join(base, "JianyingPro", "User Data", "Projects", "com.lveditor.draft")
+    return os.path.expanduser(os.path.join("~", "Movies", "JianyingPro", "User Data", "Projects", "com.lveditor.draft"))
+
+
+def creation_time(stat):
+    """
+    文件夹创建时间
+
+    macOS / 部分 BSD 以及 Python 3.12+ 的 Windows 有 st_birthtime；Windows 的 st_ctime 即创建时间；
+    其他系统没有创建时间，取 st_ctime 与 st_mtime 中较早的一个
+    """
+    birthtime = getattr(stat, 'st_birthtime', None)
+    if birthtime:
+        return birthtime
+    if sys.platform == "win32":
+        return stat.st_ctime
+    return min(stat.st_ctime, stat.st_mtime)
+
+
+class DraftIndex:
+    """
+    剪映草稿文件夹列表（按创建时间倒序）
+
+    新建、删除、重命名草稿都会改变根目录的修改时间，因此根目录 mtime 不变时直接返回缓存，
+    刷新只需要一次 stat。
+
+    Args:
+        root: 草稿根目录；为空时读取配置 jianying_drafts_dir，未配置则使用系统默认目录
+    """
+
+    def __init__(self, root=None):
+        self._root = root
+        self._lock = threading.Lock()
+        self._scanned_root = None
+        self._scanned_mtime = None
+        self._folders = []
+
+    @property
+    def root(self):
+        if self._root:
+            return self._root
+        return os.path.expanduser(config_manager.get(CONFIG_KEY) or default_drafts_dir())
+
+    def folders(self, force=False):
+        """
+        草稿文件夹列表，每项包含 name、path、create_time
+
+        Args:
+            force: 忽略缓存重新扫描
+        """
+        root = self.root
+        try:
+            mtime = os.stat(root).st_mtime_ns
+        except OSError:
+            with self._lock:
+                self._scanned_root, self._scanned_mtime, self._folders = root, None, []
+            return []
+        with self._lock:
+            if not force and self._scanned_root == root and self._scanned_mtime == mtime:
+                return list(self._folders)
+            folders = self._scan(root)
+            self._scanned_root, self._scanned_mtime, self._folders = root, mtime, folders
+            return list(folders)
+
+    def refresh_async(self):
+        """后台预热缓存（启动时调用，不阻塞界面构建）"""
+        threading.Thread(target=self.folders, name="jianying-drafts-scan", daemon=True).start()
+
+    @staticmethod
+    def _scan(root):
+        folders = []
+        try:
+            with os.scandir(root) as iterator:
+                for entry in iterator:
+                    # 过滤掉以.开头的隐藏文件夹
+                    if entry.name.startswith('.'):
+                        continue
+                    try:
+                        if not entry.is_dir():
+                            continue
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    folders.append({
+                        'name': entry.name,
+                        'path': entry.path,
+                        'create_time': creation_time(stat)
+                    })
+        except OSError as e:
+            print(f"读取文件夹列表失败: {e}")
+            return []
+        # 按创建时间倒序排列（最新的在前）
+        folders.sort(key=lambda folder: folder['create_time'], reverse=True)
+        return folders
+
+
+# 全局草稿索引
+draft_index = DraftIndex()
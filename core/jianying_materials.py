@@ -0,0 +1,414 @@
+"""剪映草稿素材索引：流式解析 draft_content.json，把素材和文字写入 SQLite，只重新解析有变化的草稿
+
+草稿文件可能有几十 MB（大部分是 tracks），这里不用 json.load 整体加载，而是分块读取：
+只把 materials 下的每个素材对象单独解码，其他部分直接跳过，内存占用取决于单个素材的大小。
+"""
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from .jianying_drafts import draft_index
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_DB_PATH = os.path.join(BASE_DIR, "cache", "jianying_materials.sqlite3")
+
+# Windows 版为 draft_content.json，macOS 版为 draft_info.json
+DRAFT_CONTENT_FILES = ("draft_content.json", "draft_info.json")
+
+CHUNK_SIZE = 64 * 1024
+
+_STRING_SPECIAL = re.compile(r'["\\]')
+_SCALAR_END = re.compile(r'[\s,\]}]')
+_WHITESPACE = " \t\r\n"
+_DECODER = json.JSONDecoder()
+_HTML_TAG = re.compile(r'<[^>]*>')
+
+
+_MISSING = object()
+
+
+class DraftParseError(ValueError):
+    """草稿 JSON 格式不正确（或已加密）"""
+
+
+class _StreamReader:
+    """
+    分块读取的 JSON 扫描器
+
+    已完整读入缓冲区的值直接交给 C 实现的 raw_decode 解码或跳过；跨越缓冲区末尾的对象/数组
+    才逐层进入，因此只有沿着缓冲区边界的那一条路径在 Python 中处理。
+    补充数据时丢弃已处理的内容，缓冲区大小约为 CHUNK_SIZE 加上正在解码的值。
+    """
+
+    def __init__(self, f, chunk_size=CHUNK_SIZE):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.pos = 0
+        # 正在解码的值的起始位置（可嵌套），补充数据时保留这些位置之后的内容
+        self.marks = []
+        self.eof = False
+
+    def _fill(self):
+        """补充一块数据，返回是否读到新内容"""
+        if self.eof:
+            return False
+        data = self.f.read(self.chunk_size)
+        if not data:
+            self.eof = True
+            return False
+        keep = min(self.pos, self.marks[0]) if self.marks else self.pos
+        if keep:
+            self.buf = self.buf[keep:]
+            self.pos -= keep
+            self.marks = [mark - keep for mark in self.marks]
+        self.buf += data
+        return True
+
+    def peek(self):
+        """跳过空白，返回下一个字符（结束时返回空串）"""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise DraftParseError(f"期望 {char!r}，实际为 {self.peek()!r}")
+        self.pos += 1
+
+    def _search(self, pattern):
+        """从当前位置查找 pattern，必要时补充数据，返回匹配位置"""
+        while True:
+            match = pattern.search(self.buf, self.pos)
+            if match:
+                return match.start()
+            self.pos = len(self.buf)
+            if not self._fill():
+                raise DraftParseError("文件意外结束")
+
+    def _skip_string(self):
+        """pos 位于开头的引号"""
+        self.pos += 1
+        while True:
+            index = self._search(_STRING_SPECIAL)
+            if self.buf[index] == '"':
+                self.pos = index + 1
+                return
+            # 反斜杠转义：确保被转义的字符已读入后一起跳过
+            self.pos = index
+            while self.pos + 1 >= len(self.buf):
+                if not self._fill():
+                    raise DraftParseError("文件意外结束")
+            self.pos += 2
+
+    def _decode_buffered(self):
+        """当前值（对象、数组或字符串）已完整在缓冲区中时解码并前进，否则返回 _MISSING"""
+        try:
+            value, end = _DECODER.raw_decode(self.buf, self.pos)
+        except ValueError:
+            return _MISSING
+        self.pos = end
+        return value
+
+    def skip_value(self):
+        """跳过一个完整的值"""
+        char = self.peek()
+        if char in ('{', '[', '"') and self._decode_buffered() is not _MISSING:
+            return
+        if char == '{':
+            for _ in self.iter_object():
+                self.skip_value()
+        elif char == '[':
+            for _ in self.iter_array():
+                self.skip_value()
+        elif char == '"':
+            self._skip_string()
+        elif char:
+            # 数字、true/false/null：可能在缓冲区末尾被截断，不能直接 raw_decode
+            while True:
+                match = _SCALAR_END.search(self.buf, self.pos)
+                if match:
+                    self.pos = match.start()
+                    return
+                self.pos = len(self.buf)
+                if not self._fill():
+                    return
+        else:
+            raise DraftParseError("文件意外结束")
+
+    def read_value(self):
+        """解码一个完整的值（只用于素材对象、键名等小块数据）"""
+        char = self.peek()
+        if char in ('{', '[', '"'):
+            value = self._decode_buffered()
+            if value is not _MISSING:
+                return value
+        self.marks.append(self.pos)
+        try:
+            self.skip_value()
+            text = self.buf[self.marks[-1]:self.pos]
+        finally:
+            self.marks.pop()
+        try:
+            return json.loads(text)
+        except ValueError as e:
+            raise DraftParseError(str(e))
+
+    def iter_object(self):
+        """逐个产出对象的键，调用方必须读取或跳过对应的值"""
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self.read_value()
+            self.expect(':')
+            yield key
+            char = self.peek()
+            self.pos += 1
+            if char == '}':
+                return
+            if char != ',':
+                raise DraftParseError(f"对象中出现意外字符 {char!r}")
+
+    def iter_array(self):
+        """逐个产出数组元素的序号，调用方必须读取或跳过对应的值"""
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        index = 0
+        while True:
+            yield index
+            index += 1
+            char = self.peek()
+            self.pos += 1
+            if char == ']':
+                return
+            if char != ',':
+                raise DraftParseError(f"数组中出现意外字符 {char!r}")
+
+
+def _text_content(material):
+    """文字素材的纯文本：新版 content 是带样式的 JSON 字符串，旧版是带标签的文本"""
+    content = material.get('content') or material.get('text') or ""
+    if isinstance(content, str) and content.startswith('{'):
+        try:
+            content = json.loads(content).get('text', "")
+        except (ValueError, AttributeError):
+            pass
+    if not isinstance(content, str):
+        return ""
+    return _HTML_TAG.sub("", content).strip("[] \n")
+
+
+def _material_entry(kind, material):
+    """把一个素材对象转换为索引条目，没有可搜索内容的素材（变速、画布等）返回 None"""
+    if not isinstance(material, dict):
+        return None
+    text = _text_content(material) if kind == 'texts' else ""
+    name = material.get('material_name') or material.get('name') or ""
+    path = material.get('path') or material.get('file_Path') or ""
+    if not (name or path or text):
+        return None
+    duration = material.get('duration')
+    return {
+        'kind': kind,
+        'name': name if isinstance(name, str) else str(name),
+        'path': path if isinstance(path, str) else str(path),
+        'text': text,
+        # 剪映的时长单位为微秒
+        'duration': duration / 1_000_000 if isinstance(duration, (int, float)) else None
+    }
+
+
+def parse_draft_content(path, chunk_size=CHUNK_SIZE):
+    """
+    流式解析草稿文件
+
+    Returns:
+        (草稿总时长秒数, 素材条目列表)
+    """
+    duration = None
+    entries = []
+    with open(path, 'r', encoding='utf-8-sig') as f:
+        reader = _StreamReader(f, chunk_size)
+        if reader.peek() != '{':
+            raise DraftParseError("不是 JSON 对象（草稿可能已加密）")
+        for key in reader.iter_object():
+            if key == 'duration':
+                value = reader.read_value()
+                if isinstance(value, (int, float)):
+                    duration = value / 1_000_000
+            elif key == 'materials' and reader.peek() == '{':
+                for kind in reader.iter_object():
+                    if reader.peek() != '[':
+                        reader.skip_value()
+                        continue
+                    for _ in reader.iter_array():
+                        entry = _material_entry(kind, reader.read_value())
+                        if entry:
+                            entries.append(entry)
+            else:
+                reader.skip_value()
+    return duration, entries
+
+
+def find_draft_content(folder_path):
+    """草稿文件夹中的内容文件，不存在时返回 None"""
+    for name in DRAFT_CONTENT_FILES:
+        path = os.path.join(folder_path, name)
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+class MaterialIndex:
+    """
+    草稿素材索引（SQLite）
+
+    update() 对比每个草稿内容文件的修改时间和大小，只重新解析有变化的草稿，并删除已不存在的草稿；
+    search() 只查询数据库，不读取草稿文件。
+
+    Args:
+        db_path: 数据库路径，默认 cache/jianying_materials.sqlite3
+        drafts: DraftIndex，默认使用全局草稿索引
+    """
+
+    def __init__(self, db_path=DEFAULT_DB_PATH, drafts=None):
+        self.db_path = db_path
+        self.drafts = drafts or draft_index
+        self._lock = threading.Lock()
+        self._update_lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS drafts ("
+                "folder TEXT PRIMARY KEY, name TEXT NOT NULL, content_path TEXT, mtime_ns INTEGER, "
+                "size INTEGER, duration REAL, material_count INTEGER NOT NULL DEFAULT 0, error TEXT, "
+                "indexed_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS materials ("
+                "folder TEXT NOT NULL, kind TEXT NOT NULL, name TEXT, path TEXT, text TEXT, duration REAL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_materials_folder ON materials (folder)")
+
+    def _indexed(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT folder, content_path, mtime_ns, size FROM drafts").fetchall()
+        return {row[0]: row[1:] for row in rows}
+
+    def _replace(self, folder, name, content_path, mtime_ns, size, duration, entries, error=None):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM materials WHERE folder = ?", (folder,))
+            self._conn.executemany(
+                "INSERT INTO materials (folder, kind, name, path, text, duration) VALUES (?, ?, ?, ?, ?, ?)",
+                [(folder, e['kind'], e['name'], e['path'], e['text'], e['duration']) for e in entries]
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO drafts (folder, name, content_path, mtime_ns, size, duration, "
+                "material_count, error, indexed_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (folder, name, content_path, mtime_ns, size, duration, len(entries), error, time.time())
+            )
+
+    def _remove(self, folders):
+        with self._lock, self._conn:
+            for folder in folders:
+                self._conn.execute("DELETE FROM materials WHERE folder = ?", (folder,))
+                self._conn.execute("DELETE FROM drafts WHERE folder = ?", (folder,))
+
+    def update(self):
+        """
+        同步索引（已有更新在进行时直接返回 None）
+
+        Returns:
+            {'parsed': 重新解析的草稿数, 'unchanged': 未变化数, 'removed': 删除数, 'failed': 解析失败数, 'seconds': 耗时}
+        """
+        if not self._update_lock.acquire(blocking=False):
+            return None
+        try:
+            start = time.time()
+            stats = {'parsed': 0, 'unchanged': 0, 'removed': 0, 'failed': 0}
+            indexed = self._indexed()
+            seen = set()
+            for folder in self.drafts.folders():
+                seen.add(folder['path'])
+                content_path = find_draft_content(folder['path'])
+                try:
+                    stat = os.stat(content_path) if content_path else None
+                except OSError:
+                    stat = None
+                signature = (content_path, stat.st_mtime_ns, stat.st_size) if stat else (None, None, None)
+                if indexed.get(folder['path']) == signature:
+                    stats['unchanged'] += 1
+                    continue
+                duration, entries, error = None, [], None
+                if content_path:
+                    try:
+                        duration, entries = parse_draft_content(content_path)
+                    except (OSError, UnicodeDecodeError, DraftParseError) as e:
+                        error = str(e)
+                        stats['failed'] += 1
+                self._replace(folder['path'], folder['name'], *signature, duration, entries, error)
+                stats['parsed'] += 1
+            removed = [folder for folder in indexed if folder not in seen]
+            self._remove(removed)
+            stats['removed'] = len(removed)
+            stats['seconds'] = time.time() - start
+            return stats
+        finally:
+            self._update_lock.release()
+
+    def update_async(self):
+        """后台同步索引"""
+        threading.Thread(target=self.update, name="jianying-materials-index", daemon=True).start()
+
+    def search(self, query, limit=100):
+        """
+        按素材名、路径或文字内容搜索
+
+        Returns:
+            条目列表（draft、kind、name、path、text、duration），按草稿名和类型排序
+        """
+        pattern = f"%{query.strip()}%"
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT d.name, m.kind, m.name, m.path, m.text, m.duration FROM materials m "
+                "JOIN drafts d ON d.folder = m.folder "
+                "WHERE m.name LIKE ? OR m.path LIKE ? OR m.text LIKE ? "
+                "ORDER BY d.name, m.kind LIMIT ?",
+                (pattern, pattern, pattern, limit)
+            ).fetchall()
+        keys = ('draft', 'kind', 'name', 'path', 'text', 'duration')
+        return [dict(zip(keys, row)) for row in rows]
+
+    def summary(self):
+        """已索引的草稿数、素材数和解析失败数"""
+        with self._lock:
+            drafts, materials, failed = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(material_count), 0), COUNT(error) FROM drafts"
+            ).fetchone()
+        return {'drafts': drafts, 'materials': materials, 'failed': failed}
+
+
+# 全局素材索引（首次使用时创建数据库）
+_material_index = None
+_material_index_lock = threading.Lock()
+
+
+def get_material_index():
+    global _material_index
+    with _material_index_lock:
+        if _material_index is None:
+            _material_index = MaterialIndex()
+        return _material_index
@@ -0,0 +1,439 @@
+"""文案生成作业队列：作业持久化到 SQLite，后台线程池执行，按阶段保存检查点，重启后从最后完成的阶段继续"""
+import atexit
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from .config_manager import config_manager
+from . import pipeline
+from . import telemetry
+
+# 作业阶段（按执行顺序），每完成一个阶段写入一次检查点
+STAGES = ('queued', 'uploaded', 'transcript', 'analysis', 'script')
+FINISHED_STATUSES = ('done', 'failed')
+
+_COLUMNS = (
+    'id', 'status', 'stage', 'video_path', 'account_positioning', 'force_regenerate',
+    'file_uri', 'transcript', 'analysis', 'script', 'error', 'log', 'created_at', 'updated_at', 'owner'
+)
+
+
+def _boot_id():
+    """本次开机的标识（Linux），用于判断同一台机器上的进程号是否属于本次开机"""
+    try:
+        with open("/proc/sys/kernel/random/boot_id", 'r') as f:
+            return f.read().strip()
+    except OSError:
+        return ""
+
+
+def _pid_alive(pid):
+    """同一台机器上的进程是否仍在运行（只在 POSIX 上判断，其他系统返回 None 表示未知）"""
+    if os.name != 'posix':
+        return None
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    except OSError:
+        return None
+    return True
+
+
+class JobStore:
+    """作业表（SQLite），保存每个作业的状态、阶段结果和日志"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, status TEXT NOT NULL, stage TEXT NOT NULL, video_path TEXT, "
+                "account_positioning TEXT, force_regenerate INTEGER NOT NULL DEFAULT 0, "
+                "file_uri TEXT, transcript TEXT, analysis TEXT, script TEXT, error TEXT, "
+                "log TEXT NOT NULL DEFAULT '[]', created_at REAL NOT NULL, updated_at REAL NOT NULL, owner TEXT)"
+            )
+            # 旧版数据库没有 owner 列，这些作业视为无主作业
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+            if 'owner' not in columns:
+                self._conn.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at)")
+            # 每个使用作业表的进程（JobManager）一行，定期刷新 heartbeat_at
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS job_owners ("
+                "owner TEXT PRIMARY KEY, host TEXT NOT NULL, pid INTEGER NOT NULL, boot_id TEXT NOT NULL, "
+                "heartbeat_at REAL NOT NULL)"
+            )
+
+    def _to_dict(self, row):
+        job = dict(zip(_COLUMNS, row))
+        job['log'] = json.loads(job['log'] or '[]')
+        job['force_regenerate'] = bool(job['force_regenerate'])
+        return job
+
+    def create(self, job):
+        """新增作业"""
+        values = dict(job, log=json.dumps(job.get('log', []), ensure_ascii=False),
+                      force_regenerate=int(bool(job.get('force_regenerate'))))
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"INSERT INTO jobs ({', '.join(_COLUMNS)}) VALUES ({', '.join('?' * len(_COLUMNS))})",
+                [values.get(column) for column in _COLUMNS]
+            )
+
+    def get(self, job_id):
+        """读取作业，不存在时返回 None"""
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return self._to_dict(row) if row else None
+
+    def update(self, job_id, **fields):
+        """更新作业字段（检查点）"""
+        if 'log' in fields:
+            fields['log'] = json.dumps(fields['log'], ensure_ascii=False)
+        fields['updated_at'] = time.time()
+        assignments = ', '.join(f"{column} = ?" for column in fields)
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"UPDATE jobs SET {assignments} WHERE id = ?", list(fields.values()) + [job_id]
+            )
+
+    def claim(self, job_id, owner):
+        """把本进程排队中的作业标记为运行中；已被领取或属于其他进程时返回 False"""
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = 'running', updated_at = ? WHERE id = ? AND status = 'queued' AND owner = ?",
+                (time.time(), job_id, owner)
+            )
+        return cursor.rowcount == 1
+
+    def heartbeat(self, owner, host, pid, boot_id):
+        """登记或刷新本进程的心跳"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO job_owners (owner, host, pid, boot_id, heartbeat_at) VALUES (?, ?, ?, ?, ?)",
+                (owner, host, pid, boot_id, time.time())
+            )
+
+    def release_owner(self, owner):
+        """进程正常退出时注销，剩下的未完成作业可以立即被其他进程接管"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM job_owners WHERE owner = ?", (owner,))
+
+    def adopt_orphans(self, owner, lease_seconds):
+        """
+        接管所属进程已经退出的未完成作业：放回队列并改为本进程所有，返回接管的作业 ID（按创建顺序）
+
+        所属进程已注销、心跳超过 lease_seconds 未刷新，或与本进程在同一次开机的同一台机器上且进程号已不存在时视为已退出。
+        其他仍在运行的进程的作业（包括排队中的）不会被接管。
+        """
+        host, boot_id, now = socket.gethostname(), _boot_id(), time.time()
+        adopted = []
+        with self._lock, self._conn:
+            # 立即取得写锁，多个进程同时接管时依次进行，同一个作业只会被一个进程接管
+            self._conn.execute("BEGIN IMMEDIATE")
+            owners = {row[0]: row[1:] for row in self._conn.execute(
+                "SELECT owner, host, pid, boot_id, heartbeat_at FROM job_owners"
+            )}
+            rows = self._conn.execute(
+                "SELECT id, owner FROM jobs WHERE status IN ('queued', 'running') "
+                "AND (owner IS NULL OR owner != ?) ORDER BY created_at", (owner,)
+            ).fetchall()
+            alive = {}
+            for job_id, other in rows:
+                if other not in alive:
+                    info = owners.get(other)
+                    alive[other] = info is not None and self._owner_alive(info, host, boot_id, now, lease_seconds)
+                    if info is not None and not alive[other]:
+                        self._conn.execute("DELETE FROM job_owners WHERE owner = ?", (other,))
+                if not alive[other]:
+                    adopted.append(job_id)
+            self._conn.executemany(
+                "UPDATE jobs SET status = 'queued', owner = ?, updated_at = ? WHERE id = ?",
+                [(owner, now, job_id) for job_id in adopted]
+            )
+        return adopted
+
+    @staticmethod
+    def _owner_alive(info, host, boot_id, now, lease_seconds):
+        other_host, other_pid, other_boot_id, heartbeat_at = info
+        if other_host == host and boot_id and other_boot_id == boot_id and _pid_alive(other_pid) is False:
+            return False
+        return now - heartbeat_at < lease_seconds
+
+    def recent(self, limit=20):
+        """最近的作业（新的在前）"""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+
+class JobManager:
+    """
+    作业调度：提交后立即返回作业 ID，由后台线程池执行流水线
+
+    UI 通过 subscribe(job_id) 订阅进度快照，页面关闭不会中断作业；进程重启后调用 start() 继续未完成的作业。
+
+    多个进程（界面、命令行、批量生成）共用同一个作业表：每个作业记录所属进程，进程定期刷新心跳，
+    只执行本进程提交的作业；调用过 start() 的进程还会接管所属进程已退出的作业。
+
+    Args:
+        downloader: DouyinDownloader
+        db_path: 作业数据库路径，默认 cache/jobs.sqlite3
+        max_workers: 同时执行的作业数
+        lease_seconds: 心跳超过该秒数未刷新时，其他进程可以接管该进程的作业
+    """
+
+    def __init__(self, downloader, db_path=None, max_workers=None, lease_seconds=None):
+        if db_path is None:
+            base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+            db_path = os.path.join(base_dir, "cache", "jobs.sqlite3")
+        self.downloader = downloader
+        self.store = JobStore(db_path)
+        self.max_workers = max_workers or config_manager.get("job_workers", 2)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="copywriting-job")
+        self._cond = threading.Condition()
+        # 运行中作业的内存快照（含流式输出中的部分脚本），version 每次变化递增
+        self._live = {}
+        self._started = False
+        self.lease_seconds = lease_seconds or config_manager.get("job_lease_seconds", 60)
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._heartbeat_thread = None
+        self._stop = threading.Event()
+
+    def _ensure_heartbeat(self):
+        """登记本进程并启动心跳线程（第一次提交或恢复作业时）"""
+        with self._cond:
+            if self._heartbeat_thread is not None:
+                return
+            self.store.heartbeat(self.owner, socket.gethostname(), os.getpid(), _boot_id())
+            self._heartbeat_thread = threading.Thread(target=self._heartbeat_loop, name="job-heartbeat", daemon=True)
+            self._heartbeat_thread.start()
+        atexit.register(self.close)
+
+    def _heartbeat_loop(self):
+        while not self._stop.wait(self.lease_seconds / 3):
+            try:
+                self.store.heartbeat(self.owner, socket.gethostname(), os.getpid(), _boot_id())
+                if self._started:
+                    self._adopt_orphans()
+            except sqlite3.Error as e:
+                print(f"⚠️ 作业心跳失败: {e}")
+
+    def _adopt_orphans(self):
+        for job_id in self.store.adopt_orphans(self.owner, self.lease_seconds):
+            self._executor.submit(self._run, job_id)
+
+    def start(self):
+        """
+        恢复已退出进程留下的未完成作业（只执行一次），之后随心跳定期检查
+
+        只有常驻进程（界面、HTTP 接口）调用；命令行和批量生成只执行自己提交的作业。
+        """
+        with self._cond:
+            if self._started:
+                return
+            self._started = True
+        self._ensure_heartbeat()
+        self._adopt_orphans()
+
+    def close(self):
+        """停止心跳并注销本进程（进程退出时自动调用）"""
+        self._stop.set()
+        self.store.release_owner(self.owner)
+
+    def submit(self, video_path, account_positioning, file_uri=None, transcript=None, analysis=None,
+               force_regenerate=False):
+        """
+        提交作业
+
+        Args:
+            video_path: 本地视频路径（已有 file_uri 时可为空）
+            account_positioning: 账号定位
+            file_uri / transcript / analysis: 已有的阶段结果，对应阶段会被跳过
+            force_regenerate: 重新生成脚本时跳过响应缓存
+
+        Returns:
+            作业 ID
+        """
+        self._ensure_heartbeat()
+        now = time.time()
+        stage = 'queued'
+        for name, value in (('uploaded', file_uri), ('transcript', transcript), ('analysis', analysis)):
+            if not value:
+                break
+            stage = name
+        job = {
+            'id': uuid.uuid4().hex,
+            'status': 'queued',
+            'stage': stage,
+            'video_path': video_path,
+            'account_positioning': account_positioning,
+            'force_regenerate': force_regenerate,
+            'file_uri': file_uri,
+            'transcript': transcript,
+            'analysis': analysis,
+            'log': [],
+            'created_at': now,
+            'updated_at': now,
+            'owner': self.owner
+        }
+        self.store.create(job)
+        self._executor.submit(self._run, job['id'])
+        return job['id']
+
+    def get(self, job_id):
+        """返回作业的最新快照（运行中的作业包含流式输出中的脚本）"""
+        with self._cond:
+            live = self._live.get(job_id)
+            if live:
+                return dict(live, log=list(live['log']))
+        return self.store.get(job_id)
+
+    def subscribe(self, job_id, timeout=1.0):
+        """
+        订阅作业进度：每次状态变化产出一个快照，作业结束后停止
+
+        timeout 秒内没有变化时也会重新产出当前快照，调用方可借此刷新耗时等信息
+        """
+        version = -1
+        while True:
+            with self._cond:
+                live = self._live.get(job_id)
+                if live and live['version'] == version:
+                    self._cond.wait(timeout)
+                    live = self._live.get(job_id)
+                snapshot = dict(live, log=list(live['log'])) if live else None
+            if snapshot is None:
+                snapshot = self.store.get(job_id)
+                if snapshot is None:
+                    return
+                if snapshot['status'] in FINISHED_STATUSES:
+                    yield snapshot
+                    return
+                # 尚未被 worker 领取
+                yield snapshot
+                time.sleep(min(timeout, 0.2))
+                continue
+            version = snapshot['version']
+            yield snapshot
+            if snapshot['status'] in FINISHED_STATUSES:
+                return
+
+    def recent(self, limit=20):
+        """最近的作业"""
+        return self.store.recent(limit)
+
+    def _publish(self, job_id, persist=True, log=None, **fields):
+        """更新内存快照并通知订阅者；persist 时同时写入数据库作为检查点"""
+        with self._cond:
+            live = self._live[job_id]
+            live.update(fields)
+            if log:
+                live['log'].append({'time': time.time(), 'message': log})
+                fields['log'] = list(live['log'])
+            live['version'] += 1
+            self._cond.notify_all()
+        if persist:
+            self.store.update(job_id, **fields)
+
+    def _run(self, job_id):
+        if not self.store.claim(job_id, self.owner):
+            return
+        job = self.store.get(job_id)
+        job['version'] = 0
+        with self._cond:
+            self._live[job_id] = job
+        run_trace = None
+        try:
+            with telemetry.trace("copywriting_job", job_id=job_id) as run_trace:
+                self._execute(job_id, job)
+            self._publish(job_id, status='done', log=f"📈 阶段耗时: {telemetry.format_stages(run_trace.stage_seconds())}")
+        except Exception as e:
+            if run_trace is not None:
+                # 失败的作业同样给出已执行阶段的耗时，便于定位卡在哪一步（先于失败状态发布，订阅者收到终态前已能看到）
+                self._publish(job_id, log=f"📈 阶段耗时: {telemetry.format_stages(run_trace.stage_seconds())}")
+            self._publish(job_id, status='failed', error=str(e), log=f"❌ 处理失败: {str(e)}")
+        finally:
+            with self._cond:
+                self._live.pop(job_id, None)
+                self._cond.notify_all()
+
+    def _execute(self, job_id, job):
+        """选择本作业使用的密钥（整个作业固定使用同一个密钥，上传的文件只对该密钥可见）后执行各阶段"""
+        with self.downloader.use_gemini_api_key(file_uri=job['file_uri']) as api_key:
+            if not api_key:
+                raise RuntimeError("Gemini API密钥未配置")
+            self._execute_stages(job_id, job)
+
+    def _execute_stages(self, job_id, job):
+        downloader = self.downloader
+        if job['log']:
+            self._publish(job_id, log=f"🔁 从检查点继续（已完成阶段: {job['stage']}）")
+
+        # 阶段一：上传视频
+        if not job['file_uri']:
+            video_path = job['video_path']
+            if not video_path or not os.path.exists(video_path):
+                raise RuntimeError(f"视频文件不存在: {video_path}")
+            self._publish(job_id, log="📤 正在上传视频到Gemini...")
+            stage_start = time.time()
+            upload_result = downloader.upload_video_to_gemini(video_path)
+            if not upload_result['success']:
+                raise RuntimeError(f"上传失败: {upload_result['error']}")
+            if upload_result.get('reused'):
+                message = "♻️ 视频已上传过，直接复用远端文件"
+            else:
+                message = f"✅ 视频上传成功（处理等待 {upload_result.get('processing_seconds', 0):.1f}秒"
+                if upload_result.get('bytes_streamed') is not None:
+                    message += (f"，从原文件流式读取 {upload_result['bytes_streamed']}"
+                                f"/{upload_result['file_size']} 字节")
+                message += "）"
+            message += f"（本阶段 {time.time() - stage_start:.1f}秒）"
+            self._publish(job_id, stage='uploaded', file_uri=upload_result['file_uri'], log=message)
+
+        # 阶段二、三：解析文案与分析特点（各自完成即写入检查点）
+        if not (job['transcript'] and job['analysis']):
+            self._publish(job_id, log="🧠 正在解析视频文案并分析视频特点...")
+            messages = {'transcript': "✅ 视频文案解析完成", 'analysis': "✅ 视频分析完成"}
+
+            def on_stage(stage, text, seconds):
+                self._publish(job_id, log=f"{messages[stage]}（本阶段 {seconds:.1f}秒）", **{stage: text})
+
+            done = {stage: job[stage] for stage in ('transcript', 'analysis') if job[stage]}
+            pipeline.analyze_video(downloader, job['file_uri'], on_stage=on_stage, skip=done)
+            self._publish(job_id, stage='analysis')
+
+        # 阶段四：流式生成二创脚本，片段只更新内存快照，完成后再落盘
+        self._publish(job_id, log="✍️ 正在生成二创文案脚本...")
+        stage_start = time.time()
+        script = ""
+        for text in pipeline.generate_script_stream(
+            downloader, job['file_uri'], job['transcript'], job['analysis'], job['account_positioning'],
+            use_cache=not job['force_regenerate']
+        ):
+            first = not script
+            script += text
+            self._publish(
+                job_id, persist=False, script=script,
+                log=f"⚡ 开始输出（首字延迟 {time.time() - stage_start:.1f}秒）" if first else None
+            )
+        self._publish(
+            job_id, stage='script', script=script,
+            log=f"✅ 二创文案脚本生成完成（本阶段 {time.time() - stage_start:.1f}秒）"
+        )
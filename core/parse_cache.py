@@ -0,0 +1,102 @@
+"""解析结果缓存：SQLite 持久化，按短链接缓存 parse_video 的结果"""
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+def normalize_short_url(url):
+    """规范化短链接：去掉首尾空白，统一 host 小写和结尾斜杠"""
+    url = (url or '').strip()
+    if '://' in url:
+        scheme, rest = url.split('://', 1)
+        host, _, path = rest.partition('/')
+        url = f"{scheme.lower()}://{host.lower()}/{path}"
+    return url.rstrip('/') + '/'
+
+
+class ParseCache:
+    """
+    parse_video 结果的磁盘缓存
+
+    - 成功结果按 ttl 缓存（应短于 CDN 播放地址的有效期）
+    - 永久性失败（视频不存在、已删除等）按 negative_ttl 缓存，避免反复请求必然失败的链接
+    - 其他接口错误（限流、服务繁忙等）只按 transient_ttl 短暂缓存
+    - 网络错误不缓存
+    """
+
+    def __init__(self, db_path, ttl=2 * 3600, negative_ttl=24 * 3600, transient_ttl=60):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.transient_ttl = transient_ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS parse_cache ("
+                "url TEXT PRIMARY KEY, success INTEGER NOT NULL, payload TEXT NOT NULL, "
+                "created_at REAL NOT NULL, expires_at REAL NOT NULL)"
+            )
+
+    def get(self, url, include_failures=True):
+        """
+        读取未过期的缓存结果，未命中返回 None
+
+        Args:
+            include_failures: 为 False 时忽略缓存的失败结果（手动重试）
+        """
+        key = normalize_short_url(url)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload FROM parse_cache WHERE url = ? AND expires_at > ? AND success >= ?",
+                (key, time.time(), 0 if include_failures else 1)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        result = json.loads(row[0])
+        result['cached'] = True
+        return result
+
+    def put(self, url, result, permanent=False):
+        """写入解析结果：成功用 ttl，永久性失败用 negative_ttl，其他失败用 transient_ttl"""
+        key = normalize_short_url(url)
+        now = time.time()
+        if result.get('success'):
+            ttl = self.ttl
+        else:
+            ttl = self.negative_ttl if permanent else self.transient_ttl
+        if ttl <= 0:
+            return
+        payload = json.dumps(result, ensure_ascii=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO parse_cache (url, success, payload, created_at, expires_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, 1 if result.get('success') else 0, payload, now, now + ttl)
+            )
+            # 顺便清理过期记录
+            self._conn.execute("DELETE FROM parse_cache WHERE expires_at <= ?", (now,))
+
+    def invalidate(self, url):
+        """删除某个链接的缓存（例如播放地址已失效时）"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM parse_cache WHERE url = ?", (normalize_short_url(url),))
+
+    def stats(self):
+        """返回命中统计"""
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': (hits / total) if total else 0.0
+        }
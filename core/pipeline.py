@@ -0,0 +1,253 @@
+"""文案生成流水线：上传视频 → 解析文案 → 分析特点 → 生成二创脚本（与界面无关，可被 UI / 作业队列复用）"""
+import json
+import os
+import re
+import time
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
+from .config_manager import config_manager
+from . import telemetry
+
+# 文案保存目录：项目根目录的 data 文件夹
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+
+# 第一步：解析上传视频的文案
+TRANSCRIPT_PROMPT = """请仔细分析这个视频，提取并复述视频中的文案内容（如果有的话）。如果没有明确的文案，请描述视频中的对话、旁白或文字内容。
+
+要求：
+1. 只提取纯文本内容，不要包含任何时间戳、时间信息
+2. 按照视频中出现的顺序，完整呈现文案文本
+3. 如果有字幕或文字，直接提取字幕内容
+4. 如果是对话或旁白，用引号标注并说明是谁说的"""
+
+# 第二步：分析视频的特点、风格、结构等信息
+ANALYSIS_PROMPT = """请详细分析这个视频的特点、风格和结构，包括但不限于：
+1. 视频的拍摄风格（如：第一人称、第三人称、特写、全景等）
+2. 视频的节奏和剪辑特点
+3. 视频的内容主题和情感表达
+4. 视频的语言风格（如：幽默、严肃、轻松、紧张等）
+5. 视频的视觉元素（如：场景、道具、服装等）
+6. 视频的目标受众和传播特点
+请给出详细的分析报告。"""
+
+# 合并模式：一次调用返回文案和分析两个字段（JSON 结构化输出）
+COMBINED_PROMPT = f"""请观看这个视频，一次性完成以下两项任务，并按 JSON 格式返回：
+
+transcript 字段：
+{TRANSCRIPT_PROMPT}
+
+analysis 字段：
+{ANALYSIS_PROMPT}"""
+
+@lru_cache(maxsize=None)
+def combined_schema():
+    """合并调用的结构化输出格式（google-genai 在第一次使用时才导入）"""
+    from google.genai import types
+    return types.Schema(
+        type=types.Type.OBJECT,
+        properties={
+            'transcript': types.Schema(type=types.Type.STRING, description="视频文案的纯文本"),
+            'analysis': types.Schema(type=types.Type.STRING, description="视频特点、风格和结构的分析报告")
+        },
+        required=['transcript', 'analysis']
+    )
+
+DEFAULT_ACCOUNT_POSITIONING = """
+请分析短视频的结构和内容，结合我的账号定位，重新创作短视频脚本。以下是我的短视频账号定位：
+【人物角色】
+● 香贝贝：两岁的小戏精女宝，擅长观察和吐槽
+● 爸爸：幽默搞笑的懒爸爸（配角，根据情况出现）
+● 妈妈：不完美的成长型妈妈（配角，根据情况出现）
+【创作要求】
+1. 宝宝的第一视角，风格是："宝宝吐槽 + 育儿知识反差输出 + 家庭修罗场（三方视角冲突）"
+2. 文案时长控制在45s以内，开头吸睛（宝宝吐槽搞笑/讽刺）；中段带入家庭矛盾或共鸣点
+"""
+
+
+def build_script_prompt(original_copywriting, video_analysis, account_positioning):
+    """第三步：基于账号定位和视频，生成二创文案脚本的提示词"""
+    return f"""基于以下信息，创作一个新的短视频脚本：
+
+【原视频分析】
+{original_copywriting}
+
+【视频特点分析】
+{video_analysis}
+
+【账号定位】
+{account_positioning}
+
+请结合你的账号定位，重新创作一个短视频脚本。要求：
+1. 保持原视频的核心创意或主题，但要用你的账号风格来呈现
+2. 脚本要符合你的账号定位和人物角色
+3. 脚本要适合短视频平台，时长控制在45秒以内
+4. 脚本要有清晰的开始、发展、高潮、结尾结构
+5. 语言要生动有趣，符合你的账号风格"""
+
+
+def get_model_name():
+    """获取模型名称（从配置读取，默认使用gemini-2.5-flash）"""
+    return config_manager.get("gemini_model_name", "gemini-2.5-flash")
+
+
+def get_analysis_mode():
+    """文案解析与特点分析的调用方式：combined（单次结构化调用，默认）或 separate（两次独立调用）"""
+    mode = config_manager.get("analysis_mode", "combined")
+    return mode if mode in ("combined", "separate") else "combined"
+
+
+def parse_combined(text):
+    """
+    解析合并调用返回的 JSON
+
+    Raises:
+        ValueError: 不是完整的 JSON 对象（例如输出达到 token 上限被截断）或缺少字段
+    """
+    combined = json.loads(text)
+    if not isinstance(combined, dict) or not all(isinstance(combined.get(stage), str)
+                                                 for stage in ('transcript', 'analysis')):
+        raise ValueError("合并调用的返回缺少 transcript / analysis 字段")
+    return combined
+
+
+def _video_part(file_uri):
+    from google.genai import types
+    return types.Part(file_data=types.FileData(file_uri=file_uri))
+
+
+def _text_part(text):
+    from google.genai import types
+    return types.Part(text=text)
+
+
+def run_prompt(downloader, file_uri, prompt):
+    """针对已上传的视频执行一个提示词，返回 (文本, 耗时)"""
+    stage_start = time.time()
+    response = downloader.generate_content_with_retry(
+        model_name=get_model_name(),
+        contents=[_video_part(file_uri), _text_part(prompt)]
+    )
+    return response.text, time.time() - stage_start
+
+
+def analyze_video(downloader, file_uri, on_stage=None, skip=None):
+    """
+    解析视频文案并分析视频特点
+
+    合并模式（默认）下一次结构化调用同时返回两项；分离模式下两个互不依赖的请求并行执行。
+
+    Args:
+        downloader: DouyinDownloader
+        file_uri: 已上传视频的 file_uri
+        on_stage: 每个阶段完成时回调 on_stage(stage, text, seconds)，stage 为 'transcript' / 'analysis'
+        skip: 已有结果的阶段 {stage: text}（断点续跑时跳过）
+
+    Returns:
+        {'transcript': str, 'analysis': str}
+    """
+    results = dict(skip or {})
+    pending = [stage for stage in ('transcript', 'analysis') if not results.get(stage)]
+    if not pending:
+        return results
+
+    if get_analysis_mode() == "combined" and len(pending) == 2:
+        from google.genai import types
+        stage_start = time.time()
+        try:
+            # 返回的 JSON 校验通过后才写入响应缓存，截断的结果不会在重跑时被再次读出
+            response = downloader.generate_content_with_retry(
+                model_name=get_model_name(),
+                contents=[_video_part(file_uri), _text_part(COMBINED_PROMPT)],
+                config=types.GenerateContentConfig(
+                    response_mime_type="application/json",
+                    response_schema=combined_schema()
+                ),
+                validate=parse_combined
+            )
+            combined = parse_combined(response.text)
+        except ValueError as e:
+            print(f"⚠️ 合并调用返回的 JSON 无效，改为两次独立调用: {e}")
+        else:
+            seconds = time.time() - stage_start
+            for stage in ('transcript', 'analysis'):
+                results[stage] = combined[stage]
+                if on_stage:
+                    on_stage(stage, results[stage], seconds)
+            return results
+
+    prompts = {'transcript': TRANSCRIPT_PROMPT, 'analysis': ANALYSIS_PROMPT}
+    with ThreadPoolExecutor(max_workers=len(pending), thread_name_prefix="copywriting-stage") as executor:
+        futures = {
+            telemetry.run_in_context(executor, run_prompt, downloader, file_uri, prompts[stage]): stage
+            for stage in pending
+        }
+        for future in as_completed(futures):
+            stage = futures[future]
+            text, seconds = future.result()
+            results[stage] = text
+            if on_stage:
+                on_stage(stage, text, seconds)
+    return results
+
+
+def generate_script_stream(downloader, file_uri, original_copywriting, video_analysis, account_positioning, use_cache=True):
+    """流式生成二创脚本，逐段产出文本"""
+    prompt = build_script_prompt(original_copywriting, video_analysis, account_positioning)
+    yield from downloader.generate_content_stream_with_retry(
+        model_name=get_model_name(),
+        contents=[_video_part(file_uri), _text_part(prompt)],
+        use_cache=use_cache
+    )
+
+
+def get_filename_from_video(video_path, date=None):
+    """根据视频文件名和日期生成markdown文件名
+    格式：视频文件名_YYYYMMDD.md
+    同一个视频多次保存会覆盖（文件名相同），不同视频保存新文件
+    """
+    if not video_path:
+        return None
+
+    # 获取视频文件名（不含扩展名）
+    video_name = os.path.basename(video_path)
+    video_name_without_ext = os.path.splitext(video_name)[0]
+
+    # 清理文件名，移除特殊字符，保留中英文、数字、下划线和连字符
+    clean_name = re.sub(r'[^\w\s\u4e00-\u9fff-]', '', video_name_without_ext)
+    clean_name = re.sub(r'\s+', '_', clean_name).strip('_')
+
+    # 如果文件名太长，截取前50个字符
+    if len(clean_name) > 50:
+        clean_name = clean_name[:50]
+
+    # 获取日期（年月日）
+    date_str = (date or datetime.now()).strftime("%Y%m%d")
+
+    # 生成文件名：视频名_年月日.md
+    return f"{clean_name}_{date_str}.md"
+
+
+def find_saved_copywriting(video_path, data_dir=DATA_DIR):
+    """查找该视频已保存过的文案文件（任意日期），没有时返回 None"""
+    filename = get_filename_from_video(video_path)
+    if not filename or not os.path.isdir(data_dir):
+        return None
+    prefix = filename[:-len("YYYYMMDD.md")]
+    for name in sorted(os.listdir(data_dir), reverse=True):
+        if name.startswith(prefix) and re.fullmatch(r"\d{8}\.md", name[len(prefix):]):
+            return os.path.join(data_dir, name)
+    return None
+
+
+def save_copywriting(video_path, remake_script, data_dir=DATA_DIR):
+    """保存文案到 data 目录下的 markdown 文件，返回文件路径"""
+    filename = get_filename_from_video(video_path)
+    if not filename:
+        raise ValueError("无法生成文件名")
+    with telemetry.span("save", bytes=len(remake_script.encode('utf-8'))):
+        os.makedirs(data_dir, exist_ok=True)
+        filepath = os.path.join(data_dir, filename)
+        with open(filepath, 'w', encoding='utf-8') as f:
+            f.write(remake_script)
+    return filepath
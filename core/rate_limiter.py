@@ -0,0 +1,167 @@
+"""Gemini 请求限速器：进程内共享的 RPM + TPM 令牌桶，识别服务端 Retry-After / retryDelay 提示"""
+import random
+import re
+import threading
+import time
+from collections import deque
+
+from .config_manager import config_manager
+
+
+def retry_after_from_error(error):
+    """
+    从异常中提取服务端建议的重试等待秒数，没有提示时返回 None
+
+    依次检查：HTTP Retry-After 响应头、google.rpc.RetryInfo 的 retryDelay、错误文本中的 "retry in Xs"
+    """
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if headers:
+        value = headers.get("retry-after") or headers.get("Retry-After")
+        if value:
+            try:
+                return max(0.0, float(value))
+            except ValueError:
+                pass
+
+    details = getattr(error, "details", None)
+    if isinstance(details, dict):
+        error_body = details.get("error", details)
+        for item in error_body.get("details", []) or []:
+            if isinstance(item, dict) and str(item.get("@type", "")).endswith("RetryInfo"):
+                match = re.match(r"([\d.]+)s", str(item.get("retryDelay", "")))
+                if match:
+                    return float(match.group(1))
+
+    text = str(error)
+    match = re.search(r"retryDelay['\"]?\s*[:=]\s*['\"]([\d.]+)s", text) or \
+        re.search(r"retry in ([\d.]+)\s*s", text, re.IGNORECASE)
+    if match:
+        return float(match.group(1))
+    return None
+
+
+def backoff_delay(attempt, base_delay=2, max_delay=60):
+    """带完全抖动的指数退避：在 [0, base_delay * 2^attempt] 中随机取值，避免多个调用方同时重试"""
+    return random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+
+
+class RateLimiter:
+    """
+    线程安全的双令牌桶（每分钟请求数 + 每分钟 token 数），按先来先服务放行
+
+    Args:
+        requests_per_minute: 请求速率
+        tokens_per_minute: token 速率（<= 0 表示不限制）
+        burst: 请求桶容量，允许瞬时并发的请求数（例如同时发出互不依赖的两个请求）
+    """
+
+    def __init__(self, requests_per_minute=60, tokens_per_minute=0, burst=2):
+        self.request_rate = requests_per_minute / 60.0
+        self.request_capacity = max(1, burst)
+        self.token_rate = tokens_per_minute / 60.0
+        self.token_capacity = max(0, tokens_per_minute)
+        self._request_tokens = float(self.request_capacity)
+        self._token_tokens = float(self.token_capacity)
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.0
+        self._queue = deque()
+        self._cond = threading.Condition()
+
+    def _refill(self, now):
+        elapsed = now - self._updated_at
+        self._request_tokens = min(self.request_capacity, self._request_tokens + elapsed * self.request_rate)
+        if self.token_capacity:
+            self._token_tokens = min(self.token_capacity, self._token_tokens + elapsed * self.token_rate)
+        self._updated_at = now
+
+    def _wait_time(self, now, tokens):
+        """距离可以放行还需要等待的秒数"""
+        wait = max(0.0, self._paused_until - now)
+        if self._request_tokens < 1:
+            wait = max(wait, (1 - self._request_tokens) / self.request_rate)
+        if self.token_capacity and self._token_tokens < tokens:
+            wait = max(wait, (tokens - self._token_tokens) / self.token_rate)
+        return wait
+
+    def acquire(self, tokens=0):
+        """
+        排队取得一次请求配额（以及预估的 token 数），配额不足时阻塞等待
+
+        Returns:
+            等待的秒数
+        """
+        tokens = min(tokens, self.token_capacity) if self.token_capacity else 0
+        ticket = object()
+        start = time.monotonic()
+        with self._cond:
+            self._queue.append(ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    if self._queue[0] is ticket:
+                        self._refill(now)
+                        wait = self._wait_time(now, tokens)
+                        if wait <= 0:
+                            self._request_tokens -= 1
+                            self._token_tokens -= tokens
+                            return now - start
+                        self._cond.wait(wait)
+                    else:
+                        self._cond.wait()
+            finally:
+                self._queue.remove(ticket)
+                self._cond.notify_all()
+
+    def settle(self, estimated_tokens, actual_tokens):
+        """请求完成后按实际 token 用量修正预估值（多退少补）"""
+        if not self.token_capacity or actual_tokens is None:
+            return
+        with self._cond:
+            self._refill(time.monotonic())
+            self._token_tokens = min(self.token_capacity, self._token_tokens + estimated_tokens - actual_tokens)
+            self._cond.notify_all()
+
+    def pause(self, seconds):
+        """服务端要求等待（Retry-After）时暂停放行，所有排队的调用方一起遵守，之后按速率平滑恢复"""
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            # 清空请求桶，恢复后不会瞬间放出一批请求
+            self._request_tokens = min(self._request_tokens, 0.0)
+            self._cond.notify_all()
+
+    @property
+    def queue_depth(self):
+        """当前排队等待配额的调用数"""
+        with self._cond:
+            return len(self._queue)
+
+    def stats(self):
+        """返回当前排队数与剩余配额"""
+        with self._cond:
+            now = time.monotonic()
+            self._refill(now)
+            return {
+                'queue_depth': len(self._queue),
+                'available_requests': max(0.0, self._request_tokens),
+                'available_tokens': max(0.0, self._token_tokens) if self.token_capacity else None,
+                'paused_for': max(0.0, self._paused_until - now)
+            }
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(name="gemini"):
+    """获取进程内共享的限速器（同名只创建一次，所有会话和线程共用）"""
+    with _limiters_lock:
+        limiter = _limiters.get(name)
+        if limiter is None:
+            limiter = RateLimiter(
+                requests_per_minute=config_manager.get("gemini_requests_per_minute", 30),
+                tokens_per_minute=config_manager.get("gemini_tokens_per_minute", 1000000),
+                burst=config_manager.get("gemini_request_burst", 2)
+            )
+            _limiters[name] = limiter
+        return limiter
@@ -0,0 +1,114 @@
+"""Gemini 响应缓存：按 (模型, 文件内容摘要, 提示词) 缓存生成结果，超出容量按 LRU 淘汰"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+
+class CachedResponse:
+    """缓存命中时返回的响应对象，与 SDK 响应一样通过 .text 取结果"""
+
+    def __init__(self, text):
+        self.text = text
+        self.cached = True
+
+
+class ResponseCache:
+    """
+    模型响应的磁盘缓存（SQLite）
+
+    Args:
+        db_path: 数据库路径
+        max_bytes: 缓存文本总字节数上限，超出时淘汰最久未访问的记录
+    """
+
+    def __init__(self, db_path, max_bytes=50 * 1024 * 1024):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, model TEXT NOT NULL, text TEXT NOT NULL, size INTEGER NOT NULL, "
+                "created_at REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_access ON responses (last_access)")
+
+    @staticmethod
+    def make_key(model_name, parts, config_fingerprint=""):
+        """
+        生成缓存键
+
+        Args:
+            model_name: 模型名称
+            parts: 已规范化的请求片段（文件以内容摘要表示，文本原样保留）
+            config_fingerprint: 生成配置的序列化结果
+        """
+        sha256 = hashlib.sha256()
+        for piece in [model_name, config_fingerprint] + list(parts):
+            data = piece.encode('utf-8')
+            # 写入长度前缀，避免不同切分方式拼出相同的字节串
+            sha256.update(len(data).to_bytes(8, 'big'))
+            sha256.update(data)
+        return sha256.hexdigest()
+
+    def get(self, key):
+        """读取缓存文本，未命中返回 None"""
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT text FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+        return row[0]
+
+    def invalidate(self, key):
+        """删除一条缓存（缓存的文本未通过调用方的校验时）"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+
+    def put(self, key, model_name, text):
+        """写入缓存并按容量淘汰最久未访问的记录"""
+        if not text:
+            return
+        now = time.time()
+        size = len(text.encode('utf-8'))
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, text, size, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model_name, text, size, now, now)
+            )
+            total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            for old_key, old_size in self._conn.execute(
+                "SELECT key, size FROM responses ORDER BY last_access ASC"
+            ).fetchall():
+                if total <= self.max_bytes or old_key == key:
+                    break
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (old_key,))
+                total -= old_size
+
+    def stats(self):
+        """返回命中统计与当前占用"""
+        with self._lock:
+            hits, misses = self.hits, self.misses
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+        total = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': (hits / total) if total else 0.0,
+            'entries': entries,
+            'bytes': size
+        }
@@ -0,0 +1,138 @@
+"""无界面的流水线服务：下载、分析、生成文案，供 Gradio 界面、命令行和 HTTP 接口共用"""
+import threading
+import time
+
+from .config_manager import config_manager
+from .douyin_core import DouyinDownloader
+from .gemini_clients import configured_api_keys
+from .jobs import JobManager
+from . import pipeline
+
+
+class PipelineService:
+    """
+    流水线入口
+
+    Args:
+        downloader: DouyinDownloader，默认新建
+        job_manager: JobManager，默认基于 downloader 新建
+    """
+
+    def __init__(self, downloader=None, job_manager=None):
+        self._downloader = downloader
+        self._job_manager = job_manager
+        self._lock = threading.Lock()
+
+    @property
+    def downloader(self):
+        """下载器（第一次使用时创建，创建时会打开缓存数据库、启动下载目录扫描）"""
+        if self._downloader is None:
+            with self._lock:
+                if self._downloader is None:
+                    self._downloader = DouyinDownloader()
+        return self._downloader
+
+    @property
+    def job_manager(self):
+        """作业调度（第一次使用时创建）"""
+        if self._job_manager is None:
+            downloader = self.downloader
+            with self._lock:
+                if self._job_manager is None:
+                    self._job_manager = JobManager(downloader)
+        return self._job_manager
+
+    def start(self, background=False):
+        """
+        恢复已退出进程留下的未完成作业（常驻的界面 / HTTP 接口调用；命令行只执行自己提交的作业）
+
+        Args:
+            background: 在后台线程中创建下载器和作业调度，调用方（界面启动）不等待磁盘操作
+        """
+        if background:
+            threading.Thread(target=self.start, name="pipeline-service-start", daemon=True).start()
+            return
+        self.job_manager.start()
+
+    def download_urls(self, urls, max_workers=None, retry_failed=False):
+        """
+        并发解析并下载链接列表
+
+        Args:
+            retry_failed: 忽略解析缓存中的失败结果，重新请求解析接口（手动重试）
+
+        Yields:
+            每个链接完成时产出 process_video 的结果（附带 index）
+        """
+        if max_workers is None:
+            max_workers = int(config_manager.get("batch_max_workers", 4))
+        yield from self.downloader.batch_process(urls, max_workers=max_workers, retry_failed=retry_failed)
+
+    def download_iter(self, text, max_workers=None, retry_failed=False):
+        """从文本中提取所有抖音链接（去重）并解析下载"""
+        yield from self.download_urls(self.downloader.extract_douyin_urls(text or ""), max_workers, retry_failed)
+
+    def download(self, text, max_workers=None, retry_failed=False):
+        """下载文本中的所有链接，按链接出现顺序返回结果列表"""
+        items = sorted(self.download_iter(text, max_workers, retry_failed), key=lambda item: item['index'])
+        if not items:
+            raise ValueError("未找到有效的抖音链接，请检查输入格式")
+        return items
+
+    def analyze(self, video_path):
+        """
+        同步上传视频并解析文案、分析特点（不生成脚本）
+
+        Returns:
+            dict：file_uri、transcript、analysis、reused（是否复用已上传文件）、elapsed
+        """
+        start_time = time.time()
+        with self.downloader.use_gemini_api_key() as api_key:
+            if not api_key:
+                raise ValueError("请先在配置页面输入Gemini API密钥")
+            upload_result = self.downloader.upload_video_to_gemini(video_path)
+            if not upload_result['success']:
+                raise RuntimeError(f"上传失败: {upload_result['error']}")
+            results = pipeline.analyze_video(self.downloader, upload_result['file_uri'])
+        return {
+            'file_uri': upload_result['file_uri'],
+            'transcript': results['transcript'],
+            'analysis': results['analysis'],
+            'reused': upload_result.get('reused', False),
+            'elapsed': time.time() - start_time
+        }
+
+    def generate(self, video_path=None, account_positioning=None, file_uri=None, transcript=None, analysis=None,
+                 force_regenerate=False):
+        """提交完整的文案生成作业（已有的阶段结果会被跳过），返回作业 ID"""
+        if not configured_api_keys():
+            raise ValueError("请先在配置页面输入Gemini API密钥")
+        if not video_path and not file_uri:
+            raise ValueError("需要提供 video_path 或 file_uri")
+        return self.job_manager.submit(
+            video_path,
+            account_positioning or pipeline.DEFAULT_ACCOUNT_POSITIONING,
+            file_uri=file_uri,
+            transcript=transcript,
+            analysis=analysis,
+            force_regenerate=force_regenerate
+        )
+
+    def subscribe(self, job_id):
+        """订阅作业进度快照"""
+        return self.job_manager.subscribe(job_id)
+
+    def wait(self, job_id):
+        """阻塞等待作业结束，返回最终快照（作业不存在时返回 None）"""
+        job = None
+        for job in self.job_manager.subscribe(job_id):
+            pass
+        return job
+
+    def job(self, job_id):
+        """查询作业快照"""
+        return self.job_manager.get(job_id)
+
+    def recent_jobs(self, limit=20):
+        """最近的作业"""
+        return self.job_manager.recent(limit)
@@ -0,0 +1,320 @@
+"""阶段耗时的埋点：span 记录每个阶段的开始/结束和属性，汇总为 Prometheus 指标，并按次运行导出 JSON 轨迹
+
+用法：
+    with telemetry.trace("process_video", url=url):      # 一次运行，结束时写出 cache/traces/<trace_id>.json
+        with telemetry.span("parse") as span:             # 阶段，结束时计入 video_remix_stage_seconds 直方图
+            span.set(cached=True)
+"""
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .config_manager import config_manager
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_TRACE_DIR = os.path.join(BASE_DIR, "cache", "traces")
+
+# 阶段耗时直方图的分桶（秒）
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+_current_span = contextvars.ContextVar("video_remix_span", default=None)
+# set_trace_dir 指定的轨迹目录（优先于配置中的 trace_dir）
+_trace_dir_override = None
+
+
+class Metrics:
+    """进程内的计数器和直方图，按 Prometheus 文本格式导出"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._help = {}
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted((labels or {}).items()))
+
+    def inc(self, name, value=1.0, help_text="", **labels):
+        """计数器累加"""
+        key = self._key(name, labels)
+        with self._lock:
+            self._help.setdefault(name, ('counter', help_text))
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def observe(self, name, value, help_text="", **labels):
+        """直方图记录一个观测值"""
+        key = self._key(name, labels)
+        with self._lock:
+            self._help.setdefault(name, ('histogram', help_text))
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram['buckets'][index] += 1
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    @staticmethod
+    def _labels(pairs, extra=()):
+        pairs = list(pairs) + list(extra)
+        if not pairs:
+            return ""
+        escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+        return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+    def render(self):
+        """Prometheus 文本格式"""
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: dict(value, buckets=list(value['buckets'])) for key, value in self._histograms.items()}
+            help_entries = dict(self._help)
+        lines = []
+        for name in sorted(help_entries):
+            kind, help_text = help_entries[name]
+            if help_text:
+                lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind == 'counter':
+                for (metric, labels), value in sorted(counters.items()):
+                    if metric == name:
+                        lines.append(f"{name}{self._labels(labels)} {value:g}")
+                continue
+            for (metric, labels), histogram in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                for bound, count in zip(self.buckets, histogram['buckets']):
+                    lines.append(f"{name}_bucket{self._labels(labels, [('le', f'{bound:g}')])} {count}")
+                lines.append(f"{name}_bucket{self._labels(labels, [('le', '+Inf')])} {histogram['count']}")
+                lines.append(f"{name}_sum{self._labels(labels)} {histogram['sum']:.6f}")
+                lines.append(f"{name}_count{self._labels(labels)} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+class Span:
+    """一个阶段的计时区间，set() 附加属性（字节数、重试次数等）"""
+
+    def __init__(self, name, trace=None, parent=None, attributes=None):
+        self.name = name
+        self.trace = trace
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = dict(attributes or {})
+        self.start_time = time.time()
+        self._start = time.perf_counter()
+        self.duration = None
+        self.error = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+        return self
+
+    def fail(self, message):
+        """标记失败（用于返回错误结果而不抛异常的阶段）"""
+        self.error = str(message)
+        return self
+
+    def finish(self, error=None):
+        self.duration = time.perf_counter() - self._start
+        self.error = str(error) if error else self.error
+        metrics.observe("video_remix_stage_seconds", self.duration, "各阶段耗时（秒）", stage=self.name)
+        transferred = self.attributes.get('bytes')
+        if transferred:
+            metrics.inc("video_remix_bytes_total", transferred, "各阶段传输的字节数", stage=self.name)
+            if self.duration > 0:
+                self.attributes['bytes_per_second'] = transferred / self.duration
+        if self.error:
+            metrics.inc("video_remix_stage_errors_total", 1, "各阶段失败次数", stage=self.name)
+        if self.trace is not None:
+            self.trace.add(self)
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'start_time': self.start_time,
+            'duration': self.duration,
+            'attributes': self.attributes,
+            'error': self.error
+        }
+
+
+class Trace:
+    """一次运行（一个作业、一次下载）的全部 span；嵌套在 parent 轨迹中时 span 同时记入 parent"""
+
+    def __init__(self, name, attributes=None, parent=None):
+        self.trace_id = uuid.uuid4().hex
+        self.name = name
+        self.attributes = dict(attributes or {})
+        self.parent = parent
+        if parent is not None:
+            self.attributes['parent_trace_id'] = parent.trace_id
+        self.start_time = time.time()
+        self.duration = None
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, span):
+        with self._lock:
+            self.spans.append(span)
+        if self.parent is not None:
+            self.parent.add(span)
+
+    def stage_seconds(self):
+        """按阶段名汇总耗时（同名阶段累加）"""
+        totals = {}
+        with self._lock:
+            spans = list(self.spans)
+        for span in spans:
+            if span.duration is not None:
+                totals[span.name] = totals.get(span.name, 0.0) + span.duration
+        return totals
+
+    def to_dict(self):
+        with self._lock:
+            spans = [span.to_dict() for span in self.spans]
+        return {
+            'trace_id': self.trace_id,
+            'name': self.name,
+            'attributes': self.attributes,
+            'start_time': self.start_time,
+            'duration': self.duration,
+            'stages': self.stage_seconds(),
+            'spans': sorted(spans, key=lambda span: span['start_time'])
+        }
+
+
+def format_stages(stages):
+    """把 Trace.stage_seconds() 格式化为一行，例如 upload 1.2秒 / model.generate 3.4秒"""
+    return " / ".join(f"{name} {seconds:.1f}秒" for name, seconds in stages.items()) or "无"
+
+
+@contextmanager
+def span(name, activate=True, **attributes):
+    """
+    记录一个阶段；异常会记入 span 后继续抛出
+
+    activate 为假时不把该 span 设为当前 span（用于生成器内部，避免跨 yield 修改调用方的上下文）
+    """
+    parent = _current_span.get()
+    current = Span(name, parent.trace if parent else None, parent, attributes)
+    token = _current_span.set(current) if activate else None
+    try:
+        yield current
+    except BaseException as e:
+        current.finish(error=e if isinstance(e, Exception) else None)
+        raise
+    else:
+        current.finish()
+    finally:
+        if token is not None:
+            _current_span.reset(token)
+
+
+def _trace_dir():
+    return _trace_dir_override or config_manager.get("trace_dir") or DEFAULT_TRACE_DIR
+
+
+def set_trace_dir(path):
+    """临时指定轨迹目录（压测等不应写入项目目录的运行使用，不改配置文件），传 None 恢复使用配置；返回之前的设置"""
+    global _trace_dir_override
+    previous, _trace_dir_override = _trace_dir_override, path
+    return previous
+
+
+def _write_trace(trace):
+    """写出 JSON 轨迹，只保留最近 trace_retention 个文件"""
+    trace_dir = _trace_dir()
+    os.makedirs(trace_dir, exist_ok=True)
+    path = os.path.join(trace_dir, f"{time.strftime('%Y%m%d_%H%M%S', time.localtime(trace.start_time))}_{trace.trace_id}.json")
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(trace.to_dict(), f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+    retention = int(config_manager.get("trace_retention", 200))
+    names = sorted(name for name in os.listdir(trace_dir) if name.endswith(".json"))
+    for name in names[:max(0, len(names) - retention)]:
+        try:
+            os.remove(os.path.join(trace_dir, name))
+        except OSError:
+            pass
+    return path
+
+
+@contextmanager
+def trace(name, **attributes):
+    """
+    开始一次运行：其中的 span 都归入同一条轨迹，结束时计入 video_remix_runs_total 并写出 JSON
+
+    已处于其他轨迹中时（例如批量处理中的单个链接）仍是一条独立的轨迹，有自己的 trace_id、耗时和阶段汇总，
+    其 span 同时记入外层轨迹，根 span 挂在外层当前 span 之下
+    """
+    outer = _current_span.get()
+    current_trace = Trace(name, attributes, parent=outer.trace if outer else None)
+    root = Span(name, current_trace, outer, attributes)
+    token = _current_span.set(root)
+    status = "ok"
+    try:
+        yield current_trace
+    except BaseException as e:
+        status = "error"
+        root.finish(error=e if isinstance(e, Exception) else None)
+        raise
+    else:
+        root.finish()
+    finally:
+        _current_span.reset(token)
+        current_trace.duration = root.duration
+        metrics.inc("video_remix_runs_total", 1, "运行次数", run=name, status=status)
+        if config_manager.get("trace_enabled", True):
+            try:
+                current_trace.attributes['trace_file'] = _write_trace(current_trace)
+            except OSError as e:
+                print(f"⚠️ 写入运行轨迹失败: {e}")
+
+
+def current_trace():
+    """当前所在的轨迹，不在任何轨迹中时返回 None"""
+    current = _current_span.get()
+    return current.trace if current else None
+
+
+def run_in_context(executor, fn, *args, **kwargs):
+    """向线程池提交任务时带上当前上下文，子线程中的 span 归入同一条轨迹"""
+    return executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?', 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port, host="127.0.0.1"):
+    """在后台线程启动独立的 /metrics 端点，返回 server（调用 shutdown() 停止）"""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
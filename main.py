@@ -1,6 +1,6 @@
 import gradio as gr
 import os
-from core import DouyinDownloader
+from core import PipelineService, config_manager, telemetry
 from ui import create_download_tab, create_copywriting_tab, create_config_tab, create_jianying_tab
 
 # 读取外部 CSS 文件
@@ -20,13 +20,19 @@ def create_interface():
     ) as interface:
         gr.Markdown("# 🎵 创作者工具")
         
-        downloader = DouyinDownloader()
+        # 界面只负责展示，下载与文案生成都交给流水线服务；后台继续上次未完成的作业，不阻塞界面构建
+        service = PipelineService()
+        service.start(background=True)
+        # 配置了 metrics_port 时暴露 Prometheus 指标端点（/metrics）
+        metrics_port = config_manager.get("metrics_port")
+        if metrics_port:
+            telemetry.start_metrics_server(int(metrics_port))
         current_video_path = gr.State(value=None)
         
         with gr.Tabs():
-            input_text, reference_btn, global_copywriting_video_path = create_download_tab(downloader)
-            video_input, generate_btn = create_copywriting_tab(downloader)
-            create_jianying_tab()
+            input_text, reference_btn, global_copywriting_video_path = create_download_tab(service)
+            video_input, generate_btn = create_copywriting_tab(service)
+            draft_selector, refresh_drafts = create_jianying_tab()
             create_config_tab()
         
         def sync_video_to_copywriting(video_path):
@@ -40,6 +46,9 @@ def create_interface():
             inputs=[global_copywriting_video_path],
             outputs=[video_input]
         )
+        
+        # 剪映草稿列表在页面加载后填充，启动不等待目录扫描
+        interface.load(fn=refresh_drafts, inputs=[], outputs=[draft_selector])
     
     return interface
 
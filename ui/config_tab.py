@@ -1,27 +1,54 @@
 import gradio as gr
-from core import config_manager
+from core import config_manager, pipeline
+from core.gemini_clients import configured_api_keys
+from core.jianying_drafts import CONFIG_KEY as DRAFTS_DIR_KEY, draft_index
+
+def format_extra_keys():
+    """配置中的额外密钥（列表或字符串）转换为逗号分隔的文本"""
+    extra_keys = config_manager.get("gemini_api_keys") or []
+    return extra_keys if isinstance(extra_keys, str) else ", ".join(extra_keys)
 
 def create_config_tab():
     """创建配置标签页"""
     
-    def save_gemini_config(api_key):
-        """保存Gemini API配置"""
+    def save_gemini_config(api_key, extra_keys):
+        """保存Gemini API配置（主密钥 + 逗号分隔的额外密钥，作业按剩余配额分配到各个密钥）"""
         if not api_key.strip():
             return "❌ 请输入有效的API密钥"
         
         # 验证API密钥格式（简单验证）
-        if len(api_key) < 20:
+        extra_keys = [key.strip() for key in (extra_keys or "").replace('\n', ',').split(',') if key.strip()]
+        if any(len(key) < 20 for key in [api_key] + extra_keys):
             return "❌ API密钥格式不正确"
         
         # 使用配置管理器保存
         config_manager.set("gemini_api_key", api_key)
+        config_manager.set("gemini_api_keys", extra_keys)
+        if extra_keys:
+            return f"✅ 配置保存成功（共 {len(configured_api_keys())} 个密钥）"
         return "✅ 配置保存成功"
     
+    def save_analysis_mode(mode):
+        """保存文案解析与特点分析的调用方式"""
+        config_manager.set("analysis_mode", mode)
+        label = "单次结构化调用" if mode == "combined" else "两次独立调用"
+        return f"✅ 已切换为{label}"
+    
+    def save_drafts_dir(drafts_dir):
+        """保存剪映草稿目录（留空则使用系统默认目录）"""
+        drafts_dir = drafts_dir.strip()
+        if drafts_dir:
+            config_manager.set(DRAFTS_DIR_KEY, drafts_dir)
+        else:
+            config_manager.remove(DRAFTS_DIR_KEY)
+        return f"✅ 剪映草稿目录: {draft_index.root}"
+    
     def load_config():
         """加载当前的配置"""
         api_key = config_manager.get("gemini_api_key", "")
+        extra_keys = format_extra_keys()
         status = "已配置" if api_key else "未配置"
-        return api_key, status
+        return api_key, extra_keys, status
     
     
     
@@ -39,6 +66,24 @@ def create_config_tab():
                     value=saved_api_key
                 )
                 
+                gemini_extra_keys = gr.Textbox(
+                    label="额外的Gemini API密钥（可选，多个用逗号分隔）",
+                    type="password",
+                    placeholder="配置多个密钥时，每个作业选择剩余配额最多的密钥",
+                    value=format_extra_keys()
+                )
+                
+                analysis_mode = gr.Radio(
+                    label="文案解析与特点分析",
+                    choices=[("单次结构化调用（视频只预填充一次）", "combined"), ("两次独立调用", "separate")],
+                    value=pipeline.get_analysis_mode()
+                )
+                
+                drafts_dir = gr.Textbox(
+                    label="剪映草稿目录（回车保存，留空使用默认目录）",
+                    placeholder=draft_index.root,
+                    value=config_manager.get(DRAFTS_DIR_KEY, "")
+                )
                 
                 save_config_btn = gr.Button("保存配置", variant="primary")
                 load_config_btn = gr.Button("加载已有配置", variant="secondary")
@@ -56,12 +101,24 @@ def create_config_tab():
         # 绑定事件
         save_config_btn.click(
             fn=save_gemini_config,
-            inputs=[gemini_api_key],
+            inputs=[gemini_api_key, gemini_extra_keys],
+            outputs=[config_status]
+        )
+        
+        analysis_mode.change(
+            fn=save_analysis_mode,
+            inputs=[analysis_mode],
+            outputs=[config_status]
+        )
+        
+        drafts_dir.submit(
+            fn=save_drafts_dir,
+            inputs=[drafts_dir],
             outputs=[config_status]
         )
         
         load_config_btn.click(
             fn=load_config,
             inputs=[],
-            outputs=[gemini_api_key, config_status]
+            outputs=[gemini_api_key, gemini_extra_keys, config_status]
         )
\ No newline at end of file
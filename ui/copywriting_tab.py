@@ -1,22 +1,18 @@
 import gradio as gr
 import os
-import time
-import re
 from datetime import datetime
-from core import DouyinDownloader, config_manager
-from google.genai import types
+from core.jobs import FINISHED_STATUSES
+from core import pipeline
+from core.gemini_clients import gemini_clients
+from core.pipeline import DEFAULT_ACCOUNT_POSITIONING
 
-def create_copywriting_tab(downloader):
-    """创建AI文案生成标签页"""
+def create_copywriting_tab(service):
+    """创建AI文案生成标签页（生成工作交给 PipelineService 的后台作业队列，页面只订阅进度）"""
     
-    def format_start_time():
-        """格式化开始时间"""
-        return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    
-    def format_log_entry(elapsed_seconds, message):
-        """格式化日志条目"""
-        current_time = datetime.now().strftime("%H:%M:%S")
-        return f"[{current_time}] {message} (耗时: {elapsed_seconds:.1f}秒)"
+    def append_log(current_log, message):
+        """在处理日志末尾追加一条带时间的记录（阶段耗时由作业的运行轨迹给出，这里不再计时）"""
+        log_entry = f"[{datetime.now().strftime('%H:%M:%S')}] {message}"
+        return (current_log + "\n" + log_entry) if current_log else log_entry
     
     def get_video_path(video_input):
         """从video_input获取视频路径"""
@@ -30,312 +26,89 @@ def create_copywriting_tab(downloader):
                 video_path = video_input
         return video_path
     
-    def get_filename_from_video(video_path):
-        """根据视频文件名和日期生成markdown文件名
-        格式：视频文件名_YYYYMMDD.md
-        同一个视频多次保存会覆盖（文件名相同），不同视频保存新文件
-        """
-        if not video_path:
-            return None
-        
-        # 获取视频文件名（不含扩展名）
-        video_name = os.path.basename(video_path)
-        video_name_without_ext = os.path.splitext(video_name)[0]
-        
-        # 清理文件名，移除特殊字符，保留中英文、数字、下划线和连字符
-        clean_name = re.sub(r'[^\w\s\u4e00-\u9fff-]', '', video_name_without_ext)
-        clean_name = re.sub(r'\s+', '_', clean_name).strip('_')
-        
-        # 如果文件名太长，截取前50个字符
-        if len(clean_name) > 50:
-            clean_name = clean_name[:50]
-        
-        # 获取日期（年月日）
-        date_str = datetime.now().strftime("%Y%m%d")
-        
-        # 生成文件名：视频名_年月日.md
-        filename = f"{clean_name}_{date_str}.md"
-        
-        return filename
-    
     def save_copywriting(video_input, remake_script, current_log):
         """保存文案到markdown文件，返回更新后的日志"""
         if not remake_script or not remake_script.strip():
-            log_entry = format_log_entry(0, "❌ 保存失败：没有可保存的文案内容")
-            return (current_log + "\n" + log_entry) if current_log else log_entry
+            return append_log(current_log, "❌ 保存失败：没有可保存的文案内容")
         
         try:
             # 获取视频路径
             video_path = get_video_path(video_input)
             if not video_path or not os.path.exists(video_path):
-                log_entry = format_log_entry(0, "❌ 保存失败：无法确定视频路径，请重新上传视频")
-                return (current_log + "\n" + log_entry) if current_log else log_entry
+                return append_log(current_log, "❌ 保存失败：无法确定视频路径，请重新上传视频")
             
-            # 生成文件名
-            filename = get_filename_from_video(video_path)
-            if not filename:
-                log_entry = format_log_entry(0, "❌ 保存失败：无法生成文件名")
-                return (current_log + "\n" + log_entry) if current_log else log_entry
-            
-            # 确保data目录存在
-            base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-            data_dir = os.path.join(base_dir, "data")
-            if not os.path.exists(data_dir):
-                os.makedirs(data_dir)
-            
-            # 保存文件路径
-            filepath = os.path.join(data_dir, filename)
-            
-            # 写入markdown文件
-            with open(filepath, 'w', encoding='utf-8') as f:
-                f.write(remake_script)
-            
-            elapsed = 0  # 保存操作很快，不需要记录耗时
-            log_entry = format_log_entry(elapsed, f"✅ 文案已保存\n📁 文件名: {filename}\n💾 路径: {filepath}")
-            return (current_log + "\n" + log_entry) if current_log else log_entry
+            # 与批量生成共用命名规则（视频名_年月日.md）
+            filepath = pipeline.save_copywriting(video_path, remake_script)
+            filename = os.path.basename(filepath)
+            return append_log(current_log, f"✅ 文案已保存\n📁 文件名: {filename}\n💾 路径: {filepath}")
         
         except Exception as e:
-            elapsed = 0
-            log_entry = format_log_entry(elapsed, f"❌ 保存失败: {str(e)}")
-            return (current_log + "\n" + log_entry) if current_log else log_entry
+            return append_log(current_log, f"❌ 保存失败: {str(e)}")
     
-    def generate_copywriting(video_input, account_positioning):
-        """一次性生成三块内容：解析文案、分析特点、二创文案"""
-        start_time = time.time()
-        start_time_str = format_start_time()
-        status_log = []
-        status_log.append(f"🚀 开始执行 - {start_time_str}")
-        
-        # 获取视频路径
-        video_path = None
-        if video_input is not None:
-            if isinstance(video_input, str):
-                video_path = video_input
-            elif hasattr(video_input, 'name'):
-                video_path = video_input.name
+    def render_log(job, title):
+        """把作业快照渲染为处理日志"""
+        created_at = job['created_at']
+        status_log = [f"🚀 {title} - {datetime.fromtimestamp(created_at).strftime('%Y-%m-%d %H:%M:%S')}",
+                      f"🆔 作业ID: {job['id']}"]
+        if job['status'] == 'queued':
+            status_log.append("⏳ 排队中，等待空闲的处理线程...")
+        # 各阶段耗时已写在日志消息中（本阶段 x秒），结束时另有运行轨迹汇总（📈 阶段耗时）
+        for entry in job['log']:
+            current_time = datetime.fromtimestamp(entry['time']).strftime("%H:%M:%S")
+            status_log.append(f"[{current_time}] {entry['message']}")
+        if job['status'] in FINISHED_STATUSES:
+            end_time_str = datetime.fromtimestamp(job['updated_at']).strftime("%H:%M:%S")
+            if job['status'] == 'done':
+                cache_stats = service.downloader.response_cache.stats()
+                status_log.append(f"🏁 执行完成 - {end_time_str}")
+                status_log.append(f"📊 总耗时: {job['updated_at'] - created_at:.1f}秒")
+                status_log.append(f"⚡ 响应缓存命中 {cache_stats['hits']} 次，未命中 {cache_stats['misses']} 次")
+                queue_depth = sum(stats['queue_depth'] for stats in gemini_clients.stats().values())
+                status_log.append(f"🚦 限速队列当前排队 {queue_depth} 个请求")
             else:
-                video_path = video_input
-        
+                status_log.append(f"💥 异常终止 - {end_time_str}")
+                status_log.append(f"📊 总耗时: {job['updated_at'] - created_at:.1f}秒")
+        return "\n".join(status_log)
+    
+    def generate_copywriting(video_input, account_positioning):
+        """提交文案生成作业并订阅进度：解析文案、分析特点、二创文案（页面关闭不影响后台作业）"""
+        video_path = get_video_path(video_input)
         if not video_path or not os.path.exists(video_path):
             raise gr.Error("❌ 请先下载视频或上传视频文件")
         
-        # 读取API密钥
-        api_key = config_manager.get("gemini_api_key", "")
-        if not api_key:
-            raise gr.Error("❌ 请先在配置页面输入Gemini API密钥")
-        
         try:
-            # 初始化
-            elapsed = time.time() - start_time
-            status_log.append(format_log_entry(elapsed, "🔄 正在初始化Gemini客户端..."))
-            yield "", "", "", "\n".join(status_log), "", "", ""
-            
-            # 更新下载器的API密钥
-            if downloader.gemini_api_key != api_key:
-                downloader.gemini_api_key = api_key
-                downloader.gemini_client = None
-                if api_key:
-                    from google import genai
-                    downloader.gemini_client = genai.Client(api_key=api_key)
-            
-            # 上传视频
-            elapsed = time.time() - start_time
-            status_log.append(format_log_entry(elapsed, "📤 正在上传视频到Gemini..."))
-            yield "", "", "", "\n".join(status_log), "", "", ""
-            
-            upload_result = downloader.upload_video_to_gemini(video_path)
-            if not upload_result['success']:
-                elapsed_time = time.time() - start_time
-                status_log.append(format_log_entry(elapsed_time, f"❌ 上传失败: {upload_result['error']}"))
-                yield "", "", "", "\n".join(status_log), "", "", ""
-                return
-            
-            elapsed_time = time.time() - start_time
-            status_log.append(format_log_entry(elapsed_time, "✅ 视频上传成功"))
-            
-            # 一次性生成三块内容
-            elapsed = time.time() - start_time
-            status_log.append(format_log_entry(elapsed, "🧠 正在一次性生成所有内容..."))
-            yield "", "", "", "\n".join(status_log), "", "", ""
-            
-            # 第一步：解析上传视频的文案
-            prompt1 = """请仔细分析这个视频，提取并复述视频中的文案内容（如果有的话）。如果没有明确的文案，请描述视频中的对话、旁白或文字内容。
-
-要求：
-1. 只提取纯文本内容，不要包含任何时间戳、时间信息
-2. 按照视频中出现的顺序，完整呈现文案文本
-3. 如果有字幕或文字，直接提取字幕内容
-4. 如果是对话或旁白，用引号标注并说明是谁说的"""
-            # 获取模型名称（从配置读取，默认使用gemini-2.5-flash）
-            model_name = config_manager.get("gemini_model_name", "gemini-2.5-flash")
-            response1 = downloader.generate_content_with_retry(
-                model_name=model_name,
-                contents=[
-                    types.Part(file_data=types.FileData(file_uri=upload_result['file_uri'])),
-                    types.Part(text=prompt1)
-                ]
-            )
-            original_copywriting = response1.text
-            elapsed_time = time.time() - start_time
-            status_log.append(format_log_entry(elapsed_time, "✅ 视频文案解析完成"))
-            
-            # 在连续请求之间添加短暂延迟，避免触发速率限制
-            time.sleep(1)
-            
-            # 第二步：分析视频的特点、风格、结构等信息
-            prompt2 = """请详细分析这个视频的特点、风格和结构，包括但不限于：
-1. 视频的拍摄风格（如：第一人称、第三人称、特写、全景等）
-2. 视频的节奏和剪辑特点
-3. 视频的内容主题和情感表达
-4. 视频的语言风格（如：幽默、严肃、轻松、紧张等）
-5. 视频的视觉元素（如：场景、道具、服装等）
-6. 视频的目标受众和传播特点
-请给出详细的分析报告。"""
-            # 获取模型名称（从配置读取，默认使用gemini-2.5-flash）
-            model_name = config_manager.get("gemini_model_name", "gemini-2.5-flash")
-            response2 = downloader.generate_content_with_retry(
-                model_name=model_name,
-                contents=[
-                    types.Part(file_data=types.FileData(file_uri=upload_result['file_uri'])),
-                    types.Part(text=prompt2)
-                ]
-            )
-            video_analysis = response2.text
-            elapsed_time = time.time() - start_time
-            status_log.append(format_log_entry(elapsed_time, "✅ 视频分析完成"))
-            
-            # 在连续请求之间添加短暂延迟，避免触发速率限制
-            time.sleep(1)
-            
-            # 第三步：基于账号定位和视频，生成二创文案脚本
-            prompt3 = f"""基于以下信息，创作一个新的短视频脚本：
-
-【原视频分析】
-{original_copywriting}
-
-【视频特点分析】
-{video_analysis}
-
-【账号定位】
-{account_positioning}
-
-请结合你的账号定位，重新创作一个短视频脚本。要求：
-1. 保持原视频的核心创意或主题，但要用你的账号风格来呈现
-2. 脚本要符合你的账号定位和人物角色
-3. 脚本要适合短视频平台，时长控制在45秒以内
-4. 脚本要有清晰的开始、发展、高潮、结尾结构
-5. 语言要生动有趣，符合你的账号风格"""
-            
-            # 获取模型名称（从配置读取，默认使用gemini-2.5-flash）
-            model_name = config_manager.get("gemini_model_name", "gemini-2.5-flash")
-            response3 = downloader.generate_content_with_retry(
-                model_name=model_name,
-                contents=[
-                    types.Part(file_data=types.FileData(file_uri=upload_result['file_uri'])),
-                    types.Part(text=prompt3)
-                ]
-            )
-            remake_script = response3.text
-            elapsed_time = time.time() - start_time
-            status_log.append(format_log_entry(elapsed_time, "✅ 二创文案脚本生成完成"))
-            
-            # 完成
-            end_time_str = datetime.now().strftime("%H:%M:%S")
-            status_log.append(f"🏁 执行完成 - {end_time_str}")
-            status_log.append(f"📊 总耗时: {elapsed_time:.1f}秒")
-            
-            yield original_copywriting, video_analysis, remake_script, "\n".join(status_log), upload_result['file_uri'], original_copywriting, video_analysis
-            
-        except Exception as e:
-            elapsed_time = time.time() - start_time
-            status_log.append(format_log_entry(elapsed_time, f"❌ 处理失败: {str(e)}"))
-            end_time_str = datetime.now().strftime("%H:%M:%S")
-            status_log.append(f"💥 异常终止 - {end_time_str}")
-            status_log.append(f"📊 总耗时: {elapsed_time:.1f}秒")
-            yield "", "", "", "\n".join(status_log), "", "", ""
+            job_id = service.generate(video_path, account_positioning)
+        except ValueError as e:
+            raise gr.Error(f"❌ {e}")
+        for job in service.subscribe(job_id):
+            status_log = render_log(job, "开始执行")
+            if job['status'] == 'done':
+                yield job['transcript'], job['analysis'], job['script'], status_log, job['file_uri'], job['transcript'], job['analysis']
+            elif job['status'] == 'failed':
+                yield "", "", "", status_log, "", "", ""
+            else:
+                yield job['transcript'] or "", job['analysis'] or "", job['script'] or "", status_log, "", "", ""
     
     def regenerate_copywriting(account_positioning, file_uri, original_copywriting, video_analysis):
-        """只重新生成文案脚本（基于已上传的视频和前两块内容）"""
-        start_time = time.time()
-        start_time_str = format_start_time()
-        status_log = []
-        status_log.append(f"🚀 重新生成文案开始 - {start_time_str}")
-        
+        """只重新生成文案脚本（基于已上传的视频和前两块内容，作为新作业提交）"""
         if not file_uri:
             raise gr.Error("❌ 请先使用'开始生成'按钮生成一次内容")
         
         if not original_copywriting or not video_analysis:
             raise gr.Error("❌ 缺少必要的分析信息，请重新使用'开始生成'按钮")
         
-        # 读取API密钥
-        api_key = config_manager.get("gemini_api_key", "")
-        if not api_key:
-            raise gr.Error("❌ 请先在配置页面输入Gemini API密钥")
-        
+        # 重新生成需要新的结果，跳过响应缓存
         try:
-            # 初始化
-            elapsed = time.time() - start_time
-            status_log.append(format_log_entry(elapsed, "🔄 正在初始化Gemini客户端..."))
-            yield "", "\n".join(status_log)
-            
-            # 更新下载器的API密钥
-            if downloader.gemini_api_key != api_key:
-                downloader.gemini_api_key = api_key
-                downloader.gemini_client = None
-                if api_key:
-                    from google import genai
-                    downloader.gemini_client = genai.Client(api_key=api_key)
-            
-            # 重新生成：二创文案（使用已有的分析结果）
-            elapsed = time.time() - start_time
-            status_log.append(format_log_entry(elapsed, "✍️ 正在重新生成二创文案脚本..."))
-            yield "", "\n".join(status_log)
-            
-            prompt3 = f"""基于以下信息，创作一个新的短视频脚本：
-
-【原视频分析】
-{original_copywriting}
-
-【视频特点分析】
-{video_analysis}
-
-【账号定位】
-{account_positioning}
-
-请结合你的账号定位，重新创作一个短视频脚本。要求：
-1. 保持原视频的核心创意或主题，但要用你的账号风格来呈现
-2. 脚本要符合你的账号定位和人物角色
-3. 脚本要适合短视频平台，时长控制在45秒以内
-4. 脚本要有清晰的开始、发展、高潮、结尾结构
-5. 语言要生动有趣，符合你的账号风格"""
-            
-            # 获取模型名称（从配置读取，默认使用gemini-2.5-flash）
-            model_name = config_manager.get("gemini_model_name", "gemini-2.5-flash")
-            response3 = downloader.generate_content_with_retry(
-                model_name=model_name,
-                contents=[
-                    types.Part(file_data=types.FileData(file_uri=file_uri)),
-                    types.Part(text=prompt3)
-                ]
+            job_id = service.generate(
+                account_positioning=account_positioning,
+                file_uri=file_uri, transcript=original_copywriting, analysis=video_analysis,
+                force_regenerate=True
             )
-            remake_script = response3.text
-            elapsed_time = time.time() - start_time
-            status_log.append(format_log_entry(elapsed_time, "✅ 二创文案脚本重新生成完成"))
-            
-            # 完成
-            end_time_str = datetime.now().strftime("%H:%M:%S")
-            status_log.append(f"🏁 执行完成 - {end_time_str}")
-            status_log.append(f"📊 总耗时: {elapsed_time:.1f}秒")
-            
-            yield remake_script, "\n".join(status_log)
-            
-        except Exception as e:
-            elapsed_time = time.time() - start_time
-            status_log.append(format_log_entry(elapsed_time, f"❌ 处理失败: {str(e)}"))
-            end_time_str = datetime.now().strftime("%H:%M:%S")
-            status_log.append(f"💥 异常终止 - {end_time_str}")
-            status_log.append(f"📊 总耗时: {elapsed_time:.1f}秒")
-            yield "", "\n".join(status_log)
+        except ValueError as e:
+            raise gr.Error(f"❌ {e}")
+        for job in service.subscribe(job_id):
+            status_log = render_log(job, "重新生成文案开始")
+            yield ("" if job['status'] == 'failed' else job['script'] or ""), status_log
     
     # 创建AI文案生成标签页界面
     with gr.Tab("文案生成"):
@@ -353,17 +126,7 @@ def create_copywriting_tab(downloader):
                 # 2. 账号定位
                 account_positioning = gr.Textbox(
                     label="📝 账号定位",
-                    value=
-"""
-请分析短视频的结构和内容，结合我的账号定位，重新创作短视频脚本。以下是我的短视频账号定位：
-【人物角色】
-● 香贝贝：两岁的小戏精女宝，擅长观察和吐槽
-● 爸爸：幽默搞笑的懒爸爸（配角，根据情况出现）
-● 妈妈：不完美的成长型妈妈（配角，根据情况出现）
-【创作要求】
-1. 宝宝的第一视角，风格是："宝宝吐槽 + 育儿知识反差输出 + 家庭修罗场（三方视角冲突）"
-2. 文案时长控制在45s以内，开头吸睛（宝宝吐槽搞笑/讽刺）；中段带入家庭矛盾或共鸣点
-""",
+                    value=DEFAULT_ACCOUNT_POSITIONING,
                     lines=8,
                     placeholder="请输入您的账号定位...",
                     elem_classes="left-panel"
@@ -1,92 +1,96 @@
 import gradio as gr
 import json
-import os
-import glob
-from core import DouyinDownloader
+import time
+from core import config_manager
+from core.telemetry import format_stages
 
-def get_latest_video_path():
-    """获取downloads目录中最新的一视频文件路径"""
-    # downloads目录路径：项目根目录的downloads文件夹
-    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    downloads_dir = os.path.join(base_dir, "downloads")
-    if not os.path.exists(downloads_dir):
-        return None
-    
-    # 查找所有MP4文件
-    video_files = glob.glob(os.path.join(downloads_dir, "*.mp4"))
-    if not video_files:
-        return None
-    
-    # 按修改时间排序，取最新的
-    latest_file = max(video_files, key=os.path.getmtime)
-    return latest_file
+HISTORY_PAGE_SIZE = 20
+
+def get_latest_video_path(downloader):
+    """获取downloads目录中最新的一视频文件路径（读取内存索引，不扫描目录）"""
+    return downloader.downloads_index.latest_path()
+
+def history_rows(downloader, page):
+    """下载历史的一页（新的在前），返回表格行"""
+    rows = []
+    for entry in downloader.downloads_index.page(page, HISTORY_PAGE_SIZE):
+        rows.append([
+            time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(entry['mtime'])),
+            entry.get('title') or "",
+            entry.get('author') or "",
+            f"{entry['size'] / 1024 / 1024:.1f}",
+            entry['filename']
+        ])
+    return rows
+
+def merge_stages(items):
+    """合并多个条目的阶段耗时（来自各自的运行轨迹）"""
+    totals = {}
+    for item in items:
+        for name, seconds in item.get('stages', {}).items():
+            totals[name] = totals.get(name, 0.0) + seconds
+    return totals
 
-def create_download_tab(downloader):
-    """创建视频下载标签页"""
+def create_download_tab(service):
+    """创建视频下载标签页（解析下载由 PipelineService 完成）"""
     
     def sync_to_copywriting():
         """同步最新视频到AI文案创作tab"""
-        latest_video = get_latest_video_path()
+        latest_video = get_latest_video_path(service.downloader)
         if latest_video:
             return latest_video
         return None
     
-    def process_video_with_state(input_text, current_video_path):
-        """处理视频下载并更新状态"""
+    def process_video_with_state(input_text, current_video_path, retry_failed=False):
+        """处理视频下载并更新状态（retry_failed 时忽略解析缓存中的失败结果）"""
         if not input_text.strip():
             return None, "❌ 请输入抖音链接或包含链接的文本", current_video_path
         
         # 提取链接
-        douyin_url = downloader.extract_douyin_url(input_text)
+        douyin_url = service.downloader.extract_douyin_url(input_text)
         if not douyin_url:
             return None, "❌ 未找到有效的抖音链接，请检查输入格式", current_video_path
         
         # 控制台输出解析的抖音链接地址
         print(f"🔍 [解析] 从输入文本中提取的抖音链接: {douyin_url}")
         
-        # 解析视频
+        # 解析并下载（已下载过的链接直接复用本地文件，解析结果优先读取缓存）
         print(f"🚀 [开始] 开始解析视频信息...")
-        parse_result = downloader.parse_video(douyin_url)
-        if not parse_result['success']:
-            api_info = json.dumps(parse_result.get('raw_response', {}), ensure_ascii=False, indent=2)
-            return None, f"❌ 解析失败: {parse_result['error']}", current_video_path, api_info
+        item = next(service.download_urls([douyin_url.rstrip('/') + '/'], max_workers=1, retry_failed=retry_failed))
+        api_info = json.dumps(item.get('raw_response', {}), ensure_ascii=False, indent=2)
+        stages_line = f"⏱️ 阶段耗时: {format_stages(item.get('stages', {}))}（轨迹 {item.get('trace_id', '-')}）"
+        if not item['success']:
+            print(f"❌ [失败] {item['error']}")
+            print(stages_line)
+            return None, f"❌ {item['error']}\n\n{stages_line}", current_video_path, api_info
         
-        # 获取视频信息
-        title = parse_result['title']
-        author = parse_result['author']
-        video_url = parse_result['video_url']
+        title = item['title']
+        author = item['author']
         
         # 控制台输出视频信息
         print(f"📹 [视频] 标题: {title}")
         print(f"👤 [作者] {author}")
-        print(f"🔗 [下载] 视频链接: {video_url}")
-        
-        if not video_url:
-            api_info = json.dumps(parse_result.get('raw_response', {}), ensure_ascii=False, indent=2)
-            return None, "❌ 未获取到视频下载链接", current_video_path, api_info
-        
-        # 下载视频
-        print(f"⬇️  [下载] 开始下载视频到本地...")
-        download_result = downloader.download_video(video_url, title)
-        if not download_result['success']:
-            api_info = json.dumps(parse_result.get('raw_response', {}), ensure_ascii=False, indent=2)
-            return None, f"❌ 下载失败: {download_result['error']}", current_video_path, api_info
         
         # 更新状态
-        new_video_path = download_result['filepath']
+        new_video_path = item['filepath']
         
         # 返回成功信息
-        success_msg = f"✅ 下载成功！\n\n📹 标题: {title}\n👤 作者: {author}\n📁 文件: {download_result['filename']}\n💾 路径: {download_result['filepath']}"
+        if item.get('cached'):
+            print("♻️  [复用] 视频已存在，未重复下载")
+        success_title = "♻️ 视频已存在，直接复用本地文件" if item.get('cached') else "✅ 下载成功！"
+        success_msg = (f"{success_title}\n\n📹 标题: {title}\n👤 作者: {author}\n📁 文件: {item['filename']}\n"
+                       f"💾 路径: {item['filepath']}\n{stages_line}")
         
-        # 控制台输出下载完成信息
-        print(f"✅ [完成] 视频下载成功!")
-        print(f"📁 [文件] {download_result['filename']}")
-        print(f"💾 [路径] {download_result['filepath']}")
+        # 控制台输出下载完成信息（耗时取自本次运行的轨迹）
+        print(stages_line)
+        print(f"📁 [文件] {item['filename']}")
+        print(f"💾 [路径] {item['filepath']}")
+        conn_stats = service.downloader.connection_stats()
+        cache_stats = service.downloader.parse_cache.stats()
+        print(f"🔁 [连接] 累计请求 {conn_stats['requests']} 次，复用连接 {conn_stats['reused_connections']} 次")
+        print(f"⚡ [缓存] 解析缓存命中 {cache_stats['hits']} 次，未命中 {cache_stats['misses']} 次")
         print(f"{'='*60}")
         
-        # 格式化API返回信息
-        api_info = json.dumps(parse_result.get('raw_response', {}), ensure_ascii=False, indent=2)
-        
         return new_video_path, success_msg, new_video_path, api_info
     
     # 创建视频下载标签页界面
@@ -95,13 +99,18 @@ def create_download_tab(downloader):
             with gr.Column(scale=1):
                 input_text = gr.Textbox(
                     label="请输入链接地址",
-                    placeholder="请输入抖音链接或包含链接的文本...",
+                    placeholder="请输入抖音链接或包含链接的文本（包含多个链接时自动批量下载）...",
                     lines=12
                 )
                 
                 with gr.Row():
                     process_btn = gr.Button("开始解析", variant="primary", size="lg")
                     reference_btn = gr.Button("参考创作", variant="secondary", size="lg", interactive=False)
+                
+                retry_failed = gr.Checkbox(
+                    label="重新解析之前失败的链接（忽略解析失败缓存）",
+                    value=False
+                )
             
             with gr.Column(scale=1):
                 video_preview = gr.Video(
@@ -127,22 +136,96 @@ def create_download_tab(downloader):
                 elem_classes="api-response"
             )
         
-        def process_video_with_button_state(input_text, current_video_path):
-            """处理视频下载并更新按钮状态"""
-            result = process_video_with_state(input_text, current_video_path)
+        def process_video_with_button_state(input_text, current_video_path, retry_failed):
+            """处理视频下载并更新按钮状态（多个链接时自动进入批量模式）"""
+            urls = service.downloader.extract_douyin_urls(input_text or "")
+            if len(urls) > 1:
+                yield from process_batch_with_button_state(urls, current_video_path, retry_failed)
+                return
+            
+            result = process_video_with_state(input_text, current_video_path, retry_failed)
             if len(result) == 4:
                 video_path, msg, new_path, api_info = result
                 # 如果下载成功，启用参考创作按钮
                 button_enabled = video_path is not None
-                return video_path, msg, new_path, api_info, gr.update(interactive=button_enabled)
+                yield video_path, msg, new_path, api_info, gr.update(interactive=button_enabled)
             else:
-                return result[0], result[1], result[2], result[3], gr.update(interactive=False)
+                yield result[0], result[1], result[2], "", gr.update(interactive=False)
+        
+        def process_batch_with_button_state(urls, current_video_path, retry_failed=False):
+            """批量模式：并发解析下载所有链接，逐条刷新状态并汇总吞吐"""
+            total = len(urls)
+            max_workers = int(config_manager.get("batch_max_workers", 4))
+            print(f"📦 [批量] 共提取 {total} 个链接，并发数 {max_workers}")
+            
+            start_time = time.time()
+            item_lines = [f"⏳ [{i + 1}/{total}] 等待处理: {url}" for i, url in enumerate(urls)]
+            api_items = [None] * total
+            latest_path = None
+            finished_items = []
+            success_count = 0
+            cached_count = 0
+            total_bytes = 0
+            
+            def render_status(done):
+                header = f"📦 批量处理中：{done}/{total}（成功 {success_count}，失败 {done - success_count}）"
+                return header + "\n\n" + "\n".join(item_lines)
+            
+            yield None, render_status(0), current_video_path, "", gr.update(interactive=False)
+            
+            done = 0
+            for item in service.download_urls(urls, max_workers=max_workers, retry_failed=retry_failed):
+                done += 1
+                finished_items.append(item)
+                index = item['index']
+                if item['success']:
+                    success_count += 1
+                    latest_path = item['filepath']
+                    if item.get('cached'):
+                        cached_count += 1
+                        item_lines[index] = f"♻️ [{index + 1}/{total}] {item['title']} (已存在，{item['elapsed']:.2f}秒) → {item['filename']}"
+                        print(f"♻️  [批量] {index + 1}/{total} 已存在: {item['filename']}")
+                    else:
+                        total_bytes += item.get('filesize', 0)
+                        item_lines[index] = f"✅ [{index + 1}/{total}] {item['title']} ({item['elapsed']:.1f}秒) → {item['filename']}"
+                        print(f"✅ [批量] {index + 1}/{total} 下载成功: {item['filename']}")
+                else:
+                    item_lines[index] = f"❌ [{index + 1}/{total}] {item['url']} ({item['elapsed']:.1f}秒) {item['error']}"
+                    print(f"❌ [批量] {index + 1}/{total} 处理失败: {item['error']}")
+                api_items[index] = {
+                    'url': item['url'],
+                    'success': item['success'],
+                    'filename': item.get('filename'),
+                    'error': item.get('error'),
+                    'raw_response': item.get('raw_response', {})
+                }
+                yield latest_path, render_status(done), latest_path or current_video_path, "", gr.update(interactive=latest_path is not None)
+            
+            # 汇总吞吐信息
+            elapsed = max(time.time() - start_time, 1e-6)
+            conn_stats = service.downloader.connection_stats()
+            cache_stats = service.downloader.parse_cache.stats()
+            summary = (
+                f"🏁 批量完成：共 {total} 个，成功 {success_count}（其中复用 {cached_count}），失败 {total - success_count}\n"
+                f"⏱️ 总耗时 {elapsed:.1f}秒，吞吐 {total / elapsed * 60:.1f} 个/分钟，"
+                f"{total_bytes / 1024 / 1024 / elapsed:.2f} MB/秒\n"
+                f"🔁 连接复用 {conn_stats['reused_connections']}/{conn_stats['requests']} 次请求"
+                f"（新建连接 {conn_stats['new_connections']}）\n"
+                f"⚡ 解析缓存命中 {cache_stats['hits']} 次，未命中 {cache_stats['misses']} 次\n"
+                f"📈 阶段耗时合计: {format_stages(merge_stages(finished_items))}"
+            )
+            print(f"🏁 [批量] {summary}")
+            print(f"{'='*60}")
+            status = summary + "\n\n" + "\n".join(item_lines)
+            api_info = json.dumps(api_items, ensure_ascii=False, indent=2)
+            new_path = latest_path or current_video_path
+            yield latest_path, status, new_path, api_info, gr.update(interactive=latest_path is not None)
         
         # 绑定事件
         download_outputs = [video_preview, status_info, gr.State(), api_response, reference_btn]
         process_btn.click(
             fn=process_video_with_button_state,
-            inputs=[input_text, gr.State()],
+            inputs=[input_text, gr.State(), retry_failed],
             outputs=download_outputs
         )
         
@@ -155,6 +238,35 @@ def create_download_tab(downloader):
             outputs=[global_copywriting_video_path]
         )
         
+        # 下载历史（分页读取内存索引）
+        with gr.Accordion("📚 下载历史", open=False):
+            history_table = gr.Dataframe(
+                headers=["下载时间", "标题", "作者", "大小(MB)", "文件名"],
+                datatype=["str", "str", "str", "str", "str"],
+                interactive=False,
+                wrap=True
+            )
+            with gr.Row():
+                history_prev_btn = gr.Button("⬅️ 上一页", size="sm")
+                history_page = gr.Number(value=1, label="页码", precision=0, minimum=1)
+                history_next_btn = gr.Button("下一页 ➡️", size="sm")
+                history_refresh_btn = gr.Button("🔄 刷新", size="sm")
+            history_status = gr.Markdown()
+        
+        def show_history(page):
+            """显示指定页的下载历史"""
+            page = max(1, int(page or 1))
+            total = len(service.downloader.downloads_index)
+            total_pages = max(1, (total + HISTORY_PAGE_SIZE - 1) // HISTORY_PAGE_SIZE)
+            page = min(page, total_pages)
+            return history_rows(service.downloader, page), page, f"共 {total} 个视频，第 {page}/{total_pages} 页"
+        
+        history_outputs = [history_table, history_page, history_status]
+        history_refresh_btn.click(fn=show_history, inputs=[history_page], outputs=history_outputs)
+        history_page.submit(fn=show_history, inputs=[history_page], outputs=history_outputs)
+        history_prev_btn.click(fn=lambda page: show_history((page or 1) - 1), inputs=[history_page], outputs=history_outputs)
+        history_next_btn.click(fn=lambda page: show_history((page or 1) + 1), inputs=[history_page], outputs=history_outputs)
+        
         with gr.Column():      
             # 示例
             gr.Markdown("### 💡 示例输入")
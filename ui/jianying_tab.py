@@ -1,41 +1,26 @@
 import gradio as gr  # type: ignore
 import os
 import subprocess
+import sys
 from datetime import datetime
 
-# 剪映项目目录
-JIANYING_PROJECTS_DIR = "/Users/rainbow/Movies/JianyingPro/User Data/Projects/com.lveditor.draft/"
+from core.jianying_drafts import draft_index
+from core.jianying_materials import get_material_index
+
+MATERIAL_KINDS = {'videos': '视频', 'audios': '音频', 'texts': '文字', 'stickers': '贴纸', 'effects': '特效'}
 
 def get_project_folders():
-    """获取剪映项目文件夹列表，按创建时间倒序排列"""
-    if not os.path.exists(JIANYING_PROJECTS_DIR):
-        return []
-    
-    folders = []
-    try:
-        for item in os.listdir(JIANYING_PROJECTS_DIR):
-            # 过滤掉以.开头的隐藏文件夹
-            if item.startswith('.'):
-                continue
-            
-            item_path = os.path.join(JIANYING_PROJECTS_DIR, item)
-            if os.path.isdir(item_path):
-                # 获取创建时间
-                stat = os.stat(item_path)
-                # macOS 使用 st_birthtime 作为创建时间
-                create_time = stat.st_birthtime
-                folders.append({
-                    'name': item,
-                    'path': item_path,
-                    'create_time': create_time
-                })
-        
-        # 按创建时间倒序排列（最新的在前）
-        folders.sort(key=lambda x: x['create_time'], reverse=True)
-        return folders
-    except Exception as e:
-        print(f"读取文件夹列表失败: {e}")
-        return []
+    """获取剪映项目文件夹列表，按创建时间倒序排列（草稿目录没有变化时直接读缓存）"""
+    return draft_index.folders()
+
+def open_path(path):
+    """用系统文件管理器打开目录"""
+    if sys.platform == "win32":
+        os.startfile(path)
+    elif sys.platform == "darwin":
+        subprocess.run(['open', path], check=True)
+    else:
+        subprocess.run(['xdg-open', path], check=True)
 
 def format_folder_summary(folders):
     """生成文件夹数量和最新项目的概览文本"""
@@ -72,7 +57,7 @@ def open_folder_in_finder(folder_choice):
     if not folder_name:
         return "❌ 请选择一个项目文件夹"
     
-    folder_path = os.path.join(JIANYING_PROJECTS_DIR, folder_name)
+    folder_path = os.path.join(draft_index.root, folder_name)
     combination_path = os.path.join(folder_path, "Resources", "combination")
     
     if not os.path.exists(folder_path):
@@ -81,7 +66,7 @@ def open_folder_in_finder(folder_choice):
     try:
         # 优先打开 Resources/combination 目录，如果不存在则打开项目文件夹
         target_path = combination_path if os.path.exists(combination_path) else folder_path
-        subprocess.run(['open', target_path], check=True)
+        open_path(target_path)
         
         if os.path.exists(combination_path):
             return f"✅ 已用访达打开 Resources/combination 目录\n\n📁 {combination_path}"
@@ -92,29 +77,53 @@ def open_folder_in_finder(folder_choice):
     except Exception as e:
         return f"❌ 发生错误: {str(e)}"
 
+def search_materials(query):
+    """在素材索引中搜索素材名、路径或文字内容（只查询本地索引，不读取草稿文件）"""
+    material_index = get_material_index()
+    summary = material_index.summary()
+    status = f"已索引 {summary['drafts']} 个草稿、{summary['materials']} 条素材"
+    if summary['failed']:
+        status += f"（{summary['failed']} 个草稿无法解析）"
+    if not query or not query.strip():
+        return [], status
+    rows = []
+    for item in material_index.search(query):
+        duration = f"{item['duration']:.1f}" if item['duration'] is not None else ""
+        rows.append([
+            item['draft'],
+            MATERIAL_KINDS.get(item['kind'], item['kind']),
+            item['text'] or item['name'],
+            duration,
+            item['path']
+        ])
+    return rows, f"{status}，匹配 {len(rows)} 条"
+
 def refresh_folders():
-    """刷新文件夹列表"""
+    """刷新文件夹列表，并在后台更新有变化草稿的素材索引"""
     folders = get_project_folders()
-    summary_text = format_folder_summary(folders)
+    get_material_index().update_async()
     choices, default_value = format_folder_choices(folders)
     
-    return summary_text, gr.update(choices=choices, value=default_value)
+    return gr.update(choices=choices, value=default_value, label=f"📁 草稿列表（共 {len(folders)} 个）")
 
 def create_jianying_tab():
-    """创建剪映项目标签页"""
+    """
+    创建剪映项目标签页
+    
+    构建界面时不扫描草稿目录（后台预热缓存），列表在页面加载时填充。
+    返回 (草稿列表组件, 刷新函数)，由调用方绑定到 interface.load。
+    """
     
-    # 初始加载文件夹列表
-    initial_folders = get_project_folders()
-    initial_choices, initial_value = format_folder_choices(initial_folders)
+    draft_index.refresh_async()
     
     with gr.Tab("剪映项目"):
         
         with gr.Row():
             with gr.Column(scale=2):
                 folder_selector = gr.Radio(
-                    label=f"📁 草稿列表（共 {len(initial_folders)} 个）",
-                    choices=initial_choices,
-                    value=initial_value,
+                    label="📁 草稿列表",
+                    choices=[],
+                    value=None,
                     interactive=True,
                     info=" "
                 )
@@ -131,6 +140,20 @@ def create_jianying_tab():
                     value="💡 选择一个项目文件夹，然后点击按钮打开"
                 )
         
+        # 素材搜索（查询后台维护的素材索引）
+        with gr.Accordion("🔍 搜索草稿素材", open=False):
+            material_query = gr.Textbox(
+                label="关键词",
+                placeholder="素材文件名、路径或字幕文字..."
+            )
+            material_status = gr.Markdown()
+            material_results = gr.Dataframe(
+                headers=["草稿", "类型", "名称 / 文字", "时长(秒)", "路径"],
+                datatype=["str", "str", "str", "str", "str"],
+                interactive=False,
+                wrap=True
+            )
+        
         # 绑定事件
         refresh_btn.click(
             fn=refresh_folders,
@@ -138,9 +161,16 @@ def create_jianying_tab():
             outputs=[folder_selector]
         )
         
+        material_query.change(
+            fn=search_materials,
+            inputs=[material_query],
+            outputs=[material_results, material_status]
+        )
+        
         open_btn.click(
             fn=open_folder_in_finder,
             inputs=[folder_selector],
             outputs=[status_info]
         )
-
+    
+    return folder_selector, refresh_folders